@@ -45,6 +45,201 @@ COMMENT ON FUNCTION decrypt_cost IS '解密成本数据-需要正确的密钥才
 -- 第二部分: 单位换算函数
 -- ============================================================================
 
+-- 单位换算传递闭包表
+-- 由 unit_conversion 的换算规则沿方向组合得到全部可达单位对 (如 箱→包→g 得到 箱→g)
+-- product_id 为NULL的行只用通用规则; 有特定规则的产品另存一套, 同一单位对特定规则优先于通用规则
+-- 多条路径时取步数最少的路径, 直接规则始终优先
+CREATE TABLE IF NOT EXISTS unit_conversion_closure (
+    from_unit_id INT NOT NULL,
+    to_unit_id INT NOT NULL,
+    product_id INT,                               -- NULL=通用, NOT NULL=特定产品
+    conversion_factor DECIMAL NOT NULL,           -- 组合后的换算系数 (1 from = factor to)
+    hops INT NOT NULL,                            -- 组合的规则数, 1=直接规则
+    unit_path INT[] NOT NULL                      -- 经过的单位
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uk_unit_conversion_closure
+    ON unit_conversion_closure(from_unit_id, to_unit_id, COALESCE(product_id, 0));
+
+COMMENT ON TABLE unit_conversion_closure IS '单位换算传递闭包-每个可达单位对一行, 换算一次索引查询';
+
+-- 重建单位换算传递闭包
+-- p_product_ids 为NULL时重建全部 (通用规则变化会影响所有产品); 否则只重建这些产品的特定规则闭包
+-- 按步数逐层扩展, 每层只保留尚未出现的 (产品, from, to) 单位对, 规模与可达单位对数成正比
+DROP FUNCTION IF EXISTS refresh_unit_conversion_closure();
+
+CREATE OR REPLACE FUNCTION refresh_unit_conversion_closure(
+    p_product_ids INT[] DEFAULT NULL
+)
+RETURNS INT AS $$
+DECLARE
+    v_count INT;
+    v_added INT;
+    v_hops INT := 1;
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS tmp_unit_conversion_edge (
+        product_id INT,
+        from_unit_id INT NOT NULL,
+        to_unit_id INT NOT NULL,
+        conversion_factor DECIMAL NOT NULL
+    ) ON COMMIT DROP;
+
+    TRUNCATE tmp_unit_conversion_edge;
+
+    IF p_product_ids IS NULL THEN
+        DELETE FROM unit_conversion_closure;
+    ELSE
+        DELETE FROM unit_conversion_closure WHERE product_id = ANY(p_product_ids);
+    END IF;
+
+    -- 各套规则的边: 产品特定规则 + 未被特定规则覆盖的通用规则
+    -- 通用规则一套, 每个有特定规则的产品一套; 特定规则已全部删除的产品不再有闭包
+    INSERT INTO tmp_unit_conversion_edge (product_id, from_unit_id, to_unit_id, conversion_factor)
+    WITH scope AS (
+        SELECT NULL::INT AS product_id
+        WHERE p_product_ids IS NULL
+        UNION
+        SELECT DISTINCT product_id
+        FROM unit_conversion
+        WHERE product_id IS NOT NULL
+          AND (p_product_ids IS NULL OR product_id = ANY(p_product_ids))
+    )
+    SELECT s.product_id, uc.from_unit_id, uc.to_unit_id, uc.conversion_factor
+    FROM scope s
+    JOIN unit_conversion uc
+      ON uc.product_id = s.product_id
+      OR (uc.product_id IS NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM unit_conversion sp
+              WHERE sp.product_id = s.product_id
+                AND sp.from_unit_id = uc.from_unit_id
+                AND sp.to_unit_id = uc.to_unit_id
+          ))
+    WHERE uc.conversion_factor > 0
+      AND uc.from_unit_id <> uc.to_unit_id;
+
+    -- 第1步: 直接规则
+    INSERT INTO unit_conversion_closure (
+        from_unit_id, to_unit_id, product_id, conversion_factor, hops, unit_path
+    )
+    SELECT from_unit_id, to_unit_id, product_id, conversion_factor, 1,
+           ARRAY[from_unit_id, to_unit_id]
+    FROM tmp_unit_conversion_edge;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    -- 第N步: 用上一步新增的单位对再接一条边, 只收新单位对
+    -- 最短路径的前缀也是最短路径, 逐层取 unit_path 最小者即全局的 (hops, unit_path) 最小路径
+    LOOP
+        INSERT INTO unit_conversion_closure (
+            from_unit_id, to_unit_id, product_id, conversion_factor, hops, unit_path
+        )
+        SELECT DISTINCT ON (c.product_id, c.from_unit_id, e.to_unit_id)
+            c.from_unit_id,
+            e.to_unit_id,
+            c.product_id,
+            c.conversion_factor * e.conversion_factor,
+            c.hops + 1,
+            c.unit_path || e.to_unit_id
+        FROM unit_conversion_closure c
+        JOIN tmp_unit_conversion_edge e
+          ON e.from_unit_id = c.to_unit_id
+         AND e.product_id IS NOT DISTINCT FROM c.product_id
+        WHERE c.hops = v_hops
+          AND e.to_unit_id <> c.from_unit_id
+          AND NOT EXISTS (
+              SELECT 1 FROM unit_conversion_closure x
+              WHERE x.from_unit_id = c.from_unit_id
+                AND x.to_unit_id = e.to_unit_id
+                AND COALESCE(x.product_id, 0) = COALESCE(c.product_id, 0)
+          )
+        ORDER BY c.product_id, c.from_unit_id, e.to_unit_id, c.unit_path || e.to_unit_id;
+
+        GET DIAGNOSTICS v_added = ROW_COUNT;
+        EXIT WHEN v_added = 0;
+
+        v_count := v_count + v_added;
+        v_hops := v_hops + 1;
+    END LOOP;
+
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION refresh_unit_conversion_closure IS '重建单位换算传递闭包-换算规则变化时由触发器按受影响产品调用';
+
+-- 换算规则变化时重建闭包: 通用规则变化重建全部, 只涉及产品特定规则时只重建这些产品
+CREATE OR REPLACE FUNCTION sync_unit_conversion_closure()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_generic BOOLEAN;
+    v_product_ids INT[];
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM refresh_unit_conversion_closure();
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'INSERT' THEN
+        SELECT bool_or(product_id IS NULL),
+               array_agg(DISTINCT product_id) FILTER (WHERE product_id IS NOT NULL)
+        INTO v_generic, v_product_ids
+        FROM new_rules;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT bool_or(product_id IS NULL),
+               array_agg(DISTINCT product_id) FILTER (WHERE product_id IS NOT NULL)
+        INTO v_generic, v_product_ids
+        FROM old_rules;
+    ELSE
+        -- UPDATE 可能改动 product_id, 新旧两侧都算
+        SELECT bool_or(product_id IS NULL),
+               array_agg(DISTINCT product_id) FILTER (WHERE product_id IS NOT NULL)
+        INTO v_generic, v_product_ids
+        FROM (
+            SELECT product_id FROM new_rules
+            UNION ALL
+            SELECT product_id FROM old_rules
+        ) r;
+    END IF;
+
+    IF v_generic THEN
+        PERFORM refresh_unit_conversion_closure();
+    ELSIF v_product_ids IS NOT NULL THEN
+        PERFORM refresh_unit_conversion_closure(v_product_ids);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 转换表只能按单一事件定义, 每种事件一个触发器; TRUNCATE 没有转换表, 直接全量重建
+DROP TRIGGER IF EXISTS trg_unit_conversion_closure ON unit_conversion;
+DROP TRIGGER IF EXISTS trg_unit_conversion_closure_insert ON unit_conversion;
+DROP TRIGGER IF EXISTS trg_unit_conversion_closure_update ON unit_conversion;
+DROP TRIGGER IF EXISTS trg_unit_conversion_closure_delete ON unit_conversion;
+DROP TRIGGER IF EXISTS trg_unit_conversion_closure_truncate ON unit_conversion;
+
+CREATE TRIGGER trg_unit_conversion_closure_insert
+AFTER INSERT ON unit_conversion
+REFERENCING NEW TABLE AS new_rules
+FOR EACH STATEMENT EXECUTE FUNCTION sync_unit_conversion_closure();
+
+CREATE TRIGGER trg_unit_conversion_closure_update
+AFTER UPDATE ON unit_conversion
+REFERENCING OLD TABLE AS old_rules NEW TABLE AS new_rules
+FOR EACH STATEMENT EXECUTE FUNCTION sync_unit_conversion_closure();
+
+CREATE TRIGGER trg_unit_conversion_closure_delete
+AFTER DELETE ON unit_conversion
+REFERENCING OLD TABLE AS old_rules
+FOR EACH STATEMENT EXECUTE FUNCTION sync_unit_conversion_closure();
+
+CREATE TRIGGER trg_unit_conversion_closure_truncate
+AFTER TRUNCATE ON unit_conversion
+FOR EACH STATEMENT EXECUTE FUNCTION sync_unit_conversion_closure();
+
+SELECT refresh_unit_conversion_closure();
+
 -- 单位换算函数
 CREATE OR REPLACE FUNCTION convert_unit(
     p_quantity DECIMAL,
@@ -54,20 +249,20 @@ CREATE OR REPLACE FUNCTION convert_unit(
 )
 RETURNS DECIMAL AS $$
 DECLARE
-    v_factor DECIMAL(10,4);
+    v_factor DECIMAL;
 BEGIN
     -- 相同单位直接返回
     IF p_from_unit_id = p_to_unit_id THEN
         RETURN p_quantity;
     END IF;
 
-    -- 查找换算系数 (优先产品特定,再找通用)
+    -- 查找换算系数 (优先产品特定,再找通用; 支持多级换算)
     SELECT conversion_factor INTO v_factor
-    FROM unit_conversion
+    FROM unit_conversion_closure
     WHERE from_unit_id = p_from_unit_id
       AND to_unit_id = p_to_unit_id
       AND (product_id = p_product_id OR product_id IS NULL)
-    ORDER BY product_id DESC NULLS LAST
+    ORDER BY product_id NULLS LAST
     LIMIT 1;
 
     IF v_factor IS NULL THEN
@@ -1,12 +1,284 @@
 -- ============================================================================
 -- 野百灵餐饮集团 - BOM递归分解函数
 -- ============================================================================
--- 版本: v1.0.0-mvp
+-- 版本: v1.1.0-mvp
 -- 核心功能: 完全分解产品配方到原材料(支持11个核心半成品)
+-- v1.1.0: 新增 bom_flat 扁平BOM表, 由 recipe / recipe_item / product 触发器增量维护,
+--         explode_bom 改为按产品索引读取扁平表, 不再逐次递归
 -- ============================================================================
 
 -- ----------------------------------------------------------------------------
--- 1. explode_bom - BOM完全分解函数 ★核心函数
+-- 1. bom_flat - 扁平BOM表 (产品 → 各层配料, 每1份产品的用量)
+-- ----------------------------------------------------------------------------
+-- 说明: 每行对应 explode_bom 递归中的一行 (一条配方路径上的一个配方明细),
+--       包括半成品中间行, 最多10层
+--       数量为1份根产品的用量; 成本不落地(仍加密存于recipe_item), 查询时按倍数换算:
+--         total_quantity = quantity_per_unit × 产品数量
+--         total_cost     = decrypt_cost(recipe_item.subtotal_cost_encrypted) × quantity_multiplier × 产品数量
+--       因此原材料调价只改recipe_item成本, 不需要重算本表
+-- ----------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS bom_flat (
+    bom_flat_id BIGSERIAL PRIMARY KEY,
+    root_product_id INT NOT NULL,                 -- 被分解的产品
+    brand_id INT,                                 -- 路径上各层配方的共同品牌, 品牌不一致时为NULL
+    level INT NOT NULL,                           -- 路径深度(1=产品的直接配料)
+    recipe_item_id INT NOT NULL,
+    ingredient_id INT NOT NULL,
+    ingredient_type VARCHAR(20),                  -- 展开时配料的product_type
+    quantity_multiplier DECIMAL,                  -- 明细成本倍数: 第1层为1, 第N层为上层用量/出品量
+    quantity_per_unit DECIMAL,                    -- 1份根产品的配料用量 = net_quantity × quantity_multiplier
+    recipe_path INT[] NOT NULL,                   -- 经过的配方ID路径
+    refreshed_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_bom_flat_root ON bom_flat(root_product_id, level);
+CREATE INDEX IF NOT EXISTS idx_bom_flat_ingredient ON bom_flat(ingredient_id);
+
+COMMENT ON TABLE bom_flat IS '扁平BOM表 - explode_bom的预计算结果, 由触发器增量维护';
+
+-- ----------------------------------------------------------------------------
+-- 2. refresh_bom_flat - 重算指定产品的扁平BOM
+-- ----------------------------------------------------------------------------
+-- p_product_ids 为NULL时全量重建; 返回写入行数
+-- 递归规则与 explode_bom_recursive 一致: 只分解半成品, 最多10层
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION refresh_bom_flat(p_product_ids INT[] DEFAULT NULL)
+RETURNS INT AS $$
+DECLARE
+    v_rows INT;
+BEGIN
+    IF p_product_ids IS NULL THEN
+        DELETE FROM bom_flat;
+    ELSE
+        DELETE FROM bom_flat WHERE root_product_id = ANY(p_product_ids);
+    END IF;
+
+    INSERT INTO bom_flat (
+        root_product_id, brand_id, level, recipe_item_id, ingredient_id,
+        ingredient_type, quantity_multiplier, quantity_per_unit, recipe_path
+    )
+    WITH RECURSIVE flat AS (
+        -- Level 1: 产品的直接原材料/半成品
+        SELECT
+            r.product_id AS root_product_id,
+            r.brand_id,
+            1 AS level,
+            ri.recipe_item_id,
+            ri.ingredient_id,
+            p.product_type::VARCHAR AS ingredient_type,
+            1.0::DECIMAL AS quantity_multiplier,
+            ri.net_quantity::DECIMAL AS quantity_per_unit,
+            ARRAY[r.recipe_id] AS recipe_path
+        FROM recipe r
+        JOIN recipe_item ri ON r.recipe_id = ri.recipe_id
+        JOIN product p ON ri.ingredient_id = p.product_id
+        JOIN unit_of_measure u ON ri.unit_id = u.unit_id
+        WHERE r.is_current = TRUE
+          AND r.status = 'approved'
+          AND (p_product_ids IS NULL OR r.product_id = ANY(p_product_ids))
+
+        UNION ALL
+
+        -- Level N: 递归分解半成品
+        SELECT
+            f.root_product_id,
+            CASE WHEN f.brand_id = r.brand_id THEN f.brand_id END,
+            f.level + 1,
+            ri.recipe_item_id,
+            ri.ingredient_id,
+            p.product_type::VARCHAR,
+            (f.quantity_per_unit / NULLIF(r.yield_quantity, 0))::DECIMAL,
+            (ri.net_quantity * f.quantity_per_unit / NULLIF(r.yield_quantity, 0))::DECIMAL,
+            f.recipe_path || r.recipe_id
+        FROM flat f
+        JOIN recipe r ON r.product_id = f.ingredient_id AND r.is_current = TRUE AND r.status = 'approved'
+        JOIN recipe_item ri ON r.recipe_id = ri.recipe_id
+        JOIN product p ON ri.ingredient_id = p.product_id
+        JOIN unit_of_measure u ON ri.unit_id = u.unit_id
+        WHERE f.ingredient_type = 'semi_finished'
+          AND f.level < 10
+    )
+    SELECT
+        root_product_id, brand_id, level, recipe_item_id, ingredient_id,
+        ingredient_type, quantity_multiplier, quantity_per_unit, recipe_path
+    FROM flat;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION refresh_bom_flat(INT[]) IS '重算指定产品的扁平BOM, NULL=全量重建';
+
+-- ----------------------------------------------------------------------------
+-- 3. refresh_bom_flat_affected - 重算受影响产品及其全部上级产品
+-- ----------------------------------------------------------------------------
+-- 某产品的配方结构变化时, 所有(直接或经半成品)用到它的产品都需要重算;
+-- bom_flat 含各层中间行, 一次索引查找即可得到全部上级产品
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION refresh_bom_flat_affected(p_product_ids INT[])
+RETURNS INT AS $$
+DECLARE
+    v_roots INT[];
+BEGIN
+    SELECT array_agg(DISTINCT product_id) INTO v_roots
+    FROM (
+        SELECT unnest(p_product_ids) AS product_id
+        UNION
+        SELECT root_product_id FROM bom_flat WHERE ingredient_id = ANY(p_product_ids)
+    ) affected;
+
+    IF v_roots IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    RETURN refresh_bom_flat(v_roots);
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION refresh_bom_flat_affected(INT[]) IS '重算指定产品及所有上级产品的扁平BOM';
+
+-- ----------------------------------------------------------------------------
+-- 4. 扁平BOM维护触发器 (语句级, 按变更的行集合一次重算)
+-- ----------------------------------------------------------------------------
+-- recipe:      新增/删除, 或 product_id/is_current/status/brand_id/yield_quantity 变化
+-- recipe_item: 新增/删除, 或 recipe_id/ingredient_id/net_quantity/unit_id 变化
+-- product:     product_type 变化 (决定是否继续分解)
+-- 成本字段变化不影响本表, 不触发重算
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION sync_bom_flat_from_recipe()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_product_ids INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT product_id) INTO v_product_ids FROM new_recipe;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT product_id) INTO v_product_ids FROM old_recipe;
+    ELSE
+        SELECT array_agg(DISTINCT changed.product_id) INTO v_product_ids
+        FROM old_recipe o
+        JOIN new_recipe n ON n.recipe_id = o.recipe_id
+        CROSS JOIN LATERAL (VALUES (o.product_id), (n.product_id)) AS changed(product_id)
+        WHERE (o.product_id, o.is_current, o.status, o.brand_id, o.yield_quantity)
+              IS DISTINCT FROM (n.product_id, n.is_current, n.status, n.brand_id, n.yield_quantity);
+    END IF;
+
+    IF v_product_ids IS NOT NULL THEN
+        PERFORM refresh_bom_flat_affected(v_product_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_bom_flat_from_recipe_item()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_recipe_ids INT[];
+    v_product_ids INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT recipe_id) INTO v_recipe_ids FROM new_recipe_item;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT recipe_id) INTO v_recipe_ids FROM old_recipe_item;
+    ELSE
+        SELECT array_agg(DISTINCT changed.recipe_id) INTO v_recipe_ids
+        FROM old_recipe_item o
+        JOIN new_recipe_item n ON n.recipe_item_id = o.recipe_item_id
+        CROSS JOIN LATERAL (VALUES (o.recipe_id), (n.recipe_id)) AS changed(recipe_id)
+        WHERE (o.recipe_id, o.ingredient_id, o.net_quantity, o.unit_id)
+              IS DISTINCT FROM (n.recipe_id, n.ingredient_id, n.net_quantity, n.unit_id);
+    END IF;
+
+    -- 只有当前生效的已审核配方会进入扁平表 (级联删除时配方已不存在, 由recipe触发器处理)
+    SELECT array_agg(DISTINCT product_id) INTO v_product_ids
+    FROM recipe
+    WHERE recipe_id = ANY(v_recipe_ids)
+      AND is_current = TRUE
+      AND status = 'approved';
+
+    IF v_product_ids IS NOT NULL THEN
+        PERFORM refresh_bom_flat_affected(v_product_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_bom_flat_from_product()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_product_ids INT[];
+BEGIN
+    SELECT array_agg(n.product_id) INTO v_product_ids
+    FROM old_product o
+    JOIN new_product n ON n.product_id = o.product_id
+    WHERE o.product_type IS DISTINCT FROM n.product_type;
+
+    IF v_product_ids IS NOT NULL THEN
+        PERFORM refresh_bom_flat_affected(v_product_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 带转换表的触发器每个只能对应一种事件
+DROP TRIGGER IF EXISTS trg_bom_flat_recipe_insert ON recipe;
+CREATE TRIGGER trg_bom_flat_recipe_insert
+AFTER INSERT ON recipe
+REFERENCING NEW TABLE AS new_recipe
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_bom_flat_from_recipe();
+
+DROP TRIGGER IF EXISTS trg_bom_flat_recipe_update ON recipe;
+CREATE TRIGGER trg_bom_flat_recipe_update
+AFTER UPDATE ON recipe
+REFERENCING OLD TABLE AS old_recipe NEW TABLE AS new_recipe
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_bom_flat_from_recipe();
+
+DROP TRIGGER IF EXISTS trg_bom_flat_recipe_delete ON recipe;
+CREATE TRIGGER trg_bom_flat_recipe_delete
+AFTER DELETE ON recipe
+REFERENCING OLD TABLE AS old_recipe
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_bom_flat_from_recipe();
+
+DROP TRIGGER IF EXISTS trg_bom_flat_recipe_item_insert ON recipe_item;
+CREATE TRIGGER trg_bom_flat_recipe_item_insert
+AFTER INSERT ON recipe_item
+REFERENCING NEW TABLE AS new_recipe_item
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_bom_flat_from_recipe_item();
+
+DROP TRIGGER IF EXISTS trg_bom_flat_recipe_item_update ON recipe_item;
+CREATE TRIGGER trg_bom_flat_recipe_item_update
+AFTER UPDATE ON recipe_item
+REFERENCING OLD TABLE AS old_recipe_item NEW TABLE AS new_recipe_item
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_bom_flat_from_recipe_item();
+
+DROP TRIGGER IF EXISTS trg_bom_flat_recipe_item_delete ON recipe_item;
+CREATE TRIGGER trg_bom_flat_recipe_item_delete
+AFTER DELETE ON recipe_item
+REFERENCING OLD TABLE AS old_recipe_item
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_bom_flat_from_recipe_item();
+
+DROP TRIGGER IF EXISTS trg_bom_flat_product_update ON product;
+CREATE TRIGGER trg_bom_flat_product_update
+AFTER UPDATE ON product
+REFERENCING OLD TABLE AS old_product NEW TABLE AS new_product
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_bom_flat_from_product();
+
+COMMENT ON FUNCTION sync_bom_flat_from_recipe() IS '配方变化时重算相关产品及上级产品的扁平BOM';
+COMMENT ON FUNCTION sync_bom_flat_from_recipe_item() IS '配方明细变化时重算相关产品及上级产品的扁平BOM';
+COMMENT ON FUNCTION sync_bom_flat_from_product() IS '产品类型变化时重算用到该产品的扁平BOM';
+
+-- ----------------------------------------------------------------------------
+-- 5. explode_bom - BOM完全分解函数 ★核心函数
+-- ----------------------------------------------------------------------------
+-- 按 root_product_id 读取扁平表; p_max_level 超过扁平表深度(10层)时改用递归分解
 -- ----------------------------------------------------------------------------
 CREATE OR REPLACE FUNCTION explode_bom(
     p_product_id INT,
@@ -25,6 +297,60 @@ RETURNS TABLE (
     unit_cost DECIMAL,
     total_cost DECIMAL
 ) AS $$
+BEGIN
+    IF p_max_level > 10 THEN
+        RETURN QUERY SELECT * FROM explode_bom_recursive(p_product_id, p_quantity, p_brand_id, p_max_level);
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        bf.level,
+        bf.ingredient_id,
+        p.product_code::VARCHAR,
+        p.product_name::VARCHAR,
+        p.product_type::VARCHAR,
+        SUM(bf.quantity_per_unit * p_quantity)::DECIMAL,
+        u.unit_name::VARCHAR,
+        AVG(decrypt_cost(ri.unit_price_encrypted))::DECIMAL,
+        SUM(decrypt_cost(ri.subtotal_cost_encrypted) * bf.quantity_multiplier * p_quantity)::DECIMAL
+    FROM bom_flat bf
+    JOIN recipe_item ri ON ri.recipe_item_id = bf.recipe_item_id
+    JOIN product p ON p.product_id = bf.ingredient_id
+    JOIN unit_of_measure u ON u.unit_id = ri.unit_id
+    WHERE bf.root_product_id = p_product_id
+      AND bf.level <= p_max_level
+      AND (p_brand_id IS NULL OR bf.brand_id = p_brand_id)
+      AND p.product_type = 'raw_material'
+    GROUP BY bf.level, bf.ingredient_id, p.product_code, p.product_name, p.product_type, u.unit_name
+    ORDER BY bf.level, p.product_name;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+COMMENT ON FUNCTION explode_bom(INT, DECIMAL, INT, INT) IS '★BOM完全分解 - 读取扁平BOM表分解到原材料';
+
+-- ----------------------------------------------------------------------------
+-- 6. explode_bom_recursive - 递归BOM分解 (不使用扁平表)
+-- ----------------------------------------------------------------------------
+-- 用于超过10层的分解, 以及核对扁平表结果
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION explode_bom_recursive(
+    p_product_id INT,
+    p_quantity DECIMAL DEFAULT 1.0,
+    p_brand_id INT DEFAULT NULL,
+    p_max_level INT DEFAULT 10
+)
+RETURNS TABLE (
+    level INT,
+    ingredient_id INT,
+    ingredient_code VARCHAR,
+    ingredient_name VARCHAR,
+    ingredient_type VARCHAR,
+    total_quantity DECIMAL,
+    unit_name VARCHAR,
+    unit_cost DECIMAL,
+    total_cost DECIMAL
+) AS $$
 BEGIN
     RETURN QUERY
     WITH RECURSIVE bom_explosion AS (
@@ -66,7 +392,7 @@ BEGIN
         JOIN recipe_item ri ON r.recipe_id = ri.recipe_id
         JOIN product p ON ri.ingredient_id = p.product_id
         JOIN unit_of_measure u ON ri.unit_id = u.unit_id
-        WHERE be.ingredient_type = 'semi_finished'
+        WHERE be.product_type = 'semi_finished'
           AND be.level < p_max_level
           AND (p_brand_id IS NULL OR r.brand_id = p_brand_id)
     )
@@ -87,10 +413,10 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
-COMMENT ON FUNCTION explode_bom(INT, DECIMAL, INT, INT) IS '★BOM完全分解 - 递归分解到原材料';
+COMMENT ON FUNCTION explode_bom_recursive(INT, DECIMAL, INT, INT) IS 'BOM递归分解 - 不经扁平表逐层分解到原材料';
 
 -- ----------------------------------------------------------------------------
--- 2. calculate_product_total_cost - 计算产品总成本
+-- 7. calculate_product_total_cost - 计算产品总成本
 -- ----------------------------------------------------------------------------
 CREATE OR REPLACE FUNCTION calculate_product_total_cost(
     p_product_id INT,
@@ -109,6 +435,256 @@ $$ LANGUAGE plpgsql;
 
 COMMENT ON FUNCTION calculate_product_total_cost(INT, INT) IS '计算产品总成本';
 
+-- ----------------------------------------------------------------------------
+-- 8. bom_where_used - 反查BOM: 哪些产品(直接或经半成品)用到某配料
+-- ----------------------------------------------------------------------------
+-- 基于 bom_flat 的 ingredient_id 索引, 一次查找即得到全部上级产品
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION bom_where_used(p_ingredient_ids INT[])
+RETURNS TABLE (
+    product_id INT,
+    product_code VARCHAR,
+    product_name VARCHAR,
+    product_type VARCHAR,
+    min_level INT,
+    max_level INT,
+    quantity_per_unit DECIMAL
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        p.product_id,
+        p.product_code::VARCHAR,
+        p.product_name::VARCHAR,
+        p.product_type::VARCHAR,
+        MIN(bf.level)::INT,
+        MAX(bf.level)::INT,
+        SUM(bf.quantity_per_unit)::DECIMAL
+    FROM bom_flat bf
+    JOIN product p ON p.product_id = bf.root_product_id
+    WHERE bf.ingredient_id = ANY(p_ingredient_ids)
+    GROUP BY p.product_id, p.product_code, p.product_name, p.product_type
+    ORDER BY MAX(bf.level), p.product_name;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION bom_where_used(INT[]) IS '反查BOM - 直接或间接使用指定配料的产品';
+
+-- ----------------------------------------------------------------------------
+-- 9. recompute_costs_for_ingredients - 配料调价后定向重算成本
+-- ----------------------------------------------------------------------------
+-- 原材料 product.current_cost_encrypted 变化后调用, 只重算用到它的配方和产品:
+--   1. 按 bom_where_used 的最大层级由低到高分层处理 (半成品先于用到它的成品)
+--   2. 每层: 重算该层产品当前配方中、配料已变价的明细单价和小计
+--            (单价 = 配料单位成本 × 明细单位→配料基础单位换算系数, 小计 = 用量 × 单价 / 出成率)
+--   3. 重算配方原材料成本/总成本, 产品成本 = 配方总成本 / 出品量
+--   4. 本层产品加入已变价集合, 供上层使用
+-- 返回: {"levels", "products", "recipes", "recipe_items", "elapsed_ms"}
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION recompute_costs_for_ingredients(p_ingredient_ids INT[])
+RETURNS JSON AS $$
+DECLARE
+    v_started TIMESTAMP := clock_timestamp();
+    v_changed INT[] := p_ingredient_ids;
+    v_level INT;
+    v_products INT[];
+    v_rows INT;
+    v_levels INT := 0;
+    v_product_count INT := 0;
+    v_recipe_count INT := 0;
+    v_item_count INT := 0;
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS tmp_cost_recompute (
+        product_id INT PRIMARY KEY,
+        max_level INT NOT NULL
+    ) ON COMMIT DROP;
+    TRUNCATE tmp_cost_recompute;
+
+    INSERT INTO tmp_cost_recompute (product_id, max_level)
+    SELECT wu.product_id, wu.max_level
+    FROM bom_where_used(p_ingredient_ids) wu;
+
+    FOR v_level IN SELECT DISTINCT max_level FROM tmp_cost_recompute ORDER BY max_level LOOP
+        SELECT array_agg(product_id) INTO v_products
+        FROM tmp_cost_recompute
+        WHERE max_level = v_level;
+
+        -- 明细: 配料已变价的行按配料当前成本重算
+        UPDATE recipe_item ri
+        SET unit_price_encrypted = encrypt_cost(priced.unit_price),
+            subtotal_cost_encrypted = encrypt_cost(
+                ri.quantity * priced.unit_price / COALESCE(NULLIF(ri.usage_yield_rate, 0), 1)
+            ),
+            updated_at = NOW()
+        FROM (
+            SELECT
+                ri2.recipe_item_id,
+                decrypt_cost(ing.current_cost_encrypted)
+                    * get_unit_conversion_factor(ri2.unit_id, ing.base_unit_id, ing.product_id) AS unit_price
+            FROM recipe r
+            JOIN recipe_item ri2 ON ri2.recipe_id = r.recipe_id
+            JOIN product ing ON ing.product_id = ri2.ingredient_id
+            WHERE r.product_id = ANY(v_products)
+              AND r.is_current = TRUE
+              AND r.status = 'approved'
+              AND ri2.ingredient_id = ANY(v_changed)
+        ) priced
+        WHERE ri.recipe_item_id = priced.recipe_item_id
+          AND priced.unit_price IS NOT NULL;
+        GET DIAGNOSTICS v_rows = ROW_COUNT;
+        v_item_count := v_item_count + v_rows;
+
+        -- 配方: 原材料成本 = 明细小计之和, 总成本 = 原材料 + 人工 + 制造费用
+        UPDATE recipe r
+        SET total_material_cost_encrypted = encrypt_cost(totals.material_cost),
+            total_cost_encrypted = encrypt_cost(
+                totals.material_cost + COALESCE(r.total_labor_cost, 0) + COALESCE(r.total_overhead_cost, 0)
+            ),
+            updated_at = NOW()
+        FROM (
+            SELECT ri.recipe_id, SUM(decrypt_cost(ri.subtotal_cost_encrypted)) AS material_cost
+            FROM recipe r2
+            JOIN recipe_item ri ON ri.recipe_id = r2.recipe_id
+            WHERE r2.product_id = ANY(v_products)
+              AND r2.is_current = TRUE
+              AND r2.status = 'approved'
+            GROUP BY ri.recipe_id
+        ) totals
+        WHERE r.recipe_id = totals.recipe_id;
+        GET DIAGNOSTICS v_rows = ROW_COUNT;
+        v_recipe_count := v_recipe_count + v_rows;
+
+        -- 产品: 单位成本 = 配方总成本 / 出品量 (多品牌配方时取通用配方, 其次最早的配方)
+        UPDATE product p
+        SET current_cost_encrypted = encrypt_cost(
+                decrypt_cost(chosen.total_cost_encrypted) / COALESCE(NULLIF(chosen.yield_quantity, 0), 1)
+            ),
+            updated_at = NOW()
+        FROM (
+            SELECT DISTINCT ON (r.product_id)
+                r.product_id, r.total_cost_encrypted, r.yield_quantity
+            FROM recipe r
+            WHERE r.product_id = ANY(v_products)
+              AND r.is_current = TRUE
+              AND r.status = 'approved'
+            ORDER BY r.product_id, r.brand_id NULLS FIRST, r.recipe_id
+        ) chosen
+        WHERE p.product_id = chosen.product_id;
+        GET DIAGNOSTICS v_rows = ROW_COUNT;
+        v_product_count := v_product_count + v_rows;
+
+        v_changed := v_changed || v_products;
+        v_levels := v_levels + 1;
+    END LOOP;
+
+    RETURN json_build_object(
+        'levels', v_levels,
+        'products', v_product_count,
+        'recipes', v_recipe_count,
+        'recipe_items', v_item_count,
+        'elapsed_ms', ROUND(EXTRACT(EPOCH FROM clock_timestamp() - v_started)::NUMERIC * 1000, 2)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION recompute_costs_for_ingredients(INT[]) IS '配料调价后按反查BOM分层重算受影响配方和产品成本';
+
+-- ----------------------------------------------------------------------------
+-- 10. explode_bom_batch - 批量BOM分解 (多个产品及数量一次分解并汇总)
+-- ----------------------------------------------------------------------------
+-- 说明: p_product_ids 与 p_quantities 为等长的平行数组, 同一产品可重复出现;
+--       结果按原材料汇总, 等于对每个(产品, 数量)调用 explode_bom 后按原材料求和
+--       数量与成本按产品数量线性累加, unit_cost 为各配方明细单价的平均值
+-- 用法: 上周售出菜品的原材料需求
+--   SELECT b.*
+--   FROM (
+--       SELECT array_agg(soi.product_id) AS product_ids, array_agg(soi.quantity) AS quantities
+--       FROM sales_order_item soi
+--       JOIN sales_order so ON so.order_id = soi.order_id
+--       WHERE so.order_date >= CURRENT_DATE - 7
+--   ) sold,
+--   explode_bom_batch(sold.product_ids, sold.quantities) b;
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION explode_bom_batch(
+    p_product_ids INT[],
+    p_quantities DECIMAL[],
+    p_brand_id INT DEFAULT NULL,
+    p_max_level INT DEFAULT 10
+)
+RETURNS TABLE (
+    ingredient_id INT,
+    ingredient_code VARCHAR,
+    ingredient_name VARCHAR,
+    total_quantity DECIMAL,
+    unit_name VARCHAR,
+    unit_cost DECIMAL,
+    total_cost DECIMAL,
+    product_count INT
+) AS $$
+BEGIN
+    IF COALESCE(array_length(p_product_ids, 1), 0) <> COALESCE(array_length(p_quantities, 1), 0) THEN
+        RAISE EXCEPTION '产品数组与数量数组长度不一致: % / %',
+            array_length(p_product_ids, 1), array_length(p_quantities, 1);
+    END IF;
+
+    IF p_max_level > 10 THEN
+        RETURN QUERY
+        WITH demand AS (
+            SELECT d.product_id, SUM(d.quantity) AS quantity
+            FROM unnest(p_product_ids, p_quantities) AS d(product_id, quantity)
+            GROUP BY d.product_id
+        )
+        SELECT
+            be.ingredient_id,
+            be.ingredient_code,
+            be.ingredient_name,
+            SUM(be.total_quantity)::DECIMAL,
+            be.unit_name,
+            AVG(be.unit_cost)::DECIMAL,
+            SUM(be.total_cost)::DECIMAL,
+            COUNT(DISTINCT d.product_id)::INT
+        FROM demand d
+        CROSS JOIN LATERAL explode_bom_recursive(d.product_id, d.quantity, p_brand_id, p_max_level) be
+        GROUP BY be.ingredient_id, be.ingredient_code, be.ingredient_name, be.unit_name
+        ORDER BY be.ingredient_name;
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    WITH demand AS (
+        SELECT d.product_id, SUM(d.quantity) AS quantity
+        FROM unnest(p_product_ids, p_quantities) AS d(product_id, quantity)
+        GROUP BY d.product_id
+    )
+    SELECT
+        bf.ingredient_id,
+        p.product_code::VARCHAR,
+        p.product_name::VARCHAR,
+        SUM(bf.quantity_per_unit * d.quantity)::DECIMAL,
+        u.unit_name::VARCHAR,
+        AVG(decrypt_cost(ri.unit_price_encrypted))::DECIMAL,
+        SUM(decrypt_cost(ri.subtotal_cost_encrypted) * bf.quantity_multiplier * d.quantity)::DECIMAL,
+        COUNT(DISTINCT d.product_id)::INT
+    FROM demand d
+    JOIN bom_flat bf ON bf.root_product_id = d.product_id
+    JOIN recipe_item ri ON ri.recipe_item_id = bf.recipe_item_id
+    JOIN product p ON p.product_id = bf.ingredient_id
+    JOIN unit_of_measure u ON u.unit_id = ri.unit_id
+    WHERE bf.level <= p_max_level
+      AND (p_brand_id IS NULL OR bf.brand_id = p_brand_id)
+      AND p.product_type = 'raw_material'
+    GROUP BY bf.ingredient_id, p.product_code, p.product_name, u.unit_name
+    ORDER BY p.product_name;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+COMMENT ON FUNCTION explode_bom_batch(INT[], DECIMAL[], INT, INT) IS '批量BOM分解 - 多个产品一次分解并按原材料汇总';
+
+-- ----------------------------------------------------------------------------
+-- 初始化: 按现有配方全量生成扁平BOM
+-- ----------------------------------------------------------------------------
+SELECT refresh_bom_flat();
+
 -- ============================================================================
 -- 脚本完成
 -- ============================================================================
@@ -70,29 +70,66 @@ RETURNS DECIMAL AS $$
 DECLARE
     v_encryption_key TEXT;
     v_decrypted TEXT;
+    v_cost DECIMAL;
+    v_use_cache BOOLEAN := FALSE;
 BEGIN
     -- 检查输入
     IF p_encrypted IS NULL THEN
         RETURN NULL;
     END IF;
 
-    -- 获取加密密钥
+    -- 会话解密缓存 (见 enable_cost_decrypt_cache), 密钥变更后缓存自动失效
+    -- 只信任 enable_cost_decrypt_cache 建立的缓存表: 表属于该函数的属主, 会话用户无权建立或改写;
+    -- 会话自建的同名临时表和自行设置的 app.cost_decrypt_cache 都不会被使用
+    IF COALESCE(current_setting('app.cost_decrypt_cache', true), '') <> ''
+       AND current_setting('app.cost_decrypt_cache', true)
+           = md5(COALESCE(current_setting('app.encryption_key', true), ''))
+       AND EXISTS (
+           SELECT 1
+           FROM pg_class c
+           JOIN pg_proc p ON p.oid = 'enable_cost_decrypt_cache()'::regprocedure
+           WHERE c.relname = 'cost_decrypt_cache'
+             AND c.relnamespace = pg_my_temp_schema()
+             AND c.relowner = p.proowner
+       ) THEN
+        v_use_cache := TRUE;
+
+        SELECT plain_cost INTO v_cost
+        FROM pg_temp.cost_decrypt_cache
+        WHERE encrypted = p_encrypted;
+
+        IF FOUND THEN
+            RETURN v_cost;
+        END IF;
+    END IF;
+
     BEGIN
-        v_encryption_key := current_setting('app.encryption_key', false);
-    EXCEPTION WHEN OTHERS THEN
-        RAISE EXCEPTION '加密密钥未配置! 请设置 app.encryption_key 参数.';
+        -- 获取加密密钥
+        BEGIN
+            v_encryption_key := current_setting('app.encryption_key', false);
+        EXCEPTION WHEN OTHERS THEN
+            RAISE EXCEPTION '加密密钥未配置! 请设置 app.encryption_key 参数.';
+        END;
+
+        -- 解密
+        v_decrypted := pgp_sym_decrypt(p_encrypted, v_encryption_key);
+
+        -- 转换为DECIMAL
+        v_cost := v_decrypted::DECIMAL;
+    EXCEPTION
+        WHEN OTHERS THEN
+            -- 解密失败返回NULL(可能是密钥错误或数据损坏)
+            RETURN NULL;
     END;
 
-    -- 解密
-    v_decrypted := pgp_sym_decrypt(p_encrypted, v_encryption_key);
-
-    -- 转换为DECIMAL
-    RETURN v_decrypted::DECIMAL;
+    -- 缓存未命中的密文 (如缓存开启后新写入的成本)
+    IF v_use_cache THEN
+        INSERT INTO pg_temp.cost_decrypt_cache (encrypted, plain_cost)
+        VALUES (p_encrypted, v_cost)
+        ON CONFLICT (encrypted) DO NOTHING;
+    END IF;
 
-EXCEPTION
-    WHEN OTHERS THEN
-        -- 解密失败返回NULL(可能是密钥错误或数据损坏)
-        RETURN NULL;
+    RETURN v_cost;
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
@@ -519,12 +556,89 @@ $$ LANGUAGE plpgsql SECURITY DEFINER;
 
 COMMENT ON FUNCTION get_recipe_total_cost(INT) IS '获取配方总成本 - 解密返回';
 
+-- ============================================================================
+-- 会话解密缓存 - 财务报表会话批量解密
+-- ============================================================================
+
+-- ----------------------------------------------------------------------------
+-- 9. enable_cost_decrypt_cache - 开启本会话的解密缓存
+-- ----------------------------------------------------------------------------
+-- 用途: 报表会话开始时一次批量解密全部成本密文, 存入会话临时表
+--       之后 decrypt_cost (及调用它的各成本视图/函数) 先查缓存, 同一密文不再重复解密
+-- 返回: 缓存的密文数
+-- 权限: 仅 check_cost_decrypt_permission() 通过的用户可开启
+-- 说明: 缓存只在本会话可见, 会话结束自动删除; 修改 app.encryption_key 后缓存自动失效
+--       缓存表属于本函数属主, decrypt_cost 只信任属主一致的缓存表
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION enable_cost_decrypt_cache()
+RETURNS INT AS $$
+DECLARE
+    v_encryption_key TEXT;
+    v_count INT;
+BEGIN
+    IF NOT check_cost_decrypt_permission() THEN
+        RAISE EXCEPTION '当前用户无成本解密权限, 不能开启解密缓存';
+    END IF;
+
+    v_encryption_key := current_setting('app.encryption_key', true);
+    IF COALESCE(v_encryption_key, '') = '' THEN
+        RAISE EXCEPTION '加密密钥未配置! 请设置 app.encryption_key 参数.';
+    END IF;
+
+    -- 先关闭缓存, 下面的批量解密直接解密
+    PERFORM set_config('app.cost_decrypt_cache', '', false);
+
+    -- 每次重建缓存表, 由本函数(属主身份)建立; 不复用会话中已有的同名表
+    -- 不授予会话用户任何权限, 缓存内容只能经 decrypt_cost 读取和追加
+    DROP TABLE IF EXISTS pg_temp.cost_decrypt_cache;
+    CREATE TEMP TABLE cost_decrypt_cache (
+        encrypted BYTEA PRIMARY KEY,
+        plain_cost DECIMAL
+    );
+
+    -- 每个不同的密文只解密一次
+    INSERT INTO pg_temp.cost_decrypt_cache (encrypted, plain_cost)
+    SELECT encrypted, decrypt_cost(encrypted)
+    FROM (
+        SELECT current_cost_encrypted AS encrypted FROM product
+        UNION SELECT total_material_cost_encrypted FROM recipe
+        UNION SELECT total_cost_encrypted FROM recipe
+        UNION SELECT unit_price_encrypted FROM recipe_item
+        UNION SELECT subtotal_cost_encrypted FROM recipe_item
+        UNION SELECT unit_price_encrypted FROM ingredient_cost_history
+    ) src
+    WHERE encrypted IS NOT NULL;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    -- 记录密钥指纹, decrypt_cost 只在当前密钥与开启时一致时使用缓存
+    PERFORM set_config('app.cost_decrypt_cache', md5(v_encryption_key), false);
+
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+COMMENT ON FUNCTION enable_cost_decrypt_cache() IS '★开启会话解密缓存 - 批量解密一次, 报表查询直接读缓存(需解密权限)';
+
+-- ----------------------------------------------------------------------------
+-- 10. disable_cost_decrypt_cache - 关闭本会话的解密缓存
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION disable_cost_decrypt_cache()
+RETURNS VOID AS $$
+BEGIN
+    PERFORM set_config('app.cost_decrypt_cache', '', false);
+    DROP TABLE IF EXISTS pg_temp.cost_decrypt_cache;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+COMMENT ON FUNCTION disable_cost_decrypt_cache() IS '关闭会话解密缓存并删除缓存表';
+
 -- ============================================================================
 -- 测试函数
 -- ============================================================================
 
 -- ----------------------------------------------------------------------------
--- 9. test_encryption - 测试加密解密功能
+-- 11. test_encryption - 测试加密解密功能
 -- ----------------------------------------------------------------------------
 CREATE OR REPLACE FUNCTION test_encryption()
 RETURNS TABLE (
@@ -664,6 +778,23 @@ GRANT SELECT ON v_product_cost_masked TO role_store_manager;
 -- 授予服务员查看产品列表(无成本)的权限
 GRANT SELECT ON v_product_no_cost TO role_waiter;
 
+## 7. 财务报表会话解密缓存
+
+报表会话中同一批成本密文会被各视图反复解密, 可先开启会话缓存一次批量解密:
+```sql
+SET app.encryption_key = '...';
+SELECT enable_cost_decrypt_cache();          -- 返回缓存的密文数, 无解密权限时报错
+
+SELECT * FROM v_product_cost_full;           -- 直接读缓存
+SELECT * FROM v_recipe_item_cost_full;
+
+SELECT disable_cost_decrypt_cache();         -- 可选, 会话结束时自动删除
+```
+
+缓存只在当前会话可见; 缓存开启后新写入的密文首次解密时自动加入缓存
+缓存表由 enable_cost_decrypt_cache 以函数属主身份建立, 会话用户不能读写;
+自建同名临时表或手工设置 app.cost_decrypt_cache 不会让 decrypt_cost 使用缓存
+
 */
 
 -- ============================================================================
@@ -8,27 +8,119 @@
 -- ----------------------------------------------------------------------------
 -- 1. validate_staging_sales - 销售数据5轮验证
 -- ----------------------------------------------------------------------------
+-- 单次扫描批次数据, 逐行计算5轮检查结果, 集合式回写 validation_status,
+-- 再用 FILTER 聚合一次得到5轮统计并写入 data_validation_log
+--   Round 1 数据提取验证: sales_date/store_code/product_code/sales_quantity 非空
+--   Round 2 引用完整性验证: store_code、product_code 在 store/product 中存在
+--   Round 3 数值范围验证: 数量>0, 金额/优惠非负, 优惠不超过折前销售额
+--   Round 4 金额计算验证: 折前销售额 - 菜品优惠 = 折后收入 (允许0.01误差)
+--   Round 5 重复数据检测: 同批次内(门店, 日期, 产品)重复, 只告警不判失败
+-- 行状态: Round 1-4 全部通过为 passed, 否则 failed; 每轮未通过扣20分
+-- ----------------------------------------------------------------------------
 CREATE OR REPLACE FUNCTION validate_staging_sales(p_batch_id UUID)
 RETURNS JSON AS $$
 DECLARE
-    v_result JSON;
-    v_total INT;
+    v_stats RECORD;
     v_passed INT;
-    v_round INT;
 BEGIN
-    -- Round 1: 数据提取验证
-    v_round := 1;
-    SELECT COUNT(*) INTO v_total FROM staging_sales_detail WHERE batch_id = p_batch_id;
-    SELECT COUNT(*) INTO v_passed FROM staging_sales_detail
-    WHERE batch_id = p_batch_id AND sales_date IS NOT NULL AND sales_quantity > 0;
+    WITH checks AS (
+        SELECT
+            st.staging_id,
+            st.excel_row_number,
+            COALESCE(
+                st.sales_date IS NOT NULL
+                AND NULLIF(TRIM(st.store_code), '') IS NOT NULL
+                AND NULLIF(TRIM(st.product_code), '') IS NOT NULL
+                AND st.sales_quantity IS NOT NULL, FALSE) AS r1_ok,
+            (s.store_id IS NOT NULL AND p.product_id IS NOT NULL) AS r2_ok,
+            COALESCE(
+                st.sales_quantity > 0
+                AND COALESCE(st.presales_amount, 0) >= 0
+                AND COALESCE(st.product_revenue, 0) >= 0
+                AND COALESCE(st.product_discount, 0) >= 0
+                AND COALESCE(st.product_discount, 0) <= COALESCE(st.presales_amount, 0), FALSE) AS r3_ok,
+            COALESCE(
+                ABS(st.presales_amount - COALESCE(st.product_discount, 0) - st.product_revenue) <= 0.01,
+                FALSE) AS r4_ok,
+            COUNT(*) OVER (PARTITION BY st.store_code, st.sales_date, st.product_code) = 1 AS r5_ok
+        FROM staging_sales_detail st
+        LEFT JOIN store s ON s.store_code = st.store_code
+        LEFT JOIN product p ON p.product_code = st.product_code
+        WHERE st.batch_id = p_batch_id
+    ),
+    updated AS (
+        UPDATE staging_sales_detail st SET
+            validation_status = CASE WHEN c.r1_ok AND c.r2_ok AND c.r3_ok AND c.r4_ok
+                                     THEN 'passed' ELSE 'failed' END,
+            validation_errors = CASE WHEN c.r1_ok AND c.r2_ok AND c.r3_ok AND c.r4_ok AND c.r5_ok
+                                     THEN NULL
+                                     ELSE to_json(array_remove(ARRAY[
+                                         CASE WHEN NOT c.r1_ok THEN '数据提取验证' END,
+                                         CASE WHEN NOT c.r2_ok THEN '引用完整性验证' END,
+                                         CASE WHEN NOT c.r3_ok THEN '数值范围验证' END,
+                                         CASE WHEN NOT c.r4_ok THEN '金额计算验证' END,
+                                         CASE WHEN NOT c.r5_ok THEN '重复数据检测' END
+                                     ], NULL)) END,
+            quality_score = 100 - 20 * ((NOT c.r1_ok)::INT + (NOT c.r2_ok)::INT + (NOT c.r3_ok)::INT
+                                        + (NOT c.r4_ok)::INT + (NOT c.r5_ok)::INT)
+        FROM checks c
+        WHERE st.staging_id = c.staging_id
+        RETURNING c.*
+    )
+    SELECT
+        COUNT(*) AS total,
+        COUNT(*) FILTER (WHERE r1_ok) AS r1_passed,
+        COUNT(*) FILTER (WHERE r2_ok) AS r2_passed,
+        COUNT(*) FILTER (WHERE r3_ok) AS r3_passed,
+        COUNT(*) FILTER (WHERE r4_ok) AS r4_passed,
+        COUNT(*) FILTER (WHERE r5_ok) AS r5_passed,
+        COUNT(*) FILTER (WHERE r1_ok AND r2_ok AND r3_ok AND r4_ok) AS all_passed,
+        -- 每轮最多记录前20个未通过的Excel行号
+        (array_agg(excel_row_number ORDER BY excel_row_number) FILTER (WHERE NOT r1_ok))[1:20] AS r1_rows,
+        (array_agg(excel_row_number ORDER BY excel_row_number) FILTER (WHERE NOT r2_ok))[1:20] AS r2_rows,
+        (array_agg(excel_row_number ORDER BY excel_row_number) FILTER (WHERE NOT r3_ok))[1:20] AS r3_rows,
+        (array_agg(excel_row_number ORDER BY excel_row_number) FILTER (WHERE NOT r4_ok))[1:20] AS r4_rows,
+        (array_agg(excel_row_number ORDER BY excel_row_number) FILTER (WHERE NOT r5_ok))[1:20] AS r5_rows
+    INTO v_stats
+    FROM updated;
+
+    -- 重新验证同一批次时覆盖上次的日志
+    DELETE FROM data_validation_log WHERE batch_id = p_batch_id AND data_type = 'sales';
 
-    INSERT INTO data_validation_log (batch_id, data_type, validation_round, round_name, total_records, passed_records)
-    VALUES (p_batch_id, 'sales', v_round, '数据提取验证', v_total, v_passed);
+    INSERT INTO data_validation_log
+        (batch_id, data_type, validation_round, round_name, round_status,
+         total_records, passed_records, failed_records, warning_records, error_details, quality_score)
+    SELECT p_batch_id, 'sales', r.round_no, r.round_name,
+           CASE WHEN r.passed = v_stats.total THEN 'passed'
+                WHEN r.round_no = 5 THEN 'warning'
+                ELSE 'failed' END,
+           v_stats.total,
+           r.passed,
+           CASE WHEN r.round_no = 5 THEN 0 ELSE v_stats.total - r.passed END,
+           CASE WHEN r.round_no = 5 THEN v_stats.total - r.passed ELSE 0 END,
+           CASE WHEN r.passed = v_stats.total THEN NULL
+                ELSE json_build_object('excel_rows', r.failed_rows) END,
+           CASE WHEN v_stats.total = 0 THEN 100 ELSE r.passed * 100 / v_stats.total END
+    FROM (VALUES
+        (1, '数据提取验证', v_stats.r1_passed, v_stats.r1_rows),
+        (2, '引用完整性验证', v_stats.r2_passed, v_stats.r2_rows),
+        (3, '数值范围验证', v_stats.r3_passed, v_stats.r3_rows),
+        (4, '金额计算验证', v_stats.r4_passed, v_stats.r4_rows),
+        (5, '重复数据检测', v_stats.r5_passed, v_stats.r5_rows)
+    ) AS r(round_no, round_name, passed, failed_rows);
 
-    -- Round 2-5: 其他验证轮次...
+    v_passed := v_stats.all_passed;
 
-    v_result := json_build_object('status', 'completed', 'total', v_total, 'passed', v_passed);
-    RETURN v_result;
+    RETURN json_build_object(
+        'status', 'completed',
+        'total', v_stats.total,
+        'passed', v_passed,
+        'failed', v_stats.total - v_passed,
+        'duplicates', v_stats.total - v_stats.r5_passed,
+        'rounds', json_build_array(
+            v_stats.r1_passed, v_stats.r2_passed, v_stats.r3_passed, v_stats.r4_passed, v_stats.r5_passed
+        )
+    );
 END;
 $$ LANGUAGE plpgsql;
 
@@ -10,6 +10,7 @@
 -- 2. 标准价格同步
 -- 3. 差异计算与分级
 -- 4. 品类阈值判断
+-- 5. 批量导入语句级计算
 -- ============================================================================
 
 -- ============================================================================
@@ -47,7 +48,8 @@ CREATE TABLE IF NOT EXISTS price_variance_threshold (
         REFERENCES product_category(category_id)
 );
 
-CREATE INDEX idx_threshold_category ON price_variance_threshold(category_id);
+-- 每个品类只有一条阈值配置 (set_category_threshold 的 ON CONFLICT 依赖此唯一索引)
+CREATE UNIQUE INDEX idx_threshold_category ON price_variance_threshold(category_id);
 CREATE INDEX idx_threshold_active ON price_variance_threshold(is_active) WHERE is_active = TRUE;
 
 COMMENT ON TABLE price_variance_threshold IS
@@ -61,6 +63,34 @@ VALUES
     (NULL, '默认', 10.00, 20.00, -10.00, -20.00)
 ON CONFLICT DO NOTHING;
 
+-- ----------------------------------------------------------------------------
+-- sku_variance_threshold - SKU生效阈值映射表
+-- ----------------------------------------------------------------------------
+-- 每个SKU一行, 预先解析 SKU → 产品品类 → 品类阈值(无则默认阈值)
+-- 采购价格触发器和批量重算按 sku_id 一次主键查询即可得到阈值
+-- 由 refresh_sku_variance_threshold() 维护, 阈值配置/SKU/产品品类变化时自动刷新
+-- ----------------------------------------------------------------------------
+CREATE TABLE IF NOT EXISTS sku_variance_threshold (
+    sku_id INT PRIMARY KEY,
+    category_id INT,                           -- 产品品类ID
+    threshold_id INT,                          -- 生效的阈值配置（NULL表示无可用阈值）
+
+    warning_upper_rate DECIMAL(5,2),
+    critical_upper_rate DECIMAL(5,2),
+    warning_lower_rate DECIMAL(5,2),
+    critical_lower_rate DECIMAL(5,2),
+
+    refreshed_at TIMESTAMP DEFAULT NOW(),
+
+    CONSTRAINT fk_sku_threshold_sku
+        FOREIGN KEY (sku_id)
+        REFERENCES product_sku(sku_id)
+        ON DELETE CASCADE
+);
+
+COMMENT ON TABLE sku_variance_threshold IS
+    'SKU生效阈值映射表 - 品类阈值回退默认阈值后的结果, 价格差异分级一次查询';
+
 -- ============================================================================
 -- 第二部分: 辅助函数
 -- ============================================================================
@@ -106,39 +136,158 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- ----------------------------------------------------------------------------
--- 函数：根据品类和差异率计算差异等级
+-- 函数：刷新SKU生效阈值映射
 -- ----------------------------------------------------------------------------
-CREATE OR REPLACE FUNCTION calc_variance_level_by_category(
+-- 参数: p_sku_ids - 需要刷新的SKU, 为NULL时全量刷新
+-- 返回: 刷新的SKU数
+-- 规则与 get_category_threshold 一致: 品类阈值优先, 其次默认阈值
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION refresh_sku_variance_threshold(
+    p_sku_ids INT[] DEFAULT NULL
+) RETURNS INT AS $$
+DECLARE
+    v_count INT;
+BEGIN
+    DELETE FROM sku_variance_threshold
+    WHERE p_sku_ids IS NULL OR sku_id = ANY(p_sku_ids);
+
+    INSERT INTO sku_variance_threshold (
+        sku_id, category_id, threshold_id,
+        warning_upper_rate, critical_upper_rate,
+        warning_lower_rate, critical_lower_rate
+    )
+    SELECT
+        ps.sku_id,
+        p.category_id,
+        thr.threshold_id,
+        thr.warning_upper_rate,
+        thr.critical_upper_rate,
+        thr.warning_lower_rate,
+        thr.critical_lower_rate
+    FROM product_sku ps
+    LEFT JOIN product p ON p.product_id = ps.product_id
+    LEFT JOIN LATERAL (
+        SELECT
+            t.threshold_id,
+            t.warning_upper_rate,
+            t.critical_upper_rate,
+            t.warning_lower_rate,
+            t.critical_lower_rate
+        FROM price_variance_threshold t
+        WHERE t.is_active = TRUE
+          AND (t.category_id = p.category_id OR t.category_id IS NULL)
+        ORDER BY t.category_id NULLS LAST, t.threshold_id
+        LIMIT 1
+    ) thr ON TRUE
+    WHERE p_sku_ids IS NULL OR ps.sku_id = ANY(p_sku_ids);
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ----------------------------------------------------------------------------
+-- 触发器函数：阈值配置 / SKU / 产品品类变化时刷新映射
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION sync_sku_threshold_from_threshold()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- 阈值配置表很小且极少修改, 直接全量刷新
+    PERFORM refresh_sku_variance_threshold();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_sku_threshold_from_sku()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_sku_ids INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(n.sku_id) INTO v_sku_ids
+        FROM new_sku n;
+    ELSE
+        SELECT array_agg(n.sku_id) INTO v_sku_ids
+        FROM old_sku o
+        JOIN new_sku n ON n.sku_id = o.sku_id
+        WHERE o.product_id IS DISTINCT FROM n.product_id;
+    END IF;
+
+    IF v_sku_ids IS NOT NULL THEN
+        PERFORM refresh_sku_variance_threshold(v_sku_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_sku_threshold_from_product()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_sku_ids INT[];
+BEGIN
+    SELECT array_agg(ps.sku_id) INTO v_sku_ids
+    FROM old_product o
+    JOIN new_product n ON n.product_id = o.product_id
+    JOIN product_sku ps ON ps.product_id = n.product_id
+    WHERE o.category_id IS DISTINCT FROM n.category_id;
+
+    IF v_sku_ids IS NOT NULL THEN
+        PERFORM refresh_sku_variance_threshold(v_sku_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sku_threshold_config ON price_variance_threshold;
+CREATE TRIGGER trg_sku_threshold_config
+AFTER INSERT OR UPDATE OR DELETE ON price_variance_threshold
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_sku_threshold_from_threshold();
+
+-- 带转换表的触发器每个只能对应一种事件
+DROP TRIGGER IF EXISTS trg_sku_threshold_sku_insert ON product_sku;
+CREATE TRIGGER trg_sku_threshold_sku_insert
+AFTER INSERT ON product_sku
+REFERENCING NEW TABLE AS new_sku
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_sku_threshold_from_sku();
+
+DROP TRIGGER IF EXISTS trg_sku_threshold_sku_update ON product_sku;
+CREATE TRIGGER trg_sku_threshold_sku_update
+AFTER UPDATE ON product_sku
+REFERENCING OLD TABLE AS old_sku NEW TABLE AS new_sku
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_sku_threshold_from_sku();
+
+DROP TRIGGER IF EXISTS trg_sku_threshold_product_update ON product;
+CREATE TRIGGER trg_sku_threshold_product_update
+AFTER UPDATE ON product
+REFERENCING OLD TABLE AS old_product NEW TABLE AS new_product
+FOR EACH STATEMENT
+EXECUTE FUNCTION sync_sku_threshold_from_product();
+
+-- ----------------------------------------------------------------------------
+-- 函数：根据差异率和阈值判断差异等级
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION classify_variance_level(
     p_variance_rate DECIMAL(6,2),
-    p_sku_id INT
+    p_warning_upper DECIMAL(5,2),
+    p_critical_upper DECIMAL(5,2),
+    p_warning_lower DECIMAL(5,2),
+    p_critical_lower DECIMAL(5,2)
 ) RETURNS VARCHAR(20) AS $$
-DECLARE
-    v_category_id INT;
-    v_threshold RECORD;
 BEGIN
     IF p_variance_rate IS NULL THEN
         RETURN NULL;
     END IF;
 
-    -- 获取SKU对应的品类ID
-    SELECT pc.category_id INTO v_category_id
-    FROM product_sku ps
-    JOIN product p ON ps.product_id = p.product_id
-    LEFT JOIN product_category pc ON p.category_id = pc.category_id
-    WHERE ps.sku_id = p_sku_id;
-
-    -- 获取阈值
-    SELECT * INTO v_threshold
-    FROM get_category_threshold(v_category_id);
-
-    -- 根据阈值判断等级
-    IF p_variance_rate >= v_threshold.critical_upper THEN
+    IF p_variance_rate >= p_critical_upper THEN
         RETURN 'critical';      -- 严重超标
-    ELSIF p_variance_rate >= v_threshold.warning_upper THEN
+    ELSIF p_variance_rate >= p_warning_upper THEN
         RETURN 'high';          -- 超标
-    ELSIF p_variance_rate <= v_threshold.critical_lower THEN
+    ELSIF p_variance_rate <= p_critical_lower THEN
         RETURN 'critical_low';  -- 严重偏低
-    ELSIF p_variance_rate <= v_threshold.warning_lower THEN
+    ELSIF p_variance_rate <= p_warning_lower THEN
         RETURN 'low';           -- 偏低
     ELSIF p_variance_rate >= 5 THEN
         RETURN 'medium';        -- 轻度偏高
@@ -148,43 +297,84 @@ BEGIN
         RETURN 'normal';        -- 正常
     END IF;
 END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- ----------------------------------------------------------------------------
+-- 函数：根据品类和差异率计算差异等级
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION calc_variance_level_by_category(
+    p_variance_rate DECIMAL(6,2),
+    p_sku_id INT
+) RETURNS VARCHAR(20) AS $$
+DECLARE
+    v_category_id INT;
+    v_threshold RECORD;
+BEGIN
+    IF p_variance_rate IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- 从SKU阈值映射一次查询
+    SELECT
+        t.warning_upper_rate AS warning_upper,
+        t.critical_upper_rate AS critical_upper,
+        t.warning_lower_rate AS warning_lower,
+        t.critical_lower_rate AS critical_lower
+    INTO v_threshold
+    FROM sku_variance_threshold t
+    WHERE t.sku_id = p_sku_id;
+
+    -- 映射中没有该SKU时按品类实时查询
+    IF NOT FOUND THEN
+        SELECT pc.category_id INTO v_category_id
+        FROM product_sku ps
+        JOIN product p ON ps.product_id = p.product_id
+        LEFT JOIN product_category pc ON p.category_id = pc.category_id
+        WHERE ps.sku_id = p_sku_id;
+
+        SELECT * INTO v_threshold
+        FROM get_category_threshold(v_category_id);
+    END IF;
+
+    -- 根据阈值判断等级
+    RETURN classify_variance_level(
+        p_variance_rate,
+        v_threshold.warning_upper,
+        v_threshold.critical_upper,
+        v_threshold.warning_lower,
+        v_threshold.critical_lower
+    );
+END;
 $$ LANGUAGE plpgsql;
 
 -- ----------------------------------------------------------------------------
 -- 函数：获取单位换算系数
+-- 返回不限精度的 DECIMAL (同 convert_unit), 多级换算系数不截断到4位小数
+-- 旧版本返回 DECIMAL(10,4), 返回类型不同不能直接 REPLACE
 -- ----------------------------------------------------------------------------
+DROP FUNCTION IF EXISTS get_unit_conversion_factor(INT, INT, INT);
+
 CREATE OR REPLACE FUNCTION get_unit_conversion_factor(
     p_from_unit_id INT,
     p_to_unit_id INT,
     p_product_id INT DEFAULT NULL
-) RETURNS DECIMAL(10,4) AS $$
+) RETURNS DECIMAL AS $$
 DECLARE
-    v_factor DECIMAL(10,4);
+    v_factor DECIMAL;
 BEGIN
     -- 相同单位无需换算
     IF p_from_unit_id = p_to_unit_id THEN
         RETURN 1.0;
     END IF;
 
-    -- 先尝试产品特定换算
-    IF p_product_id IS NOT NULL THEN
-        SELECT conversion_factor INTO v_factor
-        FROM unit_conversion
-        WHERE from_unit_id = p_from_unit_id
-          AND to_unit_id = p_to_unit_id
-          AND product_id = p_product_id;
-
-        IF v_factor IS NOT NULL THEN
-            RETURN v_factor;
-        END IF;
-    END IF;
-
-    -- 使用通用换算
+    -- 从换算闭包一次查询: 产品特定换算优先, 其次通用换算 (支持 箱→包→g 等多级换算)
     SELECT conversion_factor INTO v_factor
-    FROM unit_conversion
+    FROM unit_conversion_closure
     WHERE from_unit_id = p_from_unit_id
       AND to_unit_id = p_to_unit_id
-      AND product_id IS NULL;
+      AND (product_id = p_product_id OR product_id IS NULL)
+    ORDER BY product_id NULLS LAST
+    LIMIT 1;
 
     RETURN v_factor;
 END;
@@ -207,6 +397,28 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- ----------------------------------------------------------------------------
+-- 函数：解密产品标准价格
+-- ----------------------------------------------------------------------------
+-- 解密出错 (密钥未配置、密文损坏、超出精度) 时返回NULL, 标准价留空而不中断写入
+-- 逐行触发器与批量重算 recalc_purchase_price_fields 共用, 两者结果一致
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION decrypt_standard_price(
+    p_encrypted BYTEA
+) RETURNS DECIMAL(10,4) AS $$
+BEGIN
+    IF p_encrypted IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- decrypt_cost 在会话解密缓存开启时直接读缓存
+    RETURN decrypt_cost(p_encrypted)::DECIMAL(10,4);
+EXCEPTION
+    WHEN OTHERS THEN
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
 -- ============================================================================
 -- 第三部分: 核心触发器函数
 -- ============================================================================
@@ -224,8 +436,15 @@ DECLARE
     v_standard_price DECIMAL(10,4);
     v_variance DECIMAL(10,4);
     v_variance_rate DECIMAL(6,2);
-    v_conversion_factor DECIMAL(10,4);
+    v_conversion_factor DECIMAL;
 BEGIN
+    -- 0. 批量重算 (recalc_purchase_price_fields) 已在语句中算好全部字段, 跳过逐行计算
+    --    批量导入模式下的插入由语句级触发器 trg_spp_bulk_calc 统一计算
+    IF current_setting('app.spp_bulk_calc', true) = 'on'
+       OR (TG_OP = 'INSERT' AND current_setting('app.spp_bulk_load', true) = 'on') THEN
+        RETURN NEW;
+    END IF;
+
     -- 1. 获取SKU信息
     SELECT
         ps.sku_id,
@@ -273,18 +492,8 @@ BEGIN
     NEW.base_unit_price := v_base_unit_price;
     NEW.base_unit_id := v_product.base_unit_id;
 
-    -- 4. 获取标准价格（从product表解密）
-    BEGIN
-        IF v_product.current_cost_encrypted IS NOT NULL THEN
-            v_standard_price := pgp_sym_decrypt(
-                v_product.current_cost_encrypted,
-                COALESCE(current_setting('app.encryption_key', true), '')
-            )::DECIMAL(10,4);
-        END IF;
-    EXCEPTION
-        WHEN OTHERS THEN
-            v_standard_price := NULL;
-    END;
+    -- 4. 获取标准价格（从product表解密, 解密失败为NULL）
+    v_standard_price := decrypt_standard_price(v_product.current_cost_encrypted);
 
     NEW.standard_price := v_standard_price;
 
@@ -326,6 +535,43 @@ CREATE TRIGGER trg_spp_auto_calc
     FOR EACH ROW
     EXECUTE FUNCTION trg_purchase_price_auto_calc();
 
+-- ----------------------------------------------------------------------------
+-- 触发器函数：批量导入时按语句计算采购价格字段
+-- ----------------------------------------------------------------------------
+-- 用于供应商价格表等大批量导入, 在事务中开启:
+--   SET LOCAL app.spp_bulk_load = 'on';
+-- 之后的 INSERT / COPY 跳过逐行计算, 由本触发器对整批新记录做一次集合计算
+-- 界面单条录入/修改不开启该模式, 仍走逐行触发器
+-- 标准价同样经 decrypt_standard_price 解密: 会话未配置密钥或密文损坏时该记录标准价为NULL,
+-- 整批照常写入, 与逐行触发器一致 (可用 check_purchase_price_bulk_calc 核对)
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION trg_purchase_price_bulk_calc()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_price_ids BIGINT[];
+BEGIN
+    IF COALESCE(current_setting('app.spp_bulk_load', true), '') <> 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT array_agg(n.price_id) INTO v_price_ids
+    FROM new_prices n;
+
+    IF v_price_ids IS NOT NULL THEN
+        PERFORM recalc_purchase_price_fields(NULL, NULL, FALSE, v_price_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_spp_bulk_calc ON store_purchase_price;
+
+CREATE TRIGGER trg_spp_bulk_calc
+    AFTER INSERT ON store_purchase_price
+    REFERENCING NEW TABLE AS new_prices
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION trg_purchase_price_bulk_calc();
+
 -- ============================================================================
 -- 第四部分: SKU表触发器
 -- ============================================================================
@@ -335,12 +581,31 @@ CREATE TRIGGER trg_spp_auto_calc
 -- ----------------------------------------------------------------------------
 CREATE OR REPLACE FUNCTION trg_sku_calc_base_price()
 RETURNS TRIGGER AS $$
+DECLARE
+    v_base_unit_id INT;
+    v_conversion_factor DECIMAL;
 BEGIN
     -- 如果有参考价格和基础单位数量，自动计算基础单位价格
     IF NEW.reference_price IS NOT NULL
        AND NEW.base_unit_quantity IS NOT NULL
        AND NEW.base_unit_quantity > 0 THEN
         NEW.reference_base_unit_price := NEW.reference_price / NEW.base_unit_quantity;
+    ELSIF NEW.reference_price IS NOT NULL
+          AND NEW.reference_price_unit_id IS NOT NULL THEN
+        -- 没有基础单位数量时, 按参考价格单位换算到产品基础单位 (支持多级换算)
+        SELECT p.base_unit_id INTO v_base_unit_id
+        FROM product p
+        WHERE p.product_id = NEW.product_id;
+
+        v_conversion_factor := get_unit_conversion_factor(
+            NEW.reference_price_unit_id,
+            v_base_unit_id,
+            NEW.product_id
+        );
+
+        IF v_conversion_factor IS NOT NULL AND v_conversion_factor > 0 THEN
+            NEW.reference_base_unit_price := NEW.reference_price / v_conversion_factor;
+        END IF;
     END IF;
 
     -- 更新时间戳
@@ -375,69 +640,289 @@ AS $$
 DECLARE
     v_affected_count INT;
 BEGIN
-    -- 更新所有相关记录的标准价格和差异
-    UPDATE store_purchase_price spp
-    SET
-        standard_price = (
-            SELECT
-                CASE
-                    WHEN p.current_cost_encrypted IS NOT NULL THEN
-                        pgp_sym_decrypt(
-                            p.current_cost_encrypted,
-                            COALESCE(current_setting('app.encryption_key', true), '')
-                        )::DECIMAL(10,4)
-                    ELSE NULL
-                END
-            FROM product_sku ps
-            JOIN product p ON ps.product_id = p.product_id
-            WHERE ps.sku_id = spp.sku_id
-        ),
-        price_variance = NULL,  -- 触发器会重新计算
-        variance_rate = NULL,
-        variance_level = NULL,
-        updated_at = NOW()
-    WHERE (p_product_id IS NULL
-           OR EXISTS (
-               SELECT 1 FROM product_sku ps
-               WHERE ps.sku_id = spp.sku_id AND ps.product_id = p_product_id
-           ));
-
-    GET DIAGNOSTICS v_affected_count = ROW_COUNT;
+    -- 每个产品的标准价解密一次, 一次更新标准价格和差异 (不再逐行进入触发器)
+    -- 标准价缺失时差异字段清空
+    v_affected_count := recalc_purchase_price_fields(NULL, p_product_id, TRUE);
 
     RAISE NOTICE '已更新 % 条采购价格记录的标准价格差异', v_affected_count;
 END;
 $$;
 
+-- ----------------------------------------------------------------------------
+-- 函数：批量重算采购价格字段（集合运算）
+-- ----------------------------------------------------------------------------
+-- 计算结果与 trg_purchase_price_auto_calc 逐行计算一致:
+--   基础单位价格、标准价格、差异、差异率、差异等级、包装规格/品牌补全
+-- 每个产品的标准价只解密一次, 阈值取自SKU阈值映射, 一条UPDATE写回全部记录
+-- 可按门店或产品分片, 不同分片可在多个会话中并行执行
+-- 参数: p_clear_unresolved - 无法计算差异时清空差异字段 (默认与触发器一致, 保留原值)
+--       p_inserted_ids - 只计算这些新插入的记录, 不修改 updated_at (与插入时的触发器一致)
+-- 返回: 更新的记录数
+-- ----------------------------------------------------------------------------
+DROP FUNCTION IF EXISTS recalc_purchase_price_fields(INT, INT);
+DROP FUNCTION IF EXISTS recalc_purchase_price_fields(INT, INT, BOOLEAN);
+
+CREATE OR REPLACE FUNCTION recalc_purchase_price_fields(
+    p_store_id INT DEFAULT NULL,
+    p_product_id INT DEFAULT NULL,
+    p_clear_unresolved BOOLEAN DEFAULT FALSE,
+    p_inserted_ids BIGINT[] DEFAULT NULL
+) RETURNS INT AS $$
+DECLARE
+    v_count INT;
+    v_missing_sku_ids INT[];
+BEGIN
+    -- 补齐阈值映射中缺少的SKU
+    SELECT array_agg(ps.sku_id) INTO v_missing_sku_ids
+    FROM product_sku ps
+    WHERE NOT EXISTS (
+        SELECT 1 FROM sku_variance_threshold t WHERE t.sku_id = ps.sku_id
+    );
+
+    IF v_missing_sku_ids IS NOT NULL THEN
+        PERFORM refresh_sku_variance_threshold(v_missing_sku_ids);
+    END IF;
+
+    -- 本事务内跳过逐行触发器计算
+    PERFORM set_config('app.spp_bulk_calc', 'on', true);
+
+    WITH target AS (
+        SELECT
+            spp.price_id,
+            spp.purchase_price,
+            spp.purchase_unit_id,
+            ps.product_id,
+            COALESCE(ps.base_unit_quantity, 0) AS base_unit_quantity,
+            ps.package_spec,
+            ps.brand_name,
+            thr.warning_upper_rate,
+            thr.critical_upper_rate,
+            thr.warning_lower_rate,
+            thr.critical_lower_rate
+        FROM store_purchase_price spp
+        LEFT JOIN product_sku ps ON ps.sku_id = spp.sku_id
+        LEFT JOIN sku_variance_threshold thr ON thr.sku_id = spp.sku_id
+        WHERE (p_store_id IS NULL OR spp.store_id = p_store_id)
+          AND (p_product_id IS NULL OR ps.product_id = p_product_id)
+          AND (p_inserted_ids IS NULL OR spp.price_id = ANY(p_inserted_ids))
+    ),
+    -- 工作集: 每个产品解密一次标准价 (解密失败为NULL, 与逐行触发器一致)
+    standard AS MATERIALIZED (
+        SELECT
+            p.product_id,
+            p.base_unit_id,
+            decrypt_standard_price(p.current_cost_encrypted) AS standard_price
+        FROM product p
+        WHERE p.product_id IN (SELECT product_id FROM target)
+    ),
+    priced AS (
+        SELECT
+            t.price_id,
+            t.package_spec,
+            t.brand_name,
+            s.base_unit_id,
+            s.standard_price,
+            t.warning_upper_rate,
+            t.critical_upper_rate,
+            t.warning_lower_rate,
+            t.critical_lower_rate,
+            CASE
+                WHEN t.base_unit_quantity > 0
+                    THEN (t.purchase_price / t.base_unit_quantity)::DECIMAL(10,6)
+                WHEN cf.factor > 0
+                    THEN (t.purchase_price / cf.factor)::DECIMAL(10,6)
+            END AS base_unit_price
+        FROM target t
+        LEFT JOIN standard s ON s.product_id = t.product_id
+        LEFT JOIN LATERAL (
+            -- 仅SKU缺少基础单位数量时才需要单位换算 (规则同 get_unit_conversion_factor)
+            SELECT
+                CASE
+                    WHEN t.purchase_unit_id = s.base_unit_id THEN 1.0
+                    ELSE (
+                        SELECT ucc.conversion_factor
+                        FROM unit_conversion_closure ucc
+                        WHERE ucc.from_unit_id = t.purchase_unit_id
+                          AND ucc.to_unit_id = s.base_unit_id
+                          AND (ucc.product_id = s.product_id OR ucc.product_id IS NULL)
+                        ORDER BY ucc.product_id NULLS LAST
+                        LIMIT 1
+                    )
+                END AS factor
+            WHERE NOT (t.base_unit_quantity > 0)
+        ) cf ON TRUE
+    ),
+    variance AS (
+        SELECT
+            pr.*,
+            (pr.base_unit_price - pr.standard_price)::DECIMAL(10,4) AS price_variance
+        FROM priced pr
+    ),
+    calc AS (
+        SELECT
+            v.*,
+            CASE
+                WHEN v.standard_price > 0 AND v.base_unit_price IS NOT NULL
+                    THEN (v.price_variance / v.standard_price * 100)::DECIMAL(6,2)
+            END AS variance_rate
+        FROM variance v
+    )
+    UPDATE store_purchase_price spp
+    SET
+        base_unit_price = c.base_unit_price,
+        base_unit_id = c.base_unit_id,
+        standard_price = c.standard_price,
+        -- 无法计算差异时保留原值 (与触发器一致) 或清空
+        price_variance = CASE
+            WHEN c.variance_rate IS NOT NULL THEN c.price_variance
+            WHEN NOT p_clear_unresolved THEN spp.price_variance
+        END,
+        variance_rate = CASE
+            WHEN c.variance_rate IS NOT NULL THEN c.variance_rate
+            WHEN NOT p_clear_unresolved THEN spp.variance_rate
+        END,
+        variance_level = CASE
+            WHEN c.variance_rate IS NULL THEN
+                CASE WHEN NOT p_clear_unresolved THEN spp.variance_level END
+            ELSE classify_variance_level(
+                c.variance_rate,
+                c.warning_upper_rate,
+                c.critical_upper_rate,
+                c.warning_lower_rate,
+                c.critical_lower_rate
+            )
+        END,
+        package_spec = COALESCE(spp.package_spec, c.package_spec),
+        brand_name = COALESCE(spp.brand_name, c.brand_name),
+        updated_at = CASE WHEN p_inserted_ids IS NULL THEN NOW() ELSE spp.updated_at END
+    FROM calc c
+    WHERE spp.price_id = c.price_id;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    PERFORM set_config('app.spp_bulk_calc', 'off', true);
+
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION recalc_purchase_price_fields(INT, INT, BOOLEAN, BIGINT[]) IS
+    '批量重算采购价格字段 - 集合运算, 可按门店/产品分片并行';
+
 -- ----------------------------------------------------------------------------
 -- 过程：重新计算所有价格差异（数据修复用）
 -- ----------------------------------------------------------------------------
-CREATE OR REPLACE PROCEDURE recalc_all_variance()
+-- 参数: p_store_id / p_product_id - 分片条件, 为NULL时处理全部记录
+--       大表可按门店分别在多个会话中执行, 如 CALL recalc_all_variance(1);
+-- ----------------------------------------------------------------------------
+DROP PROCEDURE IF EXISTS recalc_all_variance();
+
+CREATE OR REPLACE PROCEDURE recalc_all_variance(
+    p_store_id INT DEFAULT NULL,
+    p_product_id INT DEFAULT NULL
+)
 LANGUAGE plpgsql
 AS $$
 DECLARE
-    v_rec RECORD;
-    v_count INT := 0;
+    v_count INT;
 BEGIN
-    -- 遍历所有采购价格记录，触发重新计算
-    FOR v_rec IN
-        SELECT price_id FROM store_purchase_price
-    LOOP
-        UPDATE store_purchase_price
-        SET updated_at = NOW()  -- 触发触发器重新计算
-        WHERE price_id = v_rec.price_id;
-
-        v_count := v_count + 1;
-
-        -- 每1000条提交一次
-        IF v_count % 1000 = 0 THEN
-            RAISE NOTICE '已处理 % 条记录...', v_count;
-        END IF;
-    END LOOP;
+    v_count := recalc_purchase_price_fields(p_store_id, p_product_id);
 
     RAISE NOTICE '完成，共处理 % 条记录', v_count;
 END;
 $$;
 
+-- ----------------------------------------------------------------------------
+-- 函数：核对批量计算与逐行触发器的结果
+-- ----------------------------------------------------------------------------
+-- 同一批记录先由逐行触发器计算, 再由 recalc_purchase_price_fields 计算 (批量导入模式使用同一函数),
+-- 返回两者不一致的字段; 计算在子事务中进行并回滚, 不修改数据
+-- 在未设置 app.encryption_key 的会话中执行, 可核对解密失败时两条路径都写入NULL标准价
+-- 示例: SELECT * FROM check_purchase_price_bulk_calc(1);
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION check_purchase_price_bulk_calc(
+    p_store_id INT DEFAULT NULL,
+    p_product_id INT DEFAULT NULL
+) RETURNS TABLE (
+    price_id BIGINT,
+    field_name TEXT,
+    row_value TEXT,
+    bulk_value TEXT
+) AS $$
+DECLARE
+    v_row_result JSONB;
+    v_bulk_result JSONB;
+    v_done BOOLEAN := FALSE;
+BEGIN
+    BEGIN
+        -- 逐行: 原值更新触发 trg_spp_auto_calc
+        UPDATE store_purchase_price spp
+        SET purchase_price = spp.purchase_price
+        WHERE (p_store_id IS NULL OR spp.store_id = p_store_id)
+          AND (p_product_id IS NULL OR spp.sku_id IN (
+              SELECT ps.sku_id FROM product_sku ps WHERE ps.product_id = p_product_id
+          ));
+
+        SELECT jsonb_object_agg(spp.price_id, jsonb_build_object(
+            'base_unit_price', spp.base_unit_price,
+            'base_unit_id', spp.base_unit_id,
+            'standard_price', spp.standard_price,
+            'price_variance', spp.price_variance,
+            'variance_rate', spp.variance_rate,
+            'variance_level', spp.variance_level
+        ))
+        INTO v_row_result
+        FROM store_purchase_price spp
+        WHERE (p_store_id IS NULL OR spp.store_id = p_store_id)
+          AND (p_product_id IS NULL OR spp.sku_id IN (
+              SELECT ps.sku_id FROM product_sku ps WHERE ps.product_id = p_product_id
+          ));
+
+        -- 批量: 在逐行结果上重算, 无法计算差异时两者都保留原值
+        PERFORM recalc_purchase_price_fields(p_store_id, p_product_id);
+
+        SELECT jsonb_object_agg(spp.price_id, jsonb_build_object(
+            'base_unit_price', spp.base_unit_price,
+            'base_unit_id', spp.base_unit_id,
+            'standard_price', spp.standard_price,
+            'price_variance', spp.price_variance,
+            'variance_rate', spp.variance_rate,
+            'variance_level', spp.variance_level
+        ))
+        INTO v_bulk_result
+        FROM store_purchase_price spp
+        WHERE (p_store_id IS NULL OR spp.store_id = p_store_id)
+          AND (p_product_id IS NULL OR spp.sku_id IN (
+              SELECT ps.sku_id FROM product_sku ps WHERE ps.product_id = p_product_id
+          ));
+
+        -- 抛出异常回滚子事务内的全部修改
+        v_done := TRUE;
+        RAISE EXCEPTION 'check_purchase_price_bulk_calc rollback';
+    EXCEPTION
+        WHEN OTHERS THEN
+            IF NOT v_done THEN
+                RAISE;
+            END IF;
+    END;
+
+    RETURN QUERY
+    SELECT
+        r.key::BIGINT,
+        f.key,
+        f.value #>> '{}',
+        b.value -> f.key #>> '{}'
+    FROM jsonb_each(COALESCE(v_row_result, '{}'::JSONB)) r
+    JOIN jsonb_each(COALESCE(v_bulk_result, '{}'::JSONB)) b ON b.key = r.key
+    CROSS JOIN LATERAL jsonb_each(r.value) f
+    WHERE f.value IS DISTINCT FROM b.value -> f.key
+    ORDER BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION check_purchase_price_bulk_calc(INT, INT) IS
+    '核对批量计算与逐行触发器结果 - 返回不一致的字段, 不修改数据';
+
 -- ============================================================================
 -- 第六部分: 预警阈值管理函数
 -- ============================================================================
@@ -454,7 +939,7 @@ CREATE OR REPLACE FUNCTION set_category_threshold(
     p_critical_lower DECIMAL(5,2)
 ) RETURNS BOOLEAN AS $$
 BEGIN
-    -- 使用UPSERT
+    -- 使用UPSERT (阈值表触发器自动刷新SKU阈值映射)
     INSERT INTO price_variance_threshold (
         category_id, category_name,
         warning_upper_rate, critical_upper_rate,
@@ -525,6 +1010,9 @@ BEGIN
     RAISE NOTICE '品类阈值初始化完成';
 END $$;
 
+-- 初始化SKU阈值映射
+SELECT refresh_sku_variance_threshold();
+
 -- ============================================================================
 -- 脚本完成
 -- ============================================================================
@@ -544,10 +1032,26 @@ END $$;
 -- 3. 刷新特定产品的价格差异:
 --    CALL refresh_price_variance(123);  -- 产品ID
 --
--- 4. 设置品类阈值:
+-- 4. 批量重算全部价格字段（可按门店分片并行）:
+--    CALL recalc_all_variance();
+--    CALL recalc_all_variance(1);       -- 仅门店1
+--    CALL recalc_all_variance(NULL, 123);  -- 仅产品123
+--
+-- 5. 大批量导入采购价格（整批一次计算, 不逐行触发）:
+--    BEGIN;
+--    SET LOCAL app.spp_bulk_load = 'on';
+--    COPY store_purchase_price (store_id, sku_id, price_date, purchase_price, purchase_unit_id, source_type)
+--        FROM '/path/to/prices.csv' WITH (FORMAT csv, HEADER);   -- 或 INSERT ... SELECT
+--    COMMIT;
+--
+-- 6. 设置品类阈值:
 --    SELECT set_category_threshold(1, '肉类', 15.00, 25.00, -10.00, -15.00);
 --
--- 5. 查询品类阈值:
+-- 7. 查询品类阈值:
 --    SELECT * FROM get_category_threshold(1);
 --
+-- 8. 查询SKU生效阈值 / 手动全量刷新映射:
+--    SELECT * FROM sku_variance_threshold WHERE sku_id = 101;
+--    SELECT refresh_sku_variance_threshold();
+--
 -- ============================================================================
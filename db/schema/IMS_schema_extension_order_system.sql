@@ -3,7 +3,7 @@
 -- ============================================================================
 -- 版本: v1.0.1-order-extension (Supabase兼容版)
 -- 目的: 支持16项运营指标 + 多渠道销售 + 平台团购
--- 新增表: 6张 (按依赖顺序排列)
+-- 新增表: 7张 (按依赖顺序排列)
 -- 修复: 表创建顺序调整，确保外键引用正确
 -- ============================================================================
 
@@ -257,6 +257,53 @@ COMMENT ON TABLE sales_order_item IS '订单明细表 - 记录订单中每个产
 COMMENT ON COLUMN sales_order_item.standard_cost_rate IS '标准成本率 = 理论成本 / 销售额(折前) × 100%';
 COMMENT ON COLUMN sales_order_item.actual_cost_rate IS '实际成本率 = 理论成本 / 菜品收入(折后) × 100% ⭐核心';
 
+-- ----------------------------------------------------------------------------
+-- 7. store_daily_operations_summary - 门店每日营业汇总表 (依赖store)
+-- ----------------------------------------------------------------------------
+-- 说明: POS综合营业统计导出的每店每日汇总, 含支付方式和团购核销分解
+--       只有汇总导出(无订单明细)的期间, 日报看板直接读取本表
+-- ----------------------------------------------------------------------------
+CREATE TABLE store_daily_operations_summary (
+    summary_id BIGSERIAL PRIMARY KEY,
+    store_id INT NOT NULL,
+    order_date DATE NOT NULL,
+    -- 基础运营指标
+    order_count INT,
+    guest_count INT,
+    table_count INT,
+    avg_dining_duration DECIMAL(8,2),
+    presales_amount DECIMAL(12,2),
+    final_amount DECIMAL(12,2),
+    discount_amount DECIMAL(12,2),
+    manual_discount DECIMAL(12,2),
+    coupon_discount DECIMAL(12,2),
+    membership_discount DECIMAL(12,2),
+    rounding_amount DECIMAL(12,2),
+    -- 支付方式分解
+    cash_amount DECIMAL(12,2),
+    wechat_amount DECIMAL(12,2),
+    alipay_amount DECIMAL(12,2),
+    card_amount DECIMAL(12,2),
+    member_balance_amount DECIMAL(12,2),
+    -- 团购核销分解
+    meituan_groupbuy_amount DECIMAL(12,2),
+    douyin_groupbuy_amount DECIMAL(12,2),
+    -- 来源
+    source_file VARCHAR(500),
+    batch_id UUID,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP,
+    CONSTRAINT fk_daily_summary_store FOREIGN KEY (store_id)
+        REFERENCES store(store_id),
+    CONSTRAINT uk_daily_summary_store_date UNIQUE (store_id, order_date)
+);
+
+CREATE INDEX idx_daily_summary_date ON store_daily_operations_summary(order_date DESC);
+
+COMMENT ON TABLE store_daily_operations_summary IS '门店每日营业汇总表 - POS综合营业统计导入, 每店每日一行';
+COMMENT ON COLUMN store_daily_operations_summary.final_amount IS '实收金额(折后)';
+COMMENT ON COLUMN store_daily_operations_summary.batch_id IS '最近一次写入该行的导入批次';
+
 -- ----------------------------------------------------------------------------
 -- 触发器: 自动计算订单明细成本率
 -- ----------------------------------------------------------------------------
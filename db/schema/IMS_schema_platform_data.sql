@@ -181,6 +181,7 @@ CREATE TABLE IF NOT EXISTS platform_daily_metrics (
     ranking_sales INT,                              -- 销量榜排名 (点评销量榜)
 
     -- 元数据
+    row_fingerprint CHAR(32),                       -- 指标值指纹 (md5), 导入时只更新指纹变化的行
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP,
 
@@ -189,6 +190,9 @@ CREATE TABLE IF NOT EXISTS platform_daily_metrics (
     CONSTRAINT uk_platform_daily UNIQUE (report_date, store_id, platform_id)
 );
 
+-- 已有库升级: 补充指纹列
+ALTER TABLE platform_daily_metrics ADD COLUMN IF NOT EXISTS row_fingerprint CHAR(32);
+
 -- 创建索引
 CREATE INDEX IF NOT EXISTS idx_pdm_date ON platform_daily_metrics(report_date);
 CREATE INDEX IF NOT EXISTS idx_pdm_store ON platform_daily_metrics(store_id);
@@ -234,7 +238,37 @@ JOIN online_platform op ON pdm.platform_id = op.platform_id
 GROUP BY DATE_TRUNC('month', report_date), s.store_name, op.platform_name
 ORDER BY report_month DESC, s.store_name, op.platform_name;
 
+-- 5. 平台数据导入台账 (增量导入: 跳过未变化的文件和数据段)
+CREATE TABLE IF NOT EXISTS platform_import_ledger (
+    ledger_id SERIAL PRIMARY KEY,
+    source_file VARCHAR(255) NOT NULL,              -- 源文件名 (如 美团1-3月.xlsx)
+    file_hash CHAR(64) NOT NULL,                    -- 文件内容 SHA-256
+    -- 数据段字段: 文件没有可导入的门店数据时只记一行文件哈希, 数据段字段均为NULL
+    store_id INT,                                   -- 门店ID
+    platform_id INT,                                -- 平台ID
+    date_from DATE,                                 -- 该数据段最早统计日期
+    date_to DATE,                                   -- 该数据段最晚统计日期
+    row_count INT,                                  -- 该数据段行数
+    segment_hash CHAR(64),                          -- 该数据段解析后内容哈希
+    imported_at TIMESTAMP DEFAULT NOW(),
+
+    CONSTRAINT uk_import_ledger UNIQUE (source_file, store_id, platform_id)
+);
+
+-- 已有库升级: 允许只记文件哈希的空文件记录
+ALTER TABLE platform_import_ledger
+    ALTER COLUMN store_id DROP NOT NULL,
+    ALTER COLUMN platform_id DROP NOT NULL,
+    ALTER COLUMN date_from DROP NOT NULL,
+    ALTER COLUMN date_to DROP NOT NULL,
+    ALTER COLUMN row_count DROP NOT NULL,
+    ALTER COLUMN segment_hash DROP NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_pil_file_hash ON platform_import_ledger(file_hash);
+
 COMMENT ON TABLE online_platform IS '线上平台定义表';
 COMMENT ON TABLE store_platform_account IS '门店平台账号关联表';
 COMMENT ON TABLE platform_daily_metrics IS '平台日运营数据主表 - 存储美团/点评等平台的日粒度运营数据';
 COMMENT ON VIEW v_platform_monthly_summary IS '平台月度汇总视图';
+COMMENT ON COLUMN platform_daily_metrics.row_fingerprint IS '指标值指纹 - md5(ROW(非主键字段)::text), 为NULL表示需在下次批量导入时重算';
+COMMENT ON TABLE platform_import_ledger IS '平台数据导入台账 - 按文件哈希和(门店, 平台, 日期范围)数据段记录已导入内容';
@@ -7,12 +7,82 @@
 支持: 16项运营指标 + 多渠道销售 + 平台团购
 """
 
+import numpy as np
 import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
 from uuid import uuid4
 from datetime import datetime
 import json
 import re
+from decimal import Decimal
+from functools import partial
+
+from utils.import_pipeline import run_pipeline, print_pipeline_stats
+from utils.sheet_stream import iter_excel_chunks
+
+# 订单主表/明细表写入字段
+ORDER_COLUMNS = [
+    'order_code', 'store_id', 'order_date', 'order_datetime', 'order_type', 'sales_channel',
+    'table_number', 'guest_count', 'seat_time', 'leave_time',
+    'subtotal_amount', 'discount_amount', 'final_amount',
+    'payment_method', 'platform_type', 'order_status'
+]
+ORDER_ITEM_COLUMNS = [
+    'order_id', 'product_id', 'product_code', 'product_name',
+    'quantity', 'unit_price', 'discount_rate', 'actual_price',
+    'line_subtotal', 'line_discount', 'line_total',
+    'recipe_id', 'recipe_version', 'theoretical_cost'
+]
+
+# 订单明细表按文本读取的列: 编码列由pandas推断类型时, 含空单元格的分块会把 1002 读成 '1002.0'
+ORDER_SHEET_DTYPE = {'订单编号': str, '产品编码': str}
+
+# 每批写入并提交的订单数
+ORDER_BATCH_SIZE = 500
+
+# 综合营业统计Excel字段 → store_daily_operations_summary字段
+DAILY_SUMMARY_COLUMN_MAPPING = {
+    '单量': 'order_count',
+    '人数': 'guest_count',
+    '开台数': 'table_count',
+    '平均用餐时长(分钟)': 'avg_dining_duration',
+    '销售额': 'presales_amount',
+    '实收金额': 'final_amount',
+    '折扣合计': 'discount_amount',
+    '人工折扣': 'manual_discount',
+    '优惠券折扣': 'coupon_discount',
+    '会员折扣': 'membership_discount',
+    '抹零': 'rounding_amount',
+    # 支付方式
+    '现金收入': 'cash_amount',
+    '微信收入': 'wechat_amount',
+    '支付宝收入': 'alipay_amount',
+    '刷卡收入': 'card_amount',
+    '会员卡收入': 'member_balance_amount',
+    # 团购平台
+    '美团团购核销': 'meituan_groupbuy_amount',
+    '抖音团购核销': 'douyin_groupbuy_amount',
+}
+
+# 产品及其当前已审核配方 (与逐行查询一致: is_current且approved, 取任意一条)
+PRODUCT_LOOKUP_SQL = """
+    SELECT p.product_code, p.product_id, r.recipe_id, r.recipe_version
+    FROM product p
+    LEFT JOIN LATERAL (
+        SELECT recipe_id, recipe_version
+        FROM recipe
+        WHERE product_id = p.product_id
+          AND is_current = TRUE
+          AND status = 'approved'
+        LIMIT 1
+    ) r ON TRUE
+"""
+
+
+def read_order_sheet(excel_file, sheet_name='订单明细'):
+    """整表读取订单明细工作表 (可在子进程中运行)"""
+    return pd.read_excel(excel_file, sheet_name=sheet_name, dtype=ORDER_SHEET_DTYPE)
 
 
 class ExcelToOrderSystem:
@@ -24,9 +94,19 @@ class ExcelToOrderSystem:
         self.batch_id = str(uuid4())
         self.cursor = self.conn.cursor()
 
-    def import_daily_operations_data(self, excel_file, sheet_name='综合营业统计'):
+        # 主数据查找缓存: product_code → (product_id, recipe_id, recipe_version)
+        self._product_lookup = None
+        self.lookup_stats = {'hit': 0, 'miss': 0}
+
+        # 单位理论成本缓存: (product_id, recipe_version) → 1份的BOM成本
+        self._unit_cost_cache = {}
+
+    def import_daily_operations_data(self, excel_file, sheet_name='综合营业统计', store_id=1,
+                                     page_size=ORDER_BATCH_SIZE):
         """
-        导入POS系统综合营业统计数据
+        导入POS系统综合营业统计数据到 store_daily_operations_summary
+
+        每店每日一行, 按 (store_id, order_date) 多行UPSERT, 重复导入同一文件时覆盖为最新值
 
         Excel字段映射(基于实际Excel文件):
         - 日期 → order_date
@@ -41,8 +121,9 @@ class ExcelToOrderSystem:
         - 优惠券折扣 → coupon_discount
         - 会员折扣 → membership_discount
         - 抹零 → rounding_amount
-        - 现金收入/扫码支付收入/会员卡收入等 → 支付方式分类统计
+        - 现金收入/微信收入/支付宝收入/刷卡收入/会员卡收入 → 支付方式分类统计
         - 美团团购核销/抖音团购核销 → 团购平台数据
+        完整映射见 DAILY_SUMMARY_COLUMN_MAPPING
         """
         print(f"📥 开始导入综合营业统计数据: {excel_file}")
 
@@ -58,67 +139,60 @@ class ExcelToOrderSystem:
         if missing_columns:
             raise ValueError(f"缺少必需字段: {missing_columns}")
 
-        # 处理每一天的汇总数据
-        imported_count = 0
-        for idx, row in df.iterrows():
-            try:
-                # 提取基础信息
-                order_date = pd.to_datetime(row['日期']).date()
-
-                # 创建每日汇总记录(为了演示,这里简化处理)
-                # 实际生产环境应该从订单明细数据导入
-                order_data = {
-                    'order_date': order_date,
-                    'order_count': row.get('单量', 0),
-                    'guest_count': row.get('人数', 0),
-                    'table_count': row.get('开台数', 0),
-                    'avg_dining_duration': row.get('平均用餐时长(分钟)', 0),
-                    'presales_amount': row.get('销售额', 0),
-                    'final_amount': row.get('实收金额', 0),
-                    'discount_amount': row.get('折扣合计', 0),
-                    'manual_discount': row.get('人工折扣', 0),
-                    'coupon_discount': row.get('优惠券折扣', 0),
-                    'membership_discount': row.get('会员折扣', 0),
-                    'rounding_amount': row.get('抹零', 0),
-                }
-
-                # 支付方式统计
-                payment_stats = {
-                    'cash': row.get('现金收入', 0),
-                    'wechat': row.get('微信收入', 0),
-                    'alipay': row.get('支付宝收入', 0),
-                    'card': row.get('刷卡收入', 0),
-                    'member_balance': row.get('会员卡收入', 0),
-                }
-
-                # 团购平台统计
-                groupbuy_stats = {
-                    'meituan': row.get('美团团购核销', 0),
-                    'douyin': row.get('抖音团购核销', 0),
-                }
-
-                # 这里需要实现实际的订单拆分逻辑
-                # 由于Excel是汇总数据,需要根据业务规则拆分成订单明细
-                # 示例: 创建一个占位订单(实际应该从POS原始订单数据导入)
-
-                print(f"✓ 处理日期: {order_date}, 订单数: {order_data['order_count']}, "
-                      f"销售额: {order_data['final_amount']}")
-
-                imported_count += 1
-
-            except Exception as e:
-                print(f"❌ 处理第 {idx+2} 行时出错: {e}")
-                continue
+        # 日期列整列解析, 无法解析的行(如合计行)跳过
+        order_date, bad_date = self._parse_datetime_column(df['日期'])
+        valid = order_date.notna()
+        for idx in df.index[bad_date]:
+            print(f"❌ 处理第 {idx+2} 行时出错: 日期无法解析 ({df.at[idx, '日期']})")
+
+        # Excel字段 → 汇总表字段 (缺失的Excel字段按0处理, 无法转为数字的值为NULL)
+        summary = pd.DataFrame({'store_id': store_id, 'order_date': order_date.dt.date}, index=df.index)
+        for excel_col, db_col in DAILY_SUMMARY_COLUMN_MAPPING.items():
+            if excel_col in df.columns:
+                summary[db_col] = pd.to_numeric(df[excel_col], errors='coerce')
+            else:
+                summary[db_col] = 0
+        summary['source_file'] = str(excel_file)
+        summary['batch_id'] = self.batch_id
+
+        # 同一日期出现多行时取最后一行 (一条INSERT ... ON CONFLICT不能两次更新同一行)
+        summary = summary[valid].drop_duplicates('order_date', keep='last')
+
+        for row in summary.itertuples(index=False):
+            print(f"✓ 处理日期: {row.order_date}, 订单数: {row.order_count}, 销售额: {row.final_amount}")
+
+        columns = list(summary.columns)
+        update_clause = ', '.join(
+            f"{col} = EXCLUDED.{col}" for col in columns if col not in ('store_id', 'order_date')
+        )
+        execute_values(
+            self.cursor,
+            f"""
+            INSERT INTO store_daily_operations_summary ({', '.join(columns)})
+            VALUES %s
+            ON CONFLICT (store_id, order_date) DO UPDATE SET
+                {update_clause},
+                updated_at = NOW()
+            """,
+            summary.astype(object).where(summary.notna(), None).values.tolist(),
+            page_size=page_size
+        )
 
         self.conn.commit()
-        print(f"✅ 导入完成: {imported_count} 条记录")
+        print(f"✅ 导入完成: {len(summary)} 条记录")
         return self.batch_id
 
 
-    def import_order_detail_data(self, excel_file, sheet_name='订单明细', store_id=1):
+    def import_order_detail_data(self, excel_file, sheet_name='订单明细', store_id=1, chunk_size=None,
+                                 batch_size=ORDER_BATCH_SIZE):
         """
         导入订单明细数据(如果有订单明细Excel)
 
+        chunk_size: 流式模式每块行数, 为None时一次性读取整个工作表;
+                    全年订单明细等大文件建议使用流式模式, 峰值内存与文件大小无关
+        batch_size: 每批订单数, 每批一条多行INSERT写主表、一条写明细并提交;
+                    order_code已存在的订单跳过, 中断后重新运行即可续传
+
         推荐字段:
         - 订单编号
         - 订单日期时间
@@ -138,149 +212,453 @@ class ExcelToOrderSystem:
         """
         print(f"📥 开始导入订单明细数据: {excel_file}")
 
-        df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        self._load_product_lookup()
+        self._unit_cost_cache = {}
 
-        # 按订单编号分组
-        orders_grouped = df.groupby('订单编号')
+        totals = {'orders': 0, 'items': 0, 'existing': 0, 'failed': 0}
+        for frame in self._iter_order_frames(excel_file, sheet_name, chunk_size):
+            headers, item_frame, failed = self._split_order_frames(frame, store_id)
+            totals['failed'] += failed
+            self._write_order_frames(headers, item_frame, batch_size, totals)
 
-        imported_orders = 0
-        imported_items = 0
+        self._print_order_import_summary(totals)
+        return totals['orders']
+
+
+    def import_order_detail_files(self, excel_files, sheet_name='订单明细', store_id=1,
+                                  batch_size=ORDER_BATCH_SIZE, workers=2, queue_size=2):
+        """
+        多文件导入订单明细 (解析 → 转换 → 写库 流水线)
+
+        - 解析: 子进程中整表读取各文件
+        - 转换: 列式拆分订单主表/明细 (不访问数据库)
+        - 写库: 产品查找、理论成本与分批写入, 只在流水线写库线程中使用本实例的连接
+        前一个文件写库时后续文件仍在解析和转换; 写入规则与 import_order_detail_data 相同
+        """
+        print(f"📥 开始流水线导入订单明细数据: {len(excel_files)} 个文件 (解析进程数: {workers})")
+
+        self._load_product_lookup()
+        self._unit_cost_cache = {}
+
+        totals = {'orders': 0, 'items': 0, 'existing': 0, 'failed': 0}
+
+        def transform(excel_file, frame):
+            return self._split_order_frames(frame, store_id)
+
+        def write(excel_file, split):
+            headers, item_frame, failed = split
+            print(f"📄 {excel_file}: {len(headers)} 个订单")
+            imported = totals['orders']
+            totals['failed'] += failed
+            self._write_order_frames(headers, item_frame, batch_size, totals)
+            return totals['orders'] - imported
+
+        stage_stats, wall_seconds = run_pipeline(
+            excel_files,
+            parse=partial(read_order_sheet, sheet_name=sheet_name),
+            transform=transform,
+            write=write,
+            workers=workers,
+            queue_size=queue_size
+        )
+
+        print_pipeline_stats(stage_stats, wall_seconds)
+        self._print_order_import_summary(totals)
+        return totals['orders']
+
+
+    def _write_order_frames(self, headers, item_frame, batch_size, totals):
+        """解析产品并按batch_size个订单一批写入, 累加到totals"""
+        items, failed_orders = self._resolve_order_items(item_frame)
+        if failed_orders:
+            totals['failed'] += len(failed_orders)
+            headers = headers[~headers['order_code'].isin(list(failed_orders))]
+
+        page = []
+        for order in self._orders_from_frames(headers, items):
+            page.append(order)
+            if len(page) >= batch_size:
+                self._accumulate_page(page, totals)
+                page = []
+                print(f"已导入 {totals['orders']} 个订单...")
+
+        if page:
+            self._accumulate_page(page, totals)
+
+
+    def _accumulate_page(self, page, totals):
+        """写入一批订单并累加统计"""
+        inserted, items, existing, failed = self._write_order_page(page)
+        totals['orders'] += inserted
+        totals['items'] += items
+        totals['existing'] += existing
+        totals['failed'] += failed
+
+
+    def _print_order_import_summary(self, totals):
+        """打印订单导入汇总"""
+        print(f"✅ 导入完成: {totals['orders']} 个订单, {totals['items']} 个明细项")
+        if totals['existing']:
+            print(f"⏩ 已存在订单(跳过): {totals['existing']} 个")
+        if totals['failed']:
+            print(f"❌ 失败订单: {totals['failed']} 个")
+        print(f"📊 产品查找缓存(按明细行): 命中 {self.lookup_stats['hit']} 行, 未命中 {self.lookup_stats['miss']} 行")
+        print(f"📊 BOM分解次数: {len(self._unit_cost_cache)} (按产品+配方版本缓存单位成本)")
+
+
+    def _iter_order_frames(self, excel_file, sheet_name, chunk_size):
+        """
+        产出只包含完整订单的明细行DataFrame
+
+        非流式: 整表一次产出
+        流式: 按块读取, 块末尾的订单可能延续到下一块, 暂存到下一块合并后再产出;
+              要求同一订单的明细行在文件中连续 (POS导出按订单排列)
+        """
+        if chunk_size is None:
+            yield read_order_sheet(excel_file, sheet_name=sheet_name)
+            return
+
+        carry = None
+        for chunk in iter_excel_chunks(excel_file, sheet_name, chunk_size=chunk_size,
+                                       dtype=ORDER_SHEET_DTYPE):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+            if chunk.empty:
+                carry = None
+                continue
 
-        for order_code, order_items in orders_grouped:
+            last_code = chunk['订单编号'].iloc[-1]
+            is_last = chunk['订单编号'] == last_code
+            carry = chunk[is_last]
+
+            yield chunk[~is_last]
+
+        if carry is not None and not carry.empty:
+            yield carry
+
+
+    @staticmethod
+    def _map_column(series, func, map_na=True):
+        """
+        按唯一值调用映射函数 (每个不同取值只映射一次)
+
+        空值: map_na=True 时与逐行调用一致按NaN映射一次, 否则直接为None
+        """
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        na_value = func(np.nan) if map_na and (codes == -1).any() else None
+        lookup = np.array([func(value) for value in uniques] + [na_value], dtype=object)
+        return pd.Series(lookup[codes], index=series.index, dtype=object)
+
+
+    @staticmethod
+    def _parse_datetime_column(series):
+        """
+        整列解析日期时间, 返回 (解析结果, 解析失败的行)
+
+        整列解析失败时按唯一值逐个解析, 只把无法解析的值标为失败
+        """
+        try:
+            return pd.to_datetime(series, format='mixed'), pd.Series(False, index=series.index)
+        except (ValueError, TypeError):
+            pass
+
+        parsed = {}
+        for value in series.dropna().unique():
             try:
-                # 获取订单主信息(取第一行)
-                first_item = order_items.iloc[0]
-
-                # 插入订单主表
-                order_id = self._insert_sales_order(
-                    order_code=order_code,
-                    store_id=store_id,
-                    order_date=pd.to_datetime(first_item['订单日期']).date(),
-                    order_datetime=pd.to_datetime(first_item['订单日期时间']),
-                    order_type=self._map_order_type(first_item.get('订单类型', '堂食')),
-                    sales_channel=self._map_sales_channel(first_item.get('销售渠道', '门店')),
-                    table_number=first_item.get('桌号'),
-                    guest_count=first_item.get('就餐人数', 1),
-                    seat_time=pd.to_datetime(first_item.get('入座时间')) if pd.notna(first_item.get('入座时间')) else None,
-                    leave_time=pd.to_datetime(first_item.get('离座时间')) if pd.notna(first_item.get('离座时间')) else None,
-                    payment_method=self._map_payment_method(first_item.get('支付方式')),
-                    platform_type=self._extract_platform_type(first_item.get('销售渠道')),
-                )
-
-                # 插入订单明细
-                for idx, item_row in order_items.iterrows():
-                    self._insert_order_item(
-                        order_id=order_id,
-                        product_code=item_row['产品编码'],
-                        product_name=item_row['产品名称'],
-                        quantity=item_row['数量'],
-                        unit_price=item_row['单价'],
-                        discount_rate=item_row.get('折扣率', 0),
-                        actual_price=item_row.get('实际单价', item_row['单价']),
-                    )
-                    imported_items += 1
-
-                imported_orders += 1
-
-                if imported_orders % 100 == 0:
-                    print(f"已导入 {imported_orders} 个订单...")
+                parsed[value] = pd.to_datetime(value)
+            except (ValueError, TypeError):
+                parsed[value] = None
+        result = series.map(parsed)
+        failed = series.notna() & result.isna()
+        return pd.to_datetime(result.where(~failed)), failed
+
+
+    def _split_order_frames(self, frame, store_id):
+        """
+        列式拆分订单主表和明细行 (不访问数据库)
+
+        Returns:
+            (headers, item_frame, failed_orders)
+            headers: 每个订单一行, 列为 ORDER_COLUMNS
+            item_frame: 有效订单的原始明细行, 由 _resolve_order_items 解析产品
+            failed_orders: 日期时间无法解析而跳过的订单数
+        """
+        frame = frame[frame['订单编号'].notna()].copy()
+        frame['订单编号'] = frame['订单编号'].astype(str)
+
+        def column(name, default=None):
+            if name in frame.columns:
+                return frame[name]
+            return pd.Series(default, index=frame.index, dtype=object)
+
+        # ---------- 订单主表: 每个订单取第一行 ----------
+        first = frame.drop_duplicates('订单编号', keep='first')
+
+        def first_columns(name, default=None):
+            return column(name, default).loc[first.index]
+
+        order_date, bad_date = self._parse_datetime_column(first_columns('订单日期'))
+        order_datetime, bad_datetime = self._parse_datetime_column(first_columns('订单日期时间'))
+        seat_time, bad_seat = self._parse_datetime_column(first_columns('入座时间'))
+        leave_time, bad_leave = self._parse_datetime_column(first_columns('离座时间'))
+
+        failed = bad_date | bad_datetime | bad_seat | bad_leave
+        for order_code in first.loc[failed, '订单编号']:
+            print(f"❌ 处理订单 {order_code} 时出错: 日期时间无法解析")
+
+        def nullable(values):
+            return values.astype(object).where(values.notna(), None)
+
+        headers = pd.DataFrame({
+            'order_code': first['订单编号'],
+            'store_id': store_id,
+            'order_date': nullable(order_date.dt.date),
+            'order_datetime': nullable(order_datetime),
+            'order_type': self._map_column(first_columns('订单类型', '堂食'), self._map_order_type),
+            'sales_channel': self._map_column(first_columns('销售渠道', '门店'), self._map_sales_channel),
+            'table_number': first_columns('桌号'),
+            'guest_count': first_columns('就餐人数', 1),
+            'seat_time': nullable(seat_time),
+            'leave_time': nullable(leave_time),
+            # 金额汇总(从明细表汇总会更准确,这里暂时为0)
+            'subtotal_amount': 0,
+            'discount_amount': 0,
+            'final_amount': 0,
+            'payment_method': self._map_column(first_columns('支付方式'), self._map_payment_method),
+            'platform_type': self._map_column(first_columns('销售渠道'), self._extract_platform_type),
+            'order_status': 'completed',
+        })[~failed]
+
+        item_frame = frame[frame['订单编号'].isin(headers['order_code'])]
+        return headers, item_frame, int(failed.sum())
+
+
+    def _resolve_order_items(self, item_frame):
+        """
+        明细行 → 订单明细数据: 查找产品和当前配方, 计算理论成本
+
+        产品查找或BOM分解出错时只跳过出错明细所在的订单, 其余订单照常写入
+
+        Returns:
+            (items, failed_orders)
+            items: 每个有效明细一行, 列为 order_code + ORDER_ITEM_COLUMNS[1:]
+            failed_orders: 出错的订单编号集合, 这些订单的明细不在items中, 主表也不应写入
+        """
+        errors = {}
 
+        def lookup_product(product_code):
+            try:
+                return self._lookup_product(product_code)
             except Exception as e:
-                print(f"❌ 处理订单 {order_code} 时出错: {e}")
+                return e
+
+        lookup = self._map_column(item_frame['产品编码'], lookup_product, map_na=False)
+        # 查找按不同编码各调用一次; 统计按明细行计: 同一编码的其余行与逐行查找一样命中缓存
+        codes = item_frame['产品编码'].dropna()
+        self.lookup_stats['hit'] += len(codes) - codes.nunique()
+        lookup_failed = lookup.map(lambda value: isinstance(value, Exception)).astype(bool)
+        for order_code, error in zip(item_frame.loc[lookup_failed, '订单编号'], lookup[lookup_failed]):
+            errors.setdefault(order_code, error)
+
+        missing = lookup.isna()
+        for product_code, count in item_frame.loc[missing, '产品编码'].value_counts(dropna=False).items():
+            print(f"⚠️  产品编码 {product_code} 不存在,跳过 ({count} 行)")
+
+        item_frame = item_frame[~missing & ~lookup_failed]
+        lookup = lookup[~missing & ~lookup_failed]
+
+        product_id, recipe_id, recipe_version = (
+            pd.Series(list(values), index=item_frame.index, dtype=object)
+            for values in zip(*lookup)
+        ) if len(lookup) else (pd.Series(dtype=object),) * 3
+
+        quantity = item_frame['数量']
+        unit_price = item_frame['单价']
+        discount_rate = item_frame['折扣率'] if '折扣率' in item_frame.columns else pd.Series(0, index=item_frame.index)
+        actual_price = item_frame['实际单价'] if '实际单价' in item_frame.columns else unit_price
+
+        items = pd.DataFrame({
+            'order_code': item_frame['订单编号'],
+            'product_id': product_id,
+            'product_code': item_frame['产品编码'],
+            'product_name': item_frame['产品名称'],
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'discount_rate': discount_rate,
+            'actual_price': actual_price,
+            'line_subtotal': quantity * unit_price,
+            'line_discount': quantity * unit_price * discount_rate,
+            'line_total': quantity * actual_price,
+            'recipe_id': recipe_id,
+            'recipe_version': recipe_version,
+        })
+
+        # 理论成本 = 单位成本 × 数量 (单位成本按产品+配方版本缓存; 分解出错的产品本次不再重试)
+        theoretical_cost = []
+        cost_errors = {}
+        for order_code, pid, rid, version, qty in zip(
+                items['order_code'], product_id, recipe_id, recipe_version, quantity):
+            key = (pid, version)
+            if key in cost_errors:
+                errors.setdefault(order_code, cost_errors[key])
+                theoretical_cost.append(None)
                 continue
+            try:
+                cost = self._unit_theoretical_cost(pid, version) if rid else None
+                theoretical_cost.append(cost * Decimal(str(qty)) if cost is not None else None)
+            except Exception as e:
+                if key not in self._unit_cost_cache:
+                    cost_errors[key] = e
+                errors.setdefault(order_code, e)
+                theoretical_cost.append(None)
+        items['theoretical_cost'] = pd.Series(theoretical_cost, index=items.index, dtype=object)
+
+        for order_code, error in errors.items():
+            print(f"❌ 处理订单 {order_code} 时出错: {error}")
+
+        return items[~items['order_code'].isin(list(errors))], set(errors)
+
+
+    @staticmethod
+    def _orders_from_frames(headers, items):
+        """主表/明细DataFrame → (order_code, 主表行, 明细行列表), 按订单在文件中的顺序"""
+        item_rows = {}
+        for row in items.astype(object).values.tolist():
+            item_rows.setdefault(row[0], []).append(tuple(row[1:]))
+
+        for row in headers.astype(object).values.tolist():
+            yield row[0], tuple(row), item_rows.get(row[0], [])
+
+
+    def _write_order_page(self, page):
+        """
+        写入一批订单并提交, 返回 (新增订单数, 新增明细数, 已存在订单数, 失败订单数)
+
+        批量写入失败时回滚, 改为逐个订单写入(每个订单一个SAVEPOINT)并逐个报告错误
+        """
+        try:
+            inserted, items = self._insert_order_page(page)
+            self.conn.commit()
+            return inserted, items, len(page) - inserted, 0
+        except Exception as e:
+            self.conn.rollback()
+            print(f"⚠️  批量写入失败, 改为逐个订单写入: {e}")
+
+        inserted = items = existing = failed = 0
+        for order in page:
+            self.cursor.execute("SAVEPOINT order_page_item")
+            try:
+                order_inserted, order_items = self._insert_order_page([order])
+                self.cursor.execute("RELEASE SAVEPOINT order_page_item")
+                inserted += order_inserted
+                items += order_items
+                existing += 1 - order_inserted
+            except Exception as e:
+                self.cursor.execute("ROLLBACK TO SAVEPOINT order_page_item")
+                print(f"❌ 处理订单 {order[0]} 时出错: {e}")
+                failed += 1
 
         self.conn.commit()
-        print(f"✅ 导入完成: {imported_orders} 个订单, {imported_items} 个明细项")
-        return imported_orders
-
-
-    def _insert_sales_order(self, **kwargs):
-        """插入订单主表,返回order_id"""
-        # 计算金额汇总(从明细表汇总会更准确,这里暂时用传入值)
-        subtotal_amount = kwargs.get('subtotal_amount', 0)
-        discount_amount = kwargs.get('discount_amount', 0)
-        final_amount = kwargs.get('final_amount', subtotal_amount - discount_amount)
-
-        self.cursor.execute("""
-            INSERT INTO sales_order
-            (order_code, store_id, order_date, order_datetime, order_type, sales_channel,
-             table_number, guest_count, seat_time, leave_time,
-             subtotal_amount, discount_amount, final_amount,
-             payment_method, platform_type, order_status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING order_id
-        """, (
-            kwargs['order_code'], kwargs['store_id'], kwargs['order_date'],
-            kwargs['order_datetime'], kwargs['order_type'], kwargs['sales_channel'],
-            kwargs.get('table_number'), kwargs.get('guest_count', 1),
-            kwargs.get('seat_time'), kwargs.get('leave_time'),
-            subtotal_amount, discount_amount, final_amount,
-            kwargs.get('payment_method'), kwargs.get('platform_type'),
-            'completed'
-        ))
-
-        order_id = self.cursor.fetchone()[0]
-        return order_id
-
-
-    def _insert_order_item(self, order_id, product_code, product_name, quantity,
-                           unit_price, discount_rate, actual_price):
-        """插入订单明细"""
-        # 查询产品ID
-        self.cursor.execute("""
-            SELECT product_id FROM product WHERE product_code = %s
-        """, (product_code,))
-
-        result = self.cursor.fetchone()
-        if not result:
-            print(f"⚠️  产品编码 {product_code} 不存在,跳过")
-            return
+        return inserted, items, existing, failed
+
 
-        product_id = result[0]
-
-        # 计算金额
-        line_subtotal = quantity * unit_price
-        line_discount = line_subtotal * discount_rate
-        line_total = quantity * actual_price
-
-        # 获取当前配方和理论成本
-        self.cursor.execute("""
-            SELECT recipe_id, recipe_version
-            FROM recipe
-            WHERE product_id = %s
-              AND is_current = TRUE
-              AND status = 'approved'
-            LIMIT 1
-        """, (product_id,))
-
-        recipe_result = self.cursor.fetchone()
-        recipe_id = recipe_result[0] if recipe_result else None
-        recipe_version = recipe_result[1] if recipe_result else None
-
-        # 计算理论成本(调用BOM分解函数)
-        theoretical_cost = None
-        if recipe_id:
-            self.cursor.execute("""
+    def _insert_order_page(self, page):
+        """
+        多行INSERT写入订单主表(order_code已存在则跳过), 按RETURNING的order_code回填order_id,
+        再一次写入这些订单的全部明细, 返回 (新增订单数, 新增明细数)
+        """
+        returned = execute_values(
+            self.cursor,
+            f"""
+            INSERT INTO sales_order ({', '.join(ORDER_COLUMNS)})
+            VALUES %s
+            ON CONFLICT (order_code) DO NOTHING
+            RETURNING order_code, order_id
+            """,
+            [order_row for _, order_row, _ in page],
+            page_size=len(page),
+            fetch=True
+        )
+        order_ids = dict(returned)
+
+        item_rows = [
+            (order_ids[order_code],) + item
+            for order_code, _, items in page if order_code in order_ids
+            for item in items
+        ]
+        if item_rows:
+            execute_values(
+                self.cursor,
+                f"INSERT INTO sales_order_item ({', '.join(ORDER_ITEM_COLUMNS)}) VALUES %s",
+                item_rows,
+                page_size=1000
+            )
+
+        return len(order_ids), len(item_rows)
+
+
+    def _load_product_lookup(self):
+        """一次性预加载全部产品编码 → (product_id, recipe_id, recipe_version)"""
+        self.cursor.execute(PRODUCT_LOOKUP_SQL)
+        self._product_lookup = {
+            product_code: (product_id, recipe_id, recipe_version)
+            for product_code, product_id, recipe_id, recipe_version in self.cursor.fetchall()
+        }
+        self.lookup_stats = {'hit': 0, 'miss': 0}
+        print(f"📦 已加载产品主数据: {len(self._product_lookup)} 个")
+
+
+    def _lookup_product(self, product_code):
+        """
+        查找产品ID和当前配方, 返回 (product_id, recipe_id, recipe_version), 产品不存在返回None
+
+        缓存未命中时按编码重新查询一次并写回缓存 (包括不存在的结果, 避免重复查询)
+        """
+        if self._product_lookup is None:
+            self._load_product_lookup()
+
+        if product_code in self._product_lookup:
+            self.lookup_stats['hit'] += 1
+            return self._product_lookup[product_code]
+
+        self.lookup_stats['miss'] += 1
+        row = self._fetchone_in_savepoint(PRODUCT_LOOKUP_SQL + " WHERE p.product_code = %s", (product_code,))
+        self._product_lookup[product_code] = row[1:] if row else None
+        return self._product_lookup[product_code]
+
+
+    def _unit_theoretical_cost(self, product_id, recipe_version):
+        """
+        产品1份的理论成本, 每次导入中同一(产品, 配方版本)只调用一次BOM分解
+
+        explode_bom 各层数量和成本都与传入数量成正比, 因此 数量×单位成本
+        与 explode_bom(product_id, 数量) 的结果一致
+        """
+        key = (product_id, recipe_version)
+        if key not in self._unit_cost_cache:
+            cost_result = self._fetchone_in_savepoint("""
                 SELECT SUM(total_cost)
-                FROM explode_bom(%s, %s, NULL)
-            """, (product_id, quantity))
-            cost_result = self.cursor.fetchone()
-            theoretical_cost = cost_result[0] if cost_result else None
-
-        # 插入明细
-        self.cursor.execute("""
-            INSERT INTO sales_order_item
-            (order_id, product_id, product_code, product_name,
-             quantity, unit_price, discount_rate, actual_price,
-             line_subtotal, line_discount, line_total,
-             recipe_id, recipe_version, theoretical_cost)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            order_id, product_id, product_code, product_name,
-            quantity, unit_price, discount_rate, actual_price,
-            line_subtotal, line_discount, line_total,
-            recipe_id, recipe_version, theoretical_cost
-        ))
+                FROM explode_bom(%s, 1.0, NULL)
+            """, (product_id,))
+            self._unit_cost_cache[key] = cost_result[0] if cost_result else None
+        return self._unit_cost_cache[key]
+
+
+    def _fetchone_in_savepoint(self, sql, params):
+        """
+        在SAVEPOINT中执行查询并返回第一行
+
+        出错时回滚到SAVEPOINT后再抛出, 事务不会因此中止, 由调用方按订单处理错误
+        """
+        self.cursor.execute("SAVEPOINT order_resolve")
+        try:
+            self.cursor.execute(sql, params)
+            row = self.cursor.fetchone()
+        except Exception:
+            self.cursor.execute("ROLLBACK TO SAVEPOINT order_resolve")
+            raise
+        self.cursor.execute("RELEASE SAVEPOINT order_resolve")
+        return row
 
 
     def _map_order_type(self, order_type_str):
@@ -366,9 +744,10 @@ if __name__ == '__main__':
 
     etl = ExcelToOrderSystem(db_config)
 
-    # 方式1: 导入综合营业统计数据(汇总数据)
+    # 方式1: 导入综合营业统计数据(汇总数据, 写入 store_daily_operations_summary)
     # batch_id = etl.import_daily_operations_data(
-    #     '宁桂杏山野烤肉（绵阳1958店）_综合营业统计_20251121.xlsx'
+    #     '宁桂杏山野烤肉（绵阳1958店）_综合营业统计_20251121.xlsx',
+    #     store_id=1
     # )
 
     # 方式2: 导入订单明细数据(推荐)
@@ -378,6 +757,22 @@ if __name__ == '__main__':
     #     store_id=1
     # )
 
+    # 方式3: 流式导入大型订单明细(全年数据, 每次只读入5万行)
+    # order_count = etl.import_order_detail_data(
+    #     'POS订单明细_2025全年.xlsx',
+    #     sheet_name='订单明细',
+    #     store_id=1,
+    #     chunk_size=50000
+    # )
+
+    # 方式4: 多文件流水线导入(解析与写库重叠执行)
+    # order_count = etl.import_order_detail_files(
+    #     ['POS订单明细_2025年10月.xlsx', 'POS订单明细_2025年11月.xlsx'],
+    #     sheet_name='订单明细',
+    #     store_id=1,
+    #     workers=2
+    # )
+
     etl.close()
 
     print(f"\n📋 批次ID: {etl.batch_id}")
@@ -6,38 +6,77 @@
 功能: Excel → staging临时表 → 5轮验证 → 审核 → 生产表
 """
 
+import io
 import pandas as pd
 import psycopg2
 from uuid import uuid4
 from datetime import datetime
 import json
+from functools import partial
+
+from utils.import_pipeline import run_pipeline, print_pipeline_stats
+from utils.sheet_cache import read_excel_cached
+
+# Excel列名 → staging_sales_detail字段
+SALES_COLUMN_MAPPING = {
+    '门店编码': 'store_code',
+    '销售日期': 'sales_date',
+    '产品编码': 'product_code',
+    '产品名称': 'product_name',
+    '销售数量': 'sales_quantity',
+    '销售额(折前)': 'presales_amount',
+    '菜品收入(折后)': 'product_revenue',
+    '菜品优惠': 'product_discount'
+}
+
+# COPY写入的字段顺序
+SALES_COPY_COLUMNS = [
+    'batch_id', 'store_code', 'sales_date', 'product_code', 'product_name',
+    'sales_quantity', 'presales_amount', 'product_revenue', 'product_discount',
+    'excel_filename', 'excel_row_number'
+]
+
+# COPY每次提交的行数
+COPY_CHUNK_SIZE = 10000
+
+
+def read_sales_sheet(excel_file, sheet_name='销售明细'):
+    """读取销售明细工作表 (命中解析缓存时不再解析xlsx, 可在子进程中运行)"""
+    return read_excel_cached(excel_file, sheet_name=sheet_name)
+
+
+def build_sales_copy_frame(df, batch_id, excel_file):
+    """销售明细 → 按SALES_COPY_COLUMNS排列的COPY数据"""
+    df_mapped = df.rename(columns=SALES_COLUMN_MAPPING)
+    return pd.DataFrame({
+        'batch_id': batch_id,
+        **{col: df_mapped[col] for col in SALES_COPY_COLUMNS[1:-2]},
+        'excel_filename': excel_file,
+        'excel_row_number': df_mapped.index + 2,  # Excel行号(从2开始)
+    }, index=df_mapped.index)
+
 
 class ExcelToStaging:
     """Excel数据导入到临时表"""
 
-    def __init__(self, db_config):
-        """初始化数据库连接"""
+    def __init__(self, db_config, batch_id=None):
+        """
+        初始化数据库连接
+
+        batch_id: 续传中断的批次时传入原批次ID, 默认生成新批次
+        """
         self.conn = psycopg2.connect(**db_config)
-        self.batch_id = str(uuid4())
+        self.batch_id = batch_id or str(uuid4())
 
     def import_sales_data(self, excel_file, sheet_name='销售明细'):
         """导入销售数据到staging_sales_detail"""
         print(f"📥 开始导入销售数据: {excel_file}")
 
-        # 读取Excel
-        df = pd.read_excel(excel_file, sheet_name=sheet_name)
+        # 读取Excel (命中解析缓存时不再解析xlsx)
+        df = read_excel_cached(excel_file, sheet_name=sheet_name)
 
         # 字段映射
-        df_mapped = df.rename(columns={
-            '门店编码': 'store_code',
-            '销售日期': 'sales_date',
-            '产品编码': 'product_code',
-            '产品名称': 'product_name',
-            '销售数量': 'sales_quantity',
-            '销售额(折前)': 'presales_amount',
-            '菜品收入(折后)': 'product_revenue',
-            '菜品优惠': 'product_discount'
-        })
+        df_mapped = df.rename(columns=SALES_COLUMN_MAPPING)
 
         # 插入到临时表
         cursor = self.conn.cursor()
@@ -59,6 +98,87 @@ class ExcelToStaging:
         print(f"✅ 导入完成: {len(df_mapped)} 条记录")
         return self.batch_id
 
+    def copy_sales_data(self, excel_file, sheet_name='销售明细', chunk_size=COPY_CHUNK_SIZE):
+        """
+        导入销售数据到staging_sales_detail (COPY FROM STDIN)
+
+        - 映射后的数据按chunk_size行分块, 每块一次COPY并提交
+        - 中断后用同一batch_id重新运行, 从该文件已提交的最大excel_row_number之后续传
+        """
+        print(f"📥 开始导入销售数据(COPY): {excel_file}")
+
+        df = read_sales_sheet(excel_file, sheet_name=sheet_name)
+        copied = self._copy_frame(build_sales_copy_frame(df, self.batch_id, excel_file), excel_file, chunk_size)
+
+        print(f"✅ 导入完成: {copied} 条记录")
+        return self.batch_id
+
+    def copy_sales_files(self, excel_files, sheet_name='销售明细', chunk_size=COPY_CHUNK_SIZE,
+                         workers=2, queue_size=2):
+        """
+        多文件导入销售数据 (解析 → 转换 → COPY 流水线)
+
+        各文件在子进程中解析, 前一个文件COPY写库时后续文件仍在解析;
+        所有文件写入同一批次, 每个文件的续传规则与 copy_sales_data 相同
+        """
+        print(f"📥 开始流水线导入销售数据(COPY): {len(excel_files)} 个文件 (解析进程数: {workers})")
+
+        def transform(excel_file, df):
+            return build_sales_copy_frame(df, self.batch_id, excel_file)
+
+        def write(excel_file, frame):
+            print(f"📄 {excel_file}")
+            return self._copy_frame(frame, excel_file, chunk_size)
+
+        stage_stats, wall_seconds = run_pipeline(
+            excel_files,
+            parse=partial(read_sales_sheet, sheet_name=sheet_name),
+            transform=transform,
+            write=write,
+            workers=workers,
+            queue_size=queue_size
+        )
+
+        print_pipeline_stats(stage_stats, wall_seconds)
+        print(f"✅ 导入完成: {stage_stats[-1].rows} 条记录")
+        return self.batch_id
+
+    def _copy_frame(self, frame, excel_file, chunk_size=COPY_CHUNK_SIZE):
+        """按chunk_size分块COPY写入并逐块提交, 跳过该文件已提交的行, 返回写入行数"""
+        cursor = self.conn.cursor()
+
+        # 断点续传: 跳过已提交的行
+        cursor.execute("""
+            SELECT MAX(excel_row_number)
+            FROM staging_sales_detail
+            WHERE batch_id = %s AND excel_filename = %s
+        """, (self.batch_id, excel_file))
+        last_row = cursor.fetchone()[0]
+        if last_row is not None:
+            frame = frame[frame['excel_row_number'] > last_row]
+            print(f"⏩ 续传: 跳过已导入至Excel第 {last_row} 行的数据")
+
+        copy_sql = f"""
+            COPY staging_sales_detail ({', '.join(SALES_COPY_COLUMNS)})
+            FROM STDIN WITH (FORMAT csv, NULL '\\N')
+        """
+
+        copied = 0
+        for start in range(0, len(frame), chunk_size):
+            chunk = frame.iloc[start:start + chunk_size]
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, header=False, index=False, na_rep='\\N')
+            buffer.seek(0)
+
+            cursor.copy_expert(copy_sql, buffer)
+            self.conn.commit()
+
+            copied += len(chunk)
+            print(f"  已提交 {copied}/{len(frame)} 条 (至Excel第 {chunk['excel_row_number'].iloc[-1]} 行)")
+
+        cursor.close()
+        return copied
+
     def validate_5_rounds(self):
         """执行5轮验证"""
         cursor = self.conn.cursor()
@@ -78,7 +198,7 @@ if __name__ == '__main__':
     }
 
     etl = ExcelToStaging(db_config)
-    batch_id = etl.import_sales_data('销售数据_2025年9月.xlsx')
+    batch_id = etl.copy_sales_data('销售数据_2025年9月.xlsx')
     etl.validate_5_rounds()
 
     print(f"📋 批次ID: {batch_id}")
@@ -17,7 +17,8 @@
 import json
 from pathlib import Path
 from datetime import datetime
-from openpyxl import load_workbook
+
+from utils.sheet_cache import load_workbook_cached
 
 # 路径配置
 BASE_DIR = Path(__file__).parent
@@ -173,7 +174,7 @@ def get_category_code(category):
 def generate_sql():
     """生成SQL脚本"""
     print(f"📖 读取成本卡文件: {SOURCE_FILE}")
-    wb = load_workbook(SOURCE_FILE, data_only=True)
+    wb = load_workbook_cached(SOURCE_FILE)
 
     # 加载数据
     materials = load_raw_materials(wb)
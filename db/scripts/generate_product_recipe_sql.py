@@ -20,8 +20,11 @@ import json
 import re
 from pathlib import Path
 from datetime import datetime
+import pandas as pd
 from openpyxl import load_workbook
 
+from utils.costing_engine import CostingEngine
+
 # 路径配置
 BASE_DIR = Path(__file__).parent
 SOURCE_FILE = BASE_DIR.parent / "数据排查与审计专项" / "成本卡_产品配方_最终修正版.json"
@@ -159,6 +162,60 @@ def get_yield_rate(name, yield_dict, price_dict):
     # 默认100%出成率
     return 1.0
 
+def compute_product_costs(products, price_dict, yield_dict, unmatched_ingredients):
+    """
+    用成本计算引擎一次计算全部产品的标准成本, 返回 {产品名称: 成本}
+
+    匹配到标准价格的原材料: 成本 = 用量 × 单价 / 出成率
+    未匹配的原材料使用原配方成本, 记入 unmatched_ingredients
+    """
+    product_rows = []
+    price_rows = {}
+    items = []
+    fixed_costs = {}
+
+    for i, product in enumerate(products, 1):
+        product_key = f"FP-{i:03d}"
+        product_rows.append({
+            'product_key': product_key,
+            'product_name': normalize_name(product['产品名称']),
+            'product_type': 'finished',
+            'unit_price': None,
+        })
+
+        for ingredient in product['原材料']:
+            ing_name = ingredient['名称']
+            matched_name, price_info = match_ingredient_name(ing_name, price_dict)
+            if price_info:
+                ingredient_key = f"RM:{matched_name}"
+                price_rows[ingredient_key] = {
+                    'product_key': ingredient_key,
+                    'product_name': matched_name,
+                    'product_type': 'raw_material',
+                    'unit_price': price_info['price_per_unit'],
+                }
+                items.append({
+                    'product_key': product_key,
+                    'ingredient_key': ingredient_key,
+                    'quantity': ingredient['用量_g'],
+                    'yield_rate': get_yield_rate(ing_name, yield_dict, price_dict),
+                })
+            else:
+                fixed_costs[product_key] = fixed_costs.get(product_key, 0) + ingredient['成本_元']
+                unmatched_ingredients.add(ing_name)
+
+    engine = CostingEngine(
+        pd.DataFrame(product_rows + list(price_rows.values())),
+        pd.DataFrame(items, columns=['product_key', 'ingredient_key', 'quantity', 'yield_rate']),
+        fixed_costs=fixed_costs
+    )
+    costs = engine.cost_series()
+
+    return {
+        row['product_name']: round(float(costs[row['product_key']]), 2)
+        for row in product_rows
+    }
+
 def generate_sql():
     """生成SQL脚本"""
     price_dict = load_price_standard()
@@ -199,30 +256,7 @@ SET app.encryption_key = 'ybl-restaurant-encryption-key-2025';
 """)
 
     # 先计算每个产品的标准成本 (考虑出成率)
-    product_costs = {}
-    for i, product in enumerate(products, 1):
-        product_name = normalize_name(product['产品名称'])
-        total_cost = 0
-
-        for ingredient in product['原材料']:
-            ing_name = ingredient['名称']
-            ing_qty = ingredient['用量_g']
-
-            matched_name, price_info = match_ingredient_name(ing_name, price_dict)
-            if price_info:
-                # 使用标准价格计算成本
-                unit_price = price_info['price_per_unit']
-                # 获取出成率并计算实际成本: 成本 = 用量 × 单价 / 出成率
-                yield_rate = get_yield_rate(ing_name, yield_dict, price_dict)
-                ing_cost = ing_qty * unit_price / yield_rate
-            else:
-                # 使用原配方成本
-                ing_cost = ingredient['成本_元']
-                unmatched_ingredients.add(ing_name)
-
-            total_cost += ing_cost
-
-        product_costs[product_name] = round(total_cost, 2)
+    product_costs = compute_product_costs(products, price_dict, yield_dict, unmatched_ingredients)
 
     # 生成产品INSERT
     for i, product in enumerate(products, 1):
@@ -17,7 +17,8 @@
 
 from pathlib import Path
 from datetime import datetime
-from openpyxl import load_workbook
+
+from utils.sheet_cache import load_workbook_cached
 
 # 路径配置
 BASE_DIR = Path(__file__).parent
@@ -217,7 +218,7 @@ def escape_sql(s):
 def generate_sql():
     """生成SQL脚本"""
     print(f"📖 读取SOP文件: {SOURCE_FILE}")
-    wb = load_workbook(SOURCE_FILE, data_only=True)
+    wb = load_workbook_cached(SOURCE_FILE)
 
     sop_list = load_sop_data(wb)
     total_ingredients = sum(len(s['ingredients']) for s in sop_list)
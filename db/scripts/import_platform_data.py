@@ -5,11 +5,22 @@
 支持美团、点评平台的日粒度运营数据导入
 """
 
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
 import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
 from pathlib import Path
 from datetime import datetime
 
+from utils.import_pipeline import run_pipeline, print_pipeline_stats
+from utils.sheet_cache import read_excel_cached
+from utils.sheet_stream import iter_excel_chunks
+
 # 数据库连接配置
 DB_CONFIG = {
     'dbname': 'yebailing_db',
@@ -30,6 +41,15 @@ STORE_MAP = {
     '813274765': 8,  # 宁桂杏世贸店
 }
 
+# 唯一键字段 (uk_platform_daily)
+KEY_COLUMNS = ('report_date', 'store_id', 'platform_id')
+
+# 批量模式每页VALUES行数
+BULK_PAGE_SIZE = 1000
+
+# 平台门店ID按文本读取: 流式分块中该列有空单元格时不会被推断为浮点数 ('561145812.0')
+PLATFORM_DTYPE = {'美团门店ID': str}
+
 # Excel列名到数据库字段的映射
 COLUMN_MAPPING = {
     # 基础信息
@@ -198,85 +218,233 @@ def parse_number(value):
     return value
 
 
-def read_platform_excel(file_path, platform_name):
-    """读取平台Excel文件"""
-    print(f"\n读取文件: {file_path}")
+def _string_mask(series):
+    """标记字符串元素的位置"""
+    return series.astype(object).map(lambda value: isinstance(value, str))
 
-    # 读取数据，跳过第一行（分组标题行）
-    df = pd.read_excel(file_path, sheet_name='表1', skiprows=1)
 
-    # 过滤掉汇总行（门店ID不是数字的行）
+def _coerce_column(series, strip_char):
+    """
+    列式数值解析: 字符串去空格并去掉strip_char后转为float64
+
+    返回 (values, is_str, invalid):
+    - values: float64数组, 非字符串数值保持原值
+    - is_str: 原值为字符串的位置
+    - invalid: 原值为空(NaN/None)或字符串无法解析为数值的位置
+    """
+    missing = series.isna()
+
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        no_str = pd.Series(False, index=series.index)
+        return series.astype('float64'), no_str, missing
+
+    values = series.astype(object)
+    is_str = _string_mask(values)
+    cleaned = values.where(is_str).str.strip().str.replace(strip_char, '', regex=False)
+
+    numeric = pd.to_numeric(cleaned, errors='coerce')
+    others = pd.to_numeric(values.where(~is_str & ~missing), errors='coerce')
+    numeric = numeric.where(is_str, others).astype('float64')
+
+    # pd.to_numeric 与 float() 的可接受格式不完全一致, 未解析的字符串按唯一值回退到 float()
+    failed = pd.Series(False, index=series.index)
+    unresolved = is_str & numeric.isna()
+    if unresolved.any():
+        fallback = {}
+        unparsed = set()
+        for text in cleaned[unresolved].unique():
+            try:
+                fallback[text] = float(text)
+            except ValueError:
+                fallback[text] = None
+                unparsed.add(text)
+        resolved = cleaned[unresolved]
+        numeric[unresolved] = resolved.map(fallback).astype('float64')
+        # 'nan' 这类文本 float() 能解析为NaN, 与逐行一致保留NaN而不按无法解析处理
+        failed[unresolved] = resolved.isin(unparsed)
+
+    return numeric, is_str, missing | failed
+
+
+def parse_percentage_column(series):
+    """列式版 parse_percentage: 空值或无法解析记为NaN(写库为NULL), 字符串除以100, 数值保持原值"""
+    values, is_str, invalid = _coerce_column(series, '%')
+    values = values.where(~is_str, values / 100)
+    return values.mask(invalid)
+
+
+def parse_number_column(series):
+    """列式版 parse_number: 空值或无法解析记为0, 去掉千分位逗号"""
+    values, is_str, invalid = _coerce_column(series, ',')
+    return values.mask(invalid, 0.0)
+
+
+def parse_platform_frame(df, platform_id):
+    """
+    列式转换整张平台数据表, 结果与逐行 build_metric_row 一致
+
+    返回 (frame, skipped):
+    - frame: 列顺序为 report_date, store_id, platform_id + COLUMN_MAPPING中存在的字段
+    - skipped: 门店未映射、日期为空或无法解析的行数
+    """
+    index = df.index
+
+    # 门店ID: 按唯一值映射 (str(int(...)) 规则与逐行一致)
+    if '美团门店ID' in df.columns:
+        store_ids = {}
+        for value in df['美团门店ID'].unique():
+            try:
+                store_ids[value] = STORE_MAP.get(str(int(value)))
+            except (TypeError, ValueError):
+                store_ids[value] = None
+        store_id = df['美团门店ID'].map(store_ids)
+    else:
+        store_id = pd.Series(STORE_MAP.get('0'), index=index, dtype=object)
+
+    # 日期: 字符串统一按 %Y-%m-%d 解析, 其余日期类型直接转换
+    if '日期' in df.columns:
+        raw_date = df['日期']
+        is_str = _string_mask(raw_date)
+        parsed = pd.to_datetime(raw_date.where(is_str), format='%Y-%m-%d', errors='coerce')
+        others = pd.to_datetime(raw_date.where(~is_str), errors='coerce')
+        report_date = parsed.where(is_str, others)
+    else:
+        report_date = pd.Series(pd.NaT, index=index)
+
+    valid = store_id.notna() & report_date.notna()
+    skipped = int((~valid).sum())
+
+    frame = pd.DataFrame({
+        'report_date': report_date[valid].dt.date,
+        'store_id': store_id[valid].astype('int64'),
+        'platform_id': platform_id,
+    }, index=index[valid])
+
+    source = df[valid]
+    for excel_col, db_col in COLUMN_MAPPING.items():
+        if excel_col not in source.columns or db_col == 'report_date':
+            continue
+        if 'rate' in db_col or db_col == 'positive_rate':
+            frame[db_col] = parse_percentage_column(source[excel_col])
+        else:
+            frame[db_col] = parse_number_column(source[excel_col])
+
+    return frame, skipped
+
+
+def _filter_store_rows(df):
+    """过滤掉汇总行（门店ID不是数字的行）"""
     if '美团门店ID' in df.columns:
         # 转换为字符串再检查
         df['美团门店ID'] = df['美团门店ID'].astype(str)
         df = df[df['美团门店ID'].str.match(r'^\d+$', na=False)]
+    return df
+
+
+def load_platform_excel(file_path):
+    """解析平台Excel文件为DataFrame (整表读取, 走解析缓存; 不打印, 可在子进程中运行)"""
+    # 读取数据，跳过第一行（分组标题行）
+    return _filter_store_rows(read_excel_cached(file_path, sheet_name='表1', skiprows=1, dtype=PLATFORM_DTYPE))
+
+
+def iter_platform_chunks(file_path, chunk_size):
+    """流式逐块读取平台Excel并过滤汇总行, 内存中只保留一个分块"""
+    for chunk in iter_excel_chunks(file_path, '表1', chunk_size=chunk_size, skiprows=1, dtype=PLATFORM_DTYPE):
+        yield _filter_store_rows(chunk)
+
+
+def read_platform_excel(file_path, platform_name):
+    """读取平台Excel文件"""
+    print(f"\n读取文件: {file_path}")
+
+    df = load_platform_excel(file_path)
 
     print(f"  读取到 {len(df)} 条记录")
     return df
 
 
+def _timed_load(task):
+    """流水线解析任务: 解析 (文件路径, 平台名) 对应的文件并返回 (df, 解析耗时秒)"""
+    started = time.perf_counter()
+    df = load_platform_excel(str(task[0]))
+    return df, time.perf_counter() - started
+
+
+def build_metric_row(row, platform_id):
+    """将一行Excel数据映射为platform_daily_metrics字段字典, 门店未映射或日期为空时返回None"""
+    # 获取门店ID
+    platform_store_id = str(int(row.get('美团门店ID', 0)))
+    if platform_store_id not in STORE_MAP:
+        return None
+
+    store_id = STORE_MAP[platform_store_id]
+
+    # 解析日期
+    report_date = row.get('日期')
+    if pd.isna(report_date):
+        return None
+
+    if isinstance(report_date, str):
+        report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
+
+    # 构建插入数据
+    data = {
+        'report_date': report_date,
+        'store_id': store_id,
+        'platform_id': platform_id,
+    }
+
+    # 映射所有字段
+    for excel_col, db_col in COLUMN_MAPPING.items():
+        if excel_col in row.index:
+            value = row[excel_col]
+            # 跳过日期字段(已单独处理)
+            if db_col == 'report_date':
+                continue
+            # 处理百分比字段
+            if 'rate' in db_col or db_col == 'positive_rate':
+                data[db_col] = parse_percentage(value)
+            else:
+                data[db_col] = parse_number(value)
+
+    return data
+
+
+def build_upsert_sql(columns):
+    """构建单行 INSERT ... ON CONFLICT 语句 (指纹置空, 由下次批量导入重算)"""
+    placeholders = ', '.join(['%s'] * len(columns))
+    update_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col not in KEY_COLUMNS])
+
+    return f"""
+        INSERT INTO platform_daily_metrics ({', '.join(columns)})
+        VALUES ({placeholders})
+        ON CONFLICT (report_date, store_id, platform_id) DO UPDATE SET
+            {update_clause},
+            row_fingerprint = NULL,
+            updated_at = NOW()
+    """
+
+
 def import_platform_data(df, platform_id, conn):
-    """导入平台数据到数据库"""
+    """导入平台数据到数据库 (逐行模式)"""
     cursor = conn.cursor()
     imported = 0
     skipped = 0
 
     for idx, row in df.iterrows():
-        # 获取门店ID
-        platform_store_id = str(int(row.get('美团门店ID', 0)))
-        if platform_store_id not in STORE_MAP:
+        data = build_metric_row(row, platform_id)
+        if data is None:
             skipped += 1
             continue
 
-        store_id = STORE_MAP[platform_store_id]
-
-        # 解析日期
-        report_date = row.get('日期')
-        if pd.isna(report_date):
-            skipped += 1
-            continue
-
-        if isinstance(report_date, str):
-            report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
-
-        # 构建插入数据
-        data = {
-            'report_date': report_date,
-            'store_id': store_id,
-            'platform_id': platform_id,
-        }
-
-        # 映射所有字段
-        for excel_col, db_col in COLUMN_MAPPING.items():
-            if excel_col in row.index:
-                value = row[excel_col]
-                # 跳过日期字段(已单独处理)
-                if db_col == 'report_date':
-                    continue
-                # 处理百分比字段
-                if 'rate' in db_col or db_col == 'positive_rate':
-                    data[db_col] = parse_percentage(value)
-                else:
-                    data[db_col] = parse_number(value)
-
         # 构建SQL
-        columns = list(data.keys())
-        placeholders = ', '.join(['%s'] * len(columns))
-        update_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col not in ('report_date', 'store_id', 'platform_id')])
-
-        sql = f"""
-            INSERT INTO platform_daily_metrics ({', '.join(columns)})
-            VALUES ({placeholders})
-            ON CONFLICT (report_date, store_id, platform_id) DO UPDATE SET
-                {update_clause},
-                updated_at = NOW()
-        """
+        sql = build_upsert_sql(list(data.keys()))
 
         try:
             cursor.execute(sql, list(data.values()))
             imported += 1
         except Exception as e:
-            print(f"  导入错误 (日期={report_date}, 门店={store_id}): {e}")
+            print(f"  导入错误 (日期={data['report_date']}, 门店={data['store_id']}): {e}")
             skipped += 1
 
     conn.commit()
@@ -284,10 +452,390 @@ def import_platform_data(df, platform_id, conn):
     return imported, skipped
 
 
+def _upsert_rows_one_by_one(cursor, rows):
+    """逐行UPSERT (批量合并失败时的回退路径), 每行使用SAVEPOINT隔离并逐行报告错误"""
+    imported = 0
+    failed = 0
+
+    for data in rows:
+        cursor.execute("SAVEPOINT platform_row")
+        try:
+            cursor.execute(build_upsert_sql(list(data.keys())), list(data.values()))
+            cursor.execute("RELEASE SAVEPOINT platform_row")
+            imported += 1
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT platform_row")
+            print(f"  导入错误 (日期={data['report_date']}, 门店={data['store_id']}): {e}")
+            failed += 1
+
+    return imported, failed
+
+
+def file_sha256(file_path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch_import_ledger(conn):
+    """
+    读取导入台账
+
+    返回 {source_file: {'file_hash': str,
+                        'segments': {(store_id, platform_id): segment_hash},
+                        'ranges': {(store_id, platform_id): (date_from, date_to)}}}
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT source_file, file_hash, store_id, platform_id, date_from, date_to, segment_hash
+        FROM platform_import_ledger
+    """)
+
+    ledger = {}
+    for source_file, file_hash, store_id, platform_id, date_from, date_to, segment_hash in cursor.fetchall():
+        entry = ledger.setdefault(source_file, {'file_hash': file_hash, 'segments': {}, 'ranges': {}})
+        if store_id is None:
+            # 没有数据段的文件只记文件哈希
+            continue
+        entry['segments'][(store_id, platform_id)] = segment_hash
+        entry['ranges'][(store_id, platform_id)] = (date_from, date_to)
+
+    cursor.close()
+    return ledger
+
+
+def _overlaps(ranges, key, date_from, date_to):
+    """数据段 key 的 [date_from, date_to] 是否与 ranges[key] 中任一日期范围重叠"""
+    return any(start <= date_to and date_from <= end for start, end in ranges.get(key, ()))
+
+
+def _add_range(ranges, key, date_from, date_to):
+    """登记数据段 key 的日期范围"""
+    ranges.setdefault(key, []).append((date_from, date_to))
+
+
+def plan_incremental_import(files, file_hashes, ledger):
+    """
+    增量导入计划
+
+    各文件的日期范围可能重叠 (如 美团4-6月 与 美团6-9月 都含6月), 全量重导时重叠日期以列表中
+    靠后的文件为准. 只导入变化的文件时, 要保持同样的结果:
+    - 内容变化(或未导入过)的文件需要导入
+    - 变化文件之后的同平台文件需要重新应用: 变化文件新写入的日期可能落在它们的范围内
+    - 与上述文件台账日期范围重叠的其他文件也需要重新应用 (反复扩展直到不再增加)
+
+    具体哪些数据段重写由 bulk_import_platform_data 按 rewrite_ranges 决定, 这里只挑选需要解析的文件
+
+    Args:
+        files: [(文件路径, 平台名)], 按导入顺序 (靠后的文件优先)
+        file_hashes: {文件路径: 内容哈希}
+        ledger: fetch_import_ledger 的结果
+
+    Returns:
+        (需要导入的文件列表 (保持原顺序), rewrite_ranges)
+        rewrite_ranges: 变化文件旧数据段的日期范围 {(store_id, platform_id): [(date_from, date_to)]},
+                        这些日期上的数据可能已过时, 与之重叠的数据段即使未变化也要重写
+    """
+    def ledger_ranges(file_path):
+        return ledger.get(file_path.name, {}).get('ranges', {})
+
+    changed = {
+        file_path for file_path, _ in files
+        if ledger.get(file_path.name, {}).get('file_hash') != file_hashes[file_path]
+    }
+
+    rewrite_ranges = {}
+    for file_path in changed:
+        for key, (date_from, date_to) in ledger_ranges(file_path).items():
+            _add_range(rewrite_ranges, key, date_from, date_to)
+
+    selected = set(changed)
+    seen_platforms = set()
+    for file_path, platform_name in files:
+        if platform_name in seen_platforms:
+            selected.add(file_path)
+        if file_path in changed:
+            seen_platforms.add(platform_name)
+
+    # 按台账日期范围的重叠关系扩展到不动点
+    while True:
+        pending = {}
+        for file_path in selected:
+            for key, (date_from, date_to) in ledger_ranges(file_path).items():
+                _add_range(pending, key, date_from, date_to)
+        for key, ranges in rewrite_ranges.items():
+            pending.setdefault(key, []).extend(ranges)
+
+        added = {
+            file_path for file_path, _ in files
+            if file_path not in selected
+            and any(_overlaps(pending, key, *date_range) for key, date_range in ledger_ranges(file_path).items())
+        }
+        if not added:
+            break
+        selected |= added
+
+    return [task for task in files if task[0] in selected], rewrite_ranges
+
+
+def collect_segment_rows(frame, collected):
+    """
+    按(门店, 平台)累积每行的日期和行哈希, 全部数据(或流式导入的全部分块)处理完后由 finish_segments 汇总
+
+    collected: {(store_id, platform_id): ([日期数组], [行哈希数组])}, 原地追加
+    """
+    if frame.empty:
+        return collected
+    row_hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    dates = frame['report_date'].to_numpy()
+    for (store_id, platform_id), positions in frame.groupby(['store_id', 'platform_id'], sort=False).indices.items():
+        date_parts, hash_parts = collected.setdefault((int(store_id), int(platform_id)), ([], []))
+        date_parts.append(dates[positions])
+        hash_parts.append(row_hashes[positions])
+    return collected
+
+
+def finish_segments(collected):
+    """
+    汇总 collect_segment_rows 的结果, 返回 {(store_id, platform_id): (date_from, date_to, row_count, segment_hash)}
+
+    segment_hash 为按日期稳定排序后整段数据的内容哈希, 数据段未变化时哈希不变 (与是否分块读取无关)
+    """
+    segments = {}
+    for key, (date_parts, hash_parts) in collected.items():
+        dates = np.concatenate(date_parts)
+        order = np.argsort(dates, kind='stable')
+        row_hashes = np.concatenate(hash_parts)[order]
+        segments[key] = (
+            dates[order[0]],
+            dates[order[-1]],
+            len(dates),
+            hashlib.sha256(row_hashes.tobytes()).hexdigest(),
+        )
+    return segments
+
+
+def summarize_segments(frame):
+    """按(门店, 平台)切分解析后的数据, 返回格式同 finish_segments"""
+    return finish_segments(collect_segment_rows(frame, {}))
+
+
+def select_unchanged_segments(segments, ledger_entry, rewrite_ranges=None):
+    """
+    挑出可以跳过写入的数据段: 内容哈希与台账一致, 且不与 rewrite_ranges 重叠
+
+    需要写入的数据段日期范围追加到 rewrite_ranges (传入时), 使后面导入的重叠数据段重新应用
+    """
+    previous = ledger_entry['segments'] if ledger_entry else {}
+    unchanged = set()
+    for key, (date_from, date_to, _, segment_hash) in segments.items():
+        if previous.get(key) == segment_hash and not (
+                rewrite_ranges and _overlaps(rewrite_ranges, key, date_from, date_to)):
+            unchanged.add(key)
+
+    if rewrite_ranges is not None:
+        for key, (date_from, date_to, _, _) in segments.items():
+            if key not in unchanged:
+                _add_range(rewrite_ranges, key, date_from, date_to)
+    return unchanged
+
+
+def record_import_ledger(cursor, source_file, file_hash, segments):
+    """
+    在当前事务中重写某文件的台账记录 (与数据合并同一事务提交)
+
+    文件没有数据段 (门店均未映射、只有合计行等) 时只记一行文件哈希, 文件未变化时下次直接跳过
+    """
+    cursor.execute("DELETE FROM platform_import_ledger WHERE source_file = %s", (source_file,))
+    if not segments:
+        cursor.execute(
+            "INSERT INTO platform_import_ledger (source_file, file_hash) VALUES (%s, %s)",
+            (source_file, file_hash)
+        )
+    else:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO platform_import_ledger
+                (source_file, file_hash, store_id, platform_id, date_from, date_to, row_count, segment_hash)
+            VALUES %s
+            """,
+            [
+                (source_file, file_hash, store_id, platform_id, date_from, date_to, row_count, segment_hash)
+                for (store_id, platform_id), (date_from, date_to, row_count, segment_hash) in segments.items()
+            ]
+        )
+
+
+def bulk_import_platform_data(df, platform_id, conn, page_size=BULK_PAGE_SIZE,
+                              source_file=None, file_hash=None, ledger_entry=None, parsed=None,
+                              rewrite_ranges=None):
+    """
+    导入平台数据到数据库 (批量模式)
+
+    1. parse_platform_frame 列式解析整张表
+    2. 传入 source_file 时按台账过滤: 与上次导入内容相同的(门店, 平台)数据段不再写入,
+       变化的数据段只覆盖其自身的日期范围;
+       与 rewrite_ranges 重叠的数据段即使未变化也重新写入 (其日期上的数据可能已被其他文件覆盖),
+       本次写入的数据段范围会追加到 rewrite_ranges, 使后面导入的重叠文件重新应用
+    3. merge_platform_frame 写入并提交 (台账与数据同一事务)
+
+    parsed: 已由流水线转换阶段完成的 parse_platform_frame 结果, 为None时在此解析
+    """
+    frame, skipped = parsed if parsed is not None else parse_platform_frame(df, platform_id)
+
+    segments = {}
+    if source_file is not None:
+        segments = summarize_segments(frame)
+        previous = ledger_entry['segments'] if ledger_entry else {}
+        unchanged = select_unchanged_segments(segments, ledger_entry, rewrite_ranges)
+        if unchanged:
+            keep = ~pd.Series(list(zip(frame['store_id'], frame['platform_id'])), index=frame.index).isin(list(unchanged))
+            print(f"  未变化数据段: {len(unchanged)} 段 ({int((~keep).sum())} 行), 跳过写入")
+            frame = frame[keep]
+        for key in segments:
+            if key not in unchanged:
+                date_from, date_to, row_count, segment_hash = segments[key]
+                reason = '变化数据段' if previous.get(key) != segment_hash else '重叠数据段重新应用'
+                print(f"  {reason}: 门店{key[0]} 平台{key[1]} {date_from} ~ {date_to} ({row_count} 行)")
+
+    ledger_record = (source_file, file_hash, segments) if source_file is not None else None
+    imported, failed = merge_platform_frame(conn, frame, page_size=page_size, ledger_record=ledger_record)
+    return imported, skipped + failed
+
+
+def merge_platform_frame(conn, frame, page_size=BULK_PAGE_SIZE, ledger_record=None):
+    """
+    把 parse_platform_frame 的结果合并到 platform_daily_metrics 并提交
+
+    1. 多行VALUES分页写入会话临时表 tmp_platform_daily_metrics
+    2. 一条集合式 INSERT ... SELECT ... ON CONFLICT 合并到 platform_daily_metrics,
+       按 row_fingerprint 只重写指标值有变化的行, 并统计新增/更新/未变化行数
+    3. ledger_record=(source_file, file_hash, segments) 时台账与数据在同一事务中提交;
+       合并失败时回滚, 改为逐行UPSERT并逐行报告失败记录, 有失败行时不更新台账
+
+    返回 (导入行数, 失败行数)
+    """
+    cursor = conn.cursor()
+
+    if frame.empty:
+        if ledger_record is not None:
+            record_import_ledger(cursor, *ledger_record)
+            conn.commit()
+        cursor.close()
+        return 0, 0
+
+    columns = list(frame.columns)
+    rows = [
+        dict(zip(columns, values))
+        for values in frame.astype(object).where(frame.notna(), None).values.tolist()
+    ]
+    column_list = ', '.join(columns)
+    metric_list = ', '.join(col for col in columns if col not in KEY_COLUMNS)
+    update_clause = ', '.join([f"{col} = EXCLUDED.{col}" for col in columns if col not in KEY_COLUMNS])
+    failed = 0
+
+    try:
+        cursor.execute(f"""
+            CREATE TEMP TABLE tmp_platform_daily_metrics ON COMMIT DROP AS
+            SELECT {column_list} FROM platform_daily_metrics WITH NO DATA
+        """)
+        cursor.execute("ALTER TABLE tmp_platform_daily_metrics ADD COLUMN row_seq INT")
+
+        execute_values(
+            cursor,
+            f"INSERT INTO tmp_platform_daily_metrics ({column_list}, row_seq) VALUES %s",
+            [[data.get(col) for col in columns] + [seq] for seq, data in enumerate(rows)],
+            page_size=page_size
+        )
+
+        # 同一(日期, 门店, 平台)在文件中重复出现时, 与逐行模式一致取最后一行;
+        # 指纹由库内按目标列类型计算, 只有指纹变化的已有行才会被重写
+        cursor.execute(f"""
+            WITH src AS (
+                SELECT DISTINCT ON (report_date, store_id, platform_id)
+                    {column_list},
+                    md5(ROW({metric_list})::text) AS row_fingerprint
+                FROM tmp_platform_daily_metrics
+                ORDER BY report_date, store_id, platform_id, row_seq DESC
+            ),
+            merged AS (
+                INSERT INTO platform_daily_metrics ({column_list}, row_fingerprint)
+                SELECT {column_list}, row_fingerprint FROM src
+                ON CONFLICT (report_date, store_id, platform_id) DO UPDATE SET
+                    {update_clause},
+                    row_fingerprint = EXCLUDED.row_fingerprint,
+                    updated_at = NOW()
+                WHERE platform_daily_metrics.row_fingerprint IS DISTINCT FROM EXCLUDED.row_fingerprint
+                RETURNING (xmax = 0) AS is_insert
+            )
+            SELECT
+                (SELECT COUNT(*) FROM src),
+                COUNT(*) FILTER (WHERE is_insert),
+                COUNT(*) FILTER (WHERE NOT is_insert)
+            FROM merged
+        """)
+        distinct_rows, inserted, updated = cursor.fetchone()
+        unchanged = distinct_rows - inserted - updated
+        imported = inserted + updated
+        duplicated = len(rows) - distinct_rows
+        print(f"  新增: {inserted} 条, 更新: {updated} 条, 未变化: {unchanged} 条")
+
+        if ledger_record is not None:
+            record_import_ledger(cursor, *ledger_record)
+        conn.commit()
+
+        if duplicated > 0:
+            print(f"  文件内重复记录: {duplicated} 条 (已按最后一行合并)")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"  批量合并失败, 改为逐行导入: {e}")
+
+        imported, failed = _upsert_rows_one_by_one(cursor, rows)
+        # 有失败行时不更新台账, 下次运行会重新导入该文件
+        if ledger_record is not None and failed == 0:
+            record_import_ledger(cursor, *ledger_record)
+        conn.commit()
+
+    cursor.close()
+    return imported, failed
+
+
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='线上平台数据导入')
+    parser.add_argument('--mode', choices=['bulk', 'row'], default='bulk',
+                        help='写入模式: bulk=临时表+集合式UPSERT(默认), row=逐行UPSERT')
+    parser.add_argument('--page-size', type=int, default=BULK_PAGE_SIZE,
+                        help=f'批量模式每页VALUES行数 (默认{BULK_PAGE_SIZE})')
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1),
+                        help='并行解析Excel的进程数, 1=顺序解析 (默认min(8, CPU核数))')
+    parser.add_argument('--full-reload', action='store_true',
+                        help='忽略导入台账, 强制全量重新导入所有文件')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用Excel解析缓存, 直接解析xlsx')
+    parser.add_argument('--stream-chunk-size', type=int, default=None,
+                        help='流式读取Excel并逐块写库, 每块行数 (默认整表读取)')
+    parser.add_argument('--queue-size', type=int, default=2,
+                        help='流水线阶段间队列容量, 控制已解析未写库的文件数 (默认2)')
+    return parser.parse_args()
+
+
 def main():
     """主函数"""
+    args = parse_args()
+    if args.no_cache:
+        # 通过环境变量传递给解析子进程
+        os.environ['IMS_SHEET_CACHE'] = '0'
+
     print("=" * 60)
-    print("线上平台数据导入")
+    print(f"线上平台数据导入 (模式: {args.mode})")
     print("=" * 60)
 
     # 数据文件列表
@@ -308,32 +856,173 @@ def main():
     # 连接数据库
     conn = psycopg2.connect(**DB_CONFIG)
 
-    total_imported = 0
-    total_skipped = 0
-
+    # 增量导入: 未变化且不与变化文件日期范围重叠的文件直接跳过 (不解析)
+    ledger = {} if args.full_reload else fetch_import_ledger(conn)
+    file_hashes = {}
+    available = []
     for file_path, platform_name in files:
         if not file_path.exists():
             print(f"\n文件不存在: {file_path}")
             continue
+        file_hashes[file_path] = file_sha256(file_path)
+        available.append((file_path, platform_name))
 
-        platform_id = PLATFORM_MAP[platform_name]
+    existing, rewrite_ranges = plan_incremental_import(available, file_hashes, ledger)
+    for file_path, platform_name in available:
+        if (file_path, platform_name) not in existing:
+            print(f"\n文件未变化, 跳过: {file_path.name}")
 
-        # 读取Excel
-        df = read_platform_excel(str(file_path), platform_name)
+    total_imported = 0
+    total_skipped = 0
+    total_write_seconds = 0.0
+    file_stats = []
 
-        # 导入数据
-        imported, skipped = import_platform_data(df, platform_id, conn)
-        print(f"  导入: {imported} 条, 跳过: {skipped} 条")
+    def finish_file(file_path, rows, parse_seconds, imported, skipped, elapsed):
+        """累计单个文件的导入统计"""
+        nonlocal total_imported, total_skipped, total_write_seconds
+        rate = rows / elapsed if elapsed > 0 else 0
+        print(f"  导入: {imported} 条, 跳过: {skipped} 条, 耗时: {elapsed:.2f}s ({rate:.0f} 行/秒)")
 
         total_imported += imported
         total_skipped += skipped
+        total_write_seconds += elapsed
+        file_stats.append((file_path.name, rows, parse_seconds, elapsed))
+
+    def transform(task, loaded):
+        """转换阶段: 列式解析为目标表字段 (批量模式)"""
+        df, parse_seconds = loaded
+        parsed = parse_platform_frame(df, PLATFORM_MAP[task[1]]) if args.mode == 'bulk' else None
+        return df, parse_seconds, parsed
+
+    def write(task, transformed):
+        """写库阶段: 由流水线写库线程独占 conn 顺序执行"""
+        file_path, platform_name = task
+        df, parse_seconds, parsed = transformed
+        platform_id = PLATFORM_MAP[platform_name]
+        print(f"\n读取文件: {file_path}")
+        print(f"  读取到 {len(df)} 条记录, 解析耗时: {parse_seconds:.2f}s")
+
+        # 导入数据
+        started = time.perf_counter()
+        if args.mode == 'bulk':
+            imported, skipped = bulk_import_platform_data(
+                df, platform_id, conn, page_size=args.page_size,
+                source_file=file_path.name, file_hash=file_hashes[file_path],
+                ledger_entry=ledger.get(file_path.name), parsed=parsed,
+                rewrite_ranges=rewrite_ranges
+            )
+        else:
+            imported, skipped = import_platform_data(df, platform_id, conn)
+        finish_file(file_path, len(df), parse_seconds, imported, skipped, time.perf_counter() - started)
+        return imported
+
+    def stream_tasks():
+        """流式模式任务: 逐块产出 (文件路径, 平台名, 分块, 读取耗时), 每个文件最后产出分块为None的结束标记"""
+        for file_path, platform_name in existing:
+            chunks = iter_platform_chunks(str(file_path), args.stream_chunk_size)
+            while True:
+                started = time.perf_counter()
+                chunk = next(chunks, None)
+                yield file_path, platform_name, chunk, time.perf_counter() - started
+                if chunk is None:
+                    break
+
+    def stream_transform(task, chunk):
+        """流式转换阶段: 逐块列式解析 (批量模式)"""
+        if chunk is None or args.mode != 'bulk':
+            return chunk
+        return parse_platform_frame(chunk, PLATFORM_MAP[task[1]])
+
+    stream_state = {}
+
+    def stream_write(task, transformed):
+        """
+        流式写库阶段: 每个分块解析后立即合并写库并提交, 不在内存中拼接整个文件
+
+        分块无法预先判断所在数据段是否变化, 全部写入 (指纹未变化的行不会被重写);
+        文件结束时汇总各分块的数据段哈希写入台账, 有失败行时不更新台账
+        """
+        file_path, platform_name, chunk, read_seconds = task
+        state = stream_state.setdefault(file_path, {
+            'rows': 0, 'read': 0.0, 'write': 0.0, 'imported': 0, 'skipped': 0, 'failed': 0, 'segments': {}
+        })
+        state['read'] += read_seconds
+        started = time.perf_counter()
+
+        if chunk is None:
+            if args.mode == 'bulk':
+                segments = finish_segments(state['segments'])
+                for key, (date_from, date_to, row_count, _) in segments.items():
+                    print(f"  写入数据段: 门店{key[0]} 平台{key[1]} {date_from} ~ {date_to} ({row_count} 行)")
+                    _add_range(rewrite_ranges, key, date_from, date_to)
+                if state['failed'] == 0:
+                    cursor = conn.cursor()
+                    record_import_ledger(cursor, file_path.name, file_hashes[file_path], segments)
+                    conn.commit()
+                    cursor.close()
+            state['write'] += time.perf_counter() - started
+            print(f"  读取到 {state['rows']} 条记录, 读取解析耗时: {state['read']:.2f}s")
+            finish_file(file_path, state['rows'], state['read'], state['imported'],
+                        state['skipped'], state['write'])
+            del stream_state[file_path]
+            return 0
+
+        if state['rows'] == 0:
+            print(f"\n读取文件: {file_path} (流式, 每块 {args.stream_chunk_size} 行)")
+
+        if args.mode == 'bulk':
+            frame, skipped = transformed
+            imported, failed = merge_platform_frame(conn, frame, page_size=args.page_size)
+            collect_segment_rows(frame, state['segments'])
+            state['failed'] += failed
+            skipped += failed
+        else:
+            imported, skipped = import_platform_data(chunk, PLATFORM_MAP[platform_name], conn)
+
+        state['rows'] += len(chunk)
+        state['imported'] += imported
+        state['skipped'] += skipped
+        state['write'] += time.perf_counter() - started
+        return imported
+
+    if args.stream_chunk_size:
+        # 流式: 读取分块(当前进程) → 转换 → 写库 流水线, 任意时刻只有队列中的少量分块在内存中
+        print(f"\n流式流水线导入 {len(existing)} 个文件 (每块 {args.stream_chunk_size} 行)")
+        stage_stats, wall_seconds = run_pipeline(
+            stream_tasks(),
+            parse=lambda task: task[2],
+            transform=stream_transform,
+            write=stream_write,
+            workers=1,
+            queue_size=args.queue_size
+        )
+    else:
+        # 解析(进程池) → 转换 → 写库 流水线: 前一个文件写库时后续文件仍在解析/转换
+        print(f"\n流水线导入 {len(existing)} 个文件 (解析进程数: {args.workers})")
+        stage_stats, wall_seconds = run_pipeline(
+            existing,
+            parse=_timed_load,
+            transform=transform,
+            write=write,
+            workers=args.workers,
+            queue_size=args.queue_size
+        )
 
     conn.close()
 
+    total_rate = (total_imported + total_skipped) / total_write_seconds if total_write_seconds > 0 else 0
     print("\n" + "=" * 60)
+    print(f"{'文件':<20}{'行数':>8}{'解析(s)':>10}{'写入(s)':>10}")
+    for name, rows, parse_seconds, write_seconds in file_stats:
+        print(f"{name:<20}{rows:>8}{parse_seconds:>10.2f}{write_seconds:>10.2f}")
+    total_parse_seconds = sum(stat[2] for stat in file_stats)
+    print("-" * 60)
     print(f"导入完成! 总计导入: {total_imported} 条, 跳过: {total_skipped} 条")
+    print(f"解析耗时合计: {total_parse_seconds:.2f}s (进程数: {args.workers})")
+    print(f"写入耗时: {total_write_seconds:.2f}s, 吞吐: {total_rate:.0f} 行/秒 (模式: {args.mode})")
+    print("-" * 60)
+    print_pipeline_stats(stage_stats, wall_seconds)
     print("=" * 60)
 
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""脚本测试: 与脚本相同, 以 db/scripts 为导入根目录 (from utils.xxx import ...)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
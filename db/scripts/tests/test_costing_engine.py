@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""成本计算引擎测试"""
+
+import pandas as pd
+import pytest
+
+from utils.costing_engine import CostingEngine
+
+ITEM_COLUMNS = ['product_key', 'ingredient_key', 'quantity', 'yield_rate']
+
+
+def _products(*rows):
+    return pd.DataFrame([
+        {'product_key': key, 'product_name': key, 'product_type': product_type, 'unit_price': price}
+        for key, product_type, price in rows
+    ])
+
+
+def test_recipe_cost_with_yield_rate():
+    """明细成本 = 用量 × 单价 / 出成率, 再加未匹配明细的固定成本"""
+    products = _products(('FP-001', 'finished', None), ('RM:牛肉', 'raw_material', 0.02))
+    items = pd.DataFrame([['FP-001', 'RM:牛肉', 100, 0.8]], columns=ITEM_COLUMNS)
+
+    costs = CostingEngine(products, items, fixed_costs={'FP-001': 1.0}).cost_series()
+
+    assert costs['FP-001'] == pytest.approx(100 * 0.02 / 0.8 + 1.0)
+    assert costs['RM:牛肉'] == pytest.approx(0.02)
+
+
+def test_product_with_only_unmatched_ingredients_keeps_fixed_cost():
+    """明细全部未匹配(没有配料边)的产品, 成本为固定成本而不是0"""
+    products = _products(('FP-001', 'finished', None), ('FP-002', 'finished', None))
+    items = pd.DataFrame(columns=ITEM_COLUMNS)
+
+    costs = CostingEngine(products, items, fixed_costs={'FP-002': 7.25}).cost_series()
+
+    assert costs['FP-002'] == pytest.approx(7.25)
+    assert costs['FP-001'] == 0
+
+
+def test_fixed_cost_only_semi_finished_feeds_parent():
+    """只有固定成本的半成品按出品量折算后计入上级产品"""
+    products = pd.DataFrame([
+        {'product_key': 'FP-001', 'product_name': '成品', 'product_type': 'finished',
+         'unit_price': None, 'yield_quantity': None},
+        {'product_key': 'SF-001', 'product_name': '酱料', 'product_type': 'semi_finished',
+         'unit_price': None, 'yield_quantity': 10},
+    ])
+    items = pd.DataFrame([['FP-001', 'SF-001', 2, 1.0]], columns=ITEM_COLUMNS)
+
+    costs = CostingEngine(products, items, fixed_costs={'SF-001': 5.0}).cost_series()
+
+    assert costs['FP-001'] == pytest.approx(2 * 5.0 / 10)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""订单明细导入测试"""
+
+from decimal import Decimal
+
+import pandas as pd
+
+from etl_excel_to_order_system import ExcelToOrderSystem
+
+
+class _PageRecorder(ExcelToOrderSystem):
+    """不连接数据库: 产品主数据预先给定, BOM分解按 unit_costs 返回, 写库改为记录每批订单"""
+
+    def __init__(self, products, unit_costs):
+        self._product_lookup = dict(products)
+        self.lookup_stats = {'hit': 0, 'miss': 0}
+        self._unit_cost_cache = {}
+        self.unit_costs = unit_costs
+        self.pages = []
+
+    def _lookup_product(self, product_code):
+        if product_code not in self._product_lookup:
+            raise RuntimeError(f'查询产品 {product_code} 失败')
+        return super()._lookup_product(product_code)
+
+    def _unit_theoretical_cost(self, product_id, recipe_version):
+        key = (product_id, recipe_version)
+        if key not in self._unit_cost_cache:
+            cost = self.unit_costs[product_id]
+            if isinstance(cost, Exception):
+                raise cost
+            self._unit_cost_cache[key] = cost
+        return self._unit_cost_cache[key]
+
+    def _write_order_page(self, page):
+        self.pages.append(page)
+        items = sum(len(order_items) for _, _, order_items in page)
+        return len(page), items, 0, 0
+
+
+def _headers(order_codes):
+    return pd.DataFrame({'order_code': order_codes, 'store_id': 1})
+
+
+def _item_frame(rows):
+    return pd.DataFrame(rows, columns=['订单编号', '产品编码', '产品名称', '数量', '单价'])
+
+
+def test_order_resolution_errors_only_skip_their_orders():
+    """产品查找或BOM分解出错只跳过所在订单并计入失败数, 其余订单照常写入"""
+    importer = _PageRecorder(
+        products={'A': (1, 10, 'v1'), 'B': (2, 20, 'v1'), 'N': (3, None, None)},
+        unit_costs={1: Decimal('2.5'), 2: RuntimeError('explode_bom 出错')},
+    )
+    item_frame = _item_frame([
+        ['O1', 'A', '甲', 2, 10.0],
+        ['O2', 'B', '乙', 1, 20.0],
+        ['O2', 'A', '甲', 1, 10.0],
+        ['O3', 'X', '查不到', 1, 5.0],
+        ['O4', 'N', '无配方', 3, 8.0],
+        ['O5', 'B', '乙', 2, 20.0],
+    ])
+    totals = {'orders': 0, 'items': 0, 'existing': 0, 'failed': 0}
+
+    importer._write_order_frames(_headers(['O1', 'O2', 'O3', 'O4', 'O5']), item_frame, 10, totals)
+
+    assert totals == {'orders': 2, 'items': 2, 'existing': 0, 'failed': 3}
+    [page] = importer.pages
+    assert [order_code for order_code, _, _ in page] == ['O1', 'O4']
+    assert page[0][2][0][-1] == Decimal('5.0')
+    assert page[1][2][0][-1] is None
+
+
+def test_stream_chunks_keep_codes_when_chunk_has_blank_cell(tmp_path):
+    """分块中编码列有空单元格时, 订单编号/产品编码仍为 '1002' 而不是 '1002.0', 与整表读取一致"""
+    from openpyxl import Workbook
+
+    path = tmp_path / '订单明细.xlsx'
+    wb = Workbook()
+    ws = wb.active
+    ws.title = '订单明细'
+    ws.append(['订单编号', '产品编码', '产品名称', '数量', '单价'])
+    for row in [
+        [1001, 501, '甲', 1, 10.0],
+        [1001, 502, '乙', 2, 20.0],
+        [1002, None, '空编码', 1, 5.0],
+        [None, 503, '空订单号', 1, 5.0],
+        [1003, 503, '丙', 1, 30.0],
+        [1003, 501, '甲', 1, 10.0],
+    ]:
+        ws.append(row)
+    wb.save(path)
+
+    importer = ExcelToOrderSystem.__new__(ExcelToOrderSystem)
+    streamed = pd.concat(importer._iter_order_frames(str(path), '订单明细', chunk_size=2))
+    whole = pd.concat(importer._iter_order_frames(str(path), '订单明细', chunk_size=None))
+
+    assert streamed['订单编号'].fillna('').tolist() == ['1001', '1001', '1002', '', '1003', '1003']
+    assert streamed['产品编码'].fillna('').tolist() == ['501', '502', '', '503', '503', '501']
+    pd.testing.assert_frame_equal(streamed, whole)
+
+
+def test_lookup_stats_count_order_lines():
+    """产品查找统计按明细行计数: 同一编码的重复行计为命中, 而不是按不同编码计数"""
+    importer = _PageRecorder(products={'A': (1, None, None)}, unit_costs={})
+    item_frame = _item_frame([
+        ['O1', 'A', '甲', 1, 10.0],
+        ['O1', 'A', '甲', 1, 10.0],
+        ['O2', 'A', '甲', 1, 10.0],
+        ['O2', None, '无编码', 1, 10.0],
+    ])
+
+    importer._resolve_order_items(item_frame)
+
+    assert importer.lookup_stats == {'hit': 3, 'miss': 0}
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""平台数据导入测试"""
+
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from import_platform_data import (
+    build_metric_row,
+    parse_platform_frame,
+    plan_incremental_import,
+    select_unchanged_segments,
+    summarize_segments,
+)
+
+STORE_ID = 7
+PLATFORM_ID = 1
+
+
+def _frame(values):
+    """构造 parse_platform_frame 形式的解析结果: {日期: 指标值}"""
+    return pd.DataFrame({
+        'report_date': list(values),
+        'store_id': STORE_ID,
+        'platform_id': PLATFORM_ID,
+        'order_count': [float(value) for value in values.values()],
+    })
+
+
+def _run_import(files, contents, ledger, db):
+    """
+    按 main 的增量流程导入 (写库改为写入字典 db), 并更新台账 ledger
+
+    files: [(文件路径, 平台名)]; contents: {文件路径: 解析结果}
+    """
+    file_hashes = {path: str(contents[path].values.tolist()) for path, _ in files}
+    selected, rewrite_ranges = plan_incremental_import(files, file_hashes, ledger)
+
+    for path, _ in selected:
+        frame = contents[path]
+        segments = summarize_segments(frame)
+        unchanged = select_unchanged_segments(segments, ledger.get(path.name), rewrite_ranges)
+        for row in frame.itertuples(index=False):
+            if (row.store_id, row.platform_id) not in unchanged:
+                db[(row.report_date, row.store_id, row.platform_id)] = row.order_count
+        ledger[path.name] = {
+            'file_hash': file_hashes[path],
+            'segments': {key: summary[3] for key, summary in segments.items()},
+            'ranges': {key: (summary[0], summary[1]) for key, summary in segments.items()},
+        }
+    return selected
+
+
+FILES = [(Path('美团4-6月.xlsx'), '美团'), (Path('美团6-9月.xlsx'), '美团')]
+EARLY, LATE = FILES[0][0], FILES[1][0]
+
+
+def _imported_state():
+    contents = {
+        EARLY: _frame({date(2025, 4, 30): 1, date(2025, 6, 15): 1}),
+        LATE: _frame({date(2025, 6, 15): 2, date(2025, 8, 1): 2}),
+    }
+    ledger, db = {}, {}
+    _run_import(FILES, contents, ledger, db)
+    return contents, ledger, db
+
+
+def _full_reload(contents, db):
+    reloaded = dict(db)
+    _run_import(FILES, contents, {}, reloaded)
+    return reloaded
+
+
+def test_unchanged_files_are_skipped():
+    contents, ledger, db = _imported_state()
+    assert _run_import(FILES, contents, ledger, dict(db)) == []
+
+
+def test_earlier_file_change_reapplies_overlapping_later_file():
+    """只改动靠前的文件时, 重叠的6月数据仍以靠后的文件为准"""
+    contents, ledger, db = _imported_state()
+    contents[EARLY] = _frame({date(2025, 4, 30): 11, date(2025, 6, 15): 10})
+    expected = _full_reload(contents, db)
+
+    _run_import(FILES, contents, ledger, db)
+
+    assert db == expected
+    assert db[(date(2025, 6, 15), STORE_ID, PLATFORM_ID)] == 2
+
+
+def test_later_file_dropping_dates_restores_earlier_file():
+    """靠后的文件不再包含重叠日期时, 该日期恢复为靠前文件的数据"""
+    contents, ledger, db = _imported_state()
+    contents[LATE] = _frame({date(2025, 7, 1): 3, date(2025, 8, 1): 3})
+    expected = _full_reload(contents, db)
+
+    _run_import(FILES, contents, ledger, db)
+
+    assert db == expected
+    assert db[(date(2025, 6, 15), STORE_ID, PLATFORM_ID)] == 1
+
+
+def _write_platform_workbook(path, rows):
+    """写一个平台导出格式的工作簿: 表1, 第一行分组标题, 第二行表头"""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = '表1'
+    ws.append(['门店流量'])
+    ws.append(['日期', '美团门店ID', '成交订单数', '好评率'])
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+def test_stream_chunks_keep_store_ids_when_chunk_has_blank_id(tmp_path):
+    """分块中门店ID有空单元格时, 该块的有效行不会因ID变成 '561145812.0' 被过滤"""
+    from import_platform_data import iter_platform_chunks, load_platform_excel, parse_platform_frame
+
+    path = tmp_path / '美团.xlsx'
+    _write_platform_workbook(path, [
+        ['2025-06-01', 561145812, 10, '95%'],
+        ['2025-06-02', None, 11, '96%'],
+        ['2025-06-03', 561145812, 12, '97%'],
+        ['合计', '合计', 33, None],
+        ['2025-06-04', 813274765, 13, '98%'],
+    ])
+
+    chunks = list(iter_platform_chunks(str(path), chunk_size=2))
+    streamed = pd.concat([parse_platform_frame(chunk, PLATFORM_ID)[0] for chunk in chunks])
+    whole = parse_platform_frame(load_platform_excel(str(path)), PLATFORM_ID)[0]
+
+    assert streamed['report_date'].tolist() == [date(2025, 6, 1), date(2025, 6, 3), date(2025, 6, 4)]
+    assert streamed['store_id'].tolist() == [7, 7, 8]
+    pd.testing.assert_frame_equal(streamed, whole)
+
+
+def test_chunked_segment_hashes_match_whole_frame():
+    """流式逐块累积的数据段哈希与整表计算一致"""
+    from import_platform_data import collect_segment_rows, finish_segments
+
+    frame = pd.concat([
+        _frame({date(2025, 6, 2): 1, date(2025, 6, 1): 2}),
+        _frame({date(2025, 5, 31): 3}).assign(store_id=8),
+        _frame({date(2025, 6, 3): 4}),
+    ], ignore_index=True)
+
+    collected = {}
+    for start in range(0, len(frame), 2):
+        collect_segment_rows(frame.iloc[start:start + 2], collected)
+
+    assert finish_segments(collected) == summarize_segments(frame)
+
+
+@pytest.fixture
+def mixed_cells_frame():
+    """
+    平台表中各种单元格写法: 百分号、千分位、空白/NaN/None、无法解析的文本、已是数值的单元格
+
+    门店ID按 PLATFORM_DTYPE 读成文本; 比率列和数值列各有一列混合写法、一列纯数值
+    """
+    rates = ['95%', ' 12.5% ', '1,234%', '', None, float('nan'), 'abc', 0.97, 1, 'nan', '1e2%', '--']
+    numbers = ['1,234', ' 56 ', '12%', '', None, float('nan'), 'abc', 3.5, 7, 'nan', '1e3', '--']
+    size = len(rates)
+
+    return pd.DataFrame({
+        '日期': [f'2025-06-{day:02d}' for day in range(1, size + 1)],
+        '美团门店ID': ['561145812', '813274765'] * (size // 2),
+        '好评率': rates,
+        '新中差评回复率': [0.5, float('nan')] * (size // 2),
+        '成交订单数': numbers,
+        '成交金额(优惠后)': list(range(size)),
+    })
+
+
+def test_parse_platform_frame_matches_build_metric_row(mixed_cells_frame):
+    """列式解析与逐行 build_metric_row (parse_percentage/parse_number) 逐行一致"""
+    frame, skipped = parse_platform_frame(mixed_cells_frame, PLATFORM_ID)
+
+    assert skipped == 0
+    assert frame.index.tolist() == mixed_cells_frame.index.tolist()
+
+    for index, row in mixed_cells_frame.iterrows():
+        expected = build_metric_row(row, PLATFORM_ID)
+        assert list(frame.columns) == list(expected)
+
+        for column, value in expected.items():
+            actual = frame.at[index, column]
+            # 逐行解析用None表示空值, 列式解析用NaN
+            if value is None or pd.isna(value):
+                assert pd.isna(actual), (index, column, actual)
+            else:
+                assert actual == value, (index, column, actual, value)
+
+
+def test_file_without_store_rows_is_skipped_once_recorded(tmp_path):
+    """只有合计行的文件解析为空数据段; 台账记下文件哈希后, 文件未变化时下次不再读取"""
+    from import_platform_data import load_platform_excel
+
+    path = tmp_path / '美团合计.xlsx'
+    _write_platform_workbook(path, [['合计', '合计', 33, None]])
+
+    frame, skipped = parse_platform_frame(load_platform_excel(str(path)), PLATFORM_ID)
+    assert frame.empty and skipped == 0
+    assert summarize_segments(frame) == {}
+
+    files = [(path, '美团')]
+    ledger = {path.name: {'file_hash': 'h', 'segments': {}, 'ranges': {}}}
+    selected, _ = plan_incremental_import(files, {path: 'h'}, ledger)
+    assert selected == []
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+野百灵餐饮集团 - 向量化成本计算引擎
+功能：把全部配方载入为配料稀疏矩阵, 一次计算所有产品的标准成本, 并支持批量调价模拟
+
+成本公式 (与配方明细一致):
+  明细成本 = 用量 × 配料单位成本 / 出成率
+  原材料单位成本 = 单价
+  半成品单位成本 = 配方总成本 / 出品量
+
+配方明细按坐标形式(COO)存为平行数组 (上级产品, 配料, 用量, 出成率),
+节点按层级(原材料=0, 产品=配料最大层级+1)拓扑排序, 每层一次 np.add.at 汇总,
+多个调价场景作为价格矩阵的列同时计算
+
+用法:
+    engine = CostingEngine.from_database(conn)
+    costs = engine.compute()                       # 全部产品成本
+    engine.what_if({'肉类': 1.08})                  # 肉类原材料全部上涨8%
+    engine.what_if_many({'肉类+8%': {'肉类': 1.08}, '海鲜-5%': {'海鲜': 0.95}})
+"""
+
+import numpy as np
+import pandas as pd
+
+# 当前生效配方及明细 (同一产品有多个品牌配方时取通用配方, 其次最早的配方)
+# 用量按配料基础单位换算, 缺少换算规则时按原用量计算
+RECIPE_ITEMS_SQL = """
+    WITH current_recipe AS (
+        SELECT DISTINCT ON (product_id) recipe_id, product_id, yield_quantity
+        FROM recipe
+        WHERE is_current = TRUE AND status = 'approved'
+        ORDER BY product_id, brand_id NULLS FIRST, recipe_id
+    )
+    SELECT
+        r.product_id,
+        ri.ingredient_id,
+        ri.quantity * COALESCE(get_unit_conversion_factor(ri.unit_id, ing.base_unit_id, ing.product_id), 1),
+        COALESCE(NULLIF(ri.usage_yield_rate, 0), 1)
+    FROM current_recipe r
+    JOIN recipe_item ri ON ri.recipe_id = r.recipe_id
+    JOIN product ing ON ing.product_id = ri.ingredient_id
+"""
+
+PRODUCTS_SQL = """
+    SELECT
+        p.product_id,
+        p.product_code,
+        p.product_name,
+        p.product_type,
+        pc.category_name,
+        decrypt_cost(p.current_cost_encrypted),
+        r.yield_quantity
+    FROM product p
+    LEFT JOIN product_category pc ON pc.category_id = p.category_id
+    LEFT JOIN LATERAL (
+        SELECT yield_quantity
+        FROM recipe
+        WHERE product_id = p.product_id AND is_current = TRUE AND status = 'approved'
+        ORDER BY brand_id NULLS FIRST, recipe_id
+        LIMIT 1
+    ) r ON TRUE
+"""
+
+
+class CostingEngine:
+    """配料矩阵成本计算引擎"""
+
+    def __init__(self, products, items, fixed_costs=None):
+        """
+        Args:
+            products: DataFrame, 每个产品一行, 列:
+                      product_key (唯一键), product_name, product_type, category_name,
+                      unit_price (无配方产品的单位成本, 如原材料单价), yield_quantity (配方出品量, 空为1)
+            items: DataFrame, 每个配方明细一行, 列:
+                   product_key, ingredient_key, quantity, yield_rate
+            fixed_costs: 可选 {product_key: 金额}, 无法按单价计算的明细成本直接计入该产品
+        """
+        self.products = products.reset_index(drop=True)
+        self.keys = self.products['product_key'].tolist()
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+        items = items[items['product_key'].isin(self.index) & items['ingredient_key'].isin(self.index)]
+        self.parent = items['product_key'].map(self.index).to_numpy(dtype=np.int64)
+        self.child = items['ingredient_key'].map(self.index).to_numpy(dtype=np.int64)
+        self.quantity = items['quantity'].to_numpy(dtype=float)
+        self.yield_rate = items['yield_rate'].fillna(1.0).replace(0, 1.0).to_numpy(dtype=float)
+
+        n = len(self.keys)
+        self.is_composite = np.zeros(n, dtype=bool)
+        self.is_composite[self.parent] = True
+        self.unit_price = self.products['unit_price'].fillna(0).to_numpy(dtype=float)
+        self.output_yield = (
+            self.products['yield_quantity'].fillna(1.0).replace(0, 1.0).to_numpy(dtype=float)
+            if 'yield_quantity' in self.products.columns else np.ones(n)
+        )
+        self.fixed_cost = np.zeros(n)
+        for key, amount in (fixed_costs or {}).items():
+            if key in self.index:
+                self.fixed_cost[self.index[key]] += amount
+        # 明细全部无法按单价计算的产品没有配料边, 仍按固定成本计算
+        self.is_composite |= self.fixed_cost != 0
+
+        self.level = self._topological_levels()
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_database(cls, conn):
+        """从数据库载入当前配方和原材料成本 (需要 app.encryption_key 及解密权限)"""
+        cursor = conn.cursor()
+        cursor.execute(PRODUCTS_SQL)
+        products = pd.DataFrame(cursor.fetchall(), columns=[
+            'product_key', 'product_code', 'product_name', 'product_type',
+            'category_name', 'unit_price', 'yield_quantity'
+        ])
+        cursor.execute(RECIPE_ITEMS_SQL)
+        items = pd.DataFrame(cursor.fetchall(), columns=[
+            'product_key', 'ingredient_key', 'quantity', 'yield_rate'
+        ])
+        cursor.close()
+
+        for col in ('unit_price', 'yield_quantity'):
+            products[col] = pd.to_numeric(products[col], errors='coerce')
+        for col in ('quantity', 'yield_rate'):
+            items[col] = pd.to_numeric(items[col], errors='coerce')
+        return cls(products, items)
+
+    def _topological_levels(self):
+        """各节点层级: 原材料为0, 产品为其配料最大层级+1; 配方存在循环引用时报错"""
+        n = len(self.keys)
+        level = np.zeros(n, dtype=np.int64)
+        for _ in range(n + 1):
+            updated = level.copy()
+            np.maximum.at(updated, self.parent, level[self.child] + 1)
+            if np.array_equal(updated, level):
+                return level
+            level = updated
+        raise ValueError("配方存在循环引用, 无法按层级计算成本")
+
+    # ------------------------------------------------------------------
+    # 计算
+    # ------------------------------------------------------------------
+    def compute(self, prices=None):
+        """
+        计算全部产品成本
+
+        Args:
+            prices: 原材料单价, 形状 (产品数,) 或 (产品数, 场景数); 为None时使用载入的单价
+
+        Returns:
+            配方总成本数组, 形状与prices相同; 原材料行为其单价
+        """
+        prices = self.unit_price if prices is None else np.asarray(prices, dtype=float)
+        extra_dims = prices.shape[1:]
+
+        fixed = self.fixed_cost.reshape((-1,) + (1,) * len(extra_dims))
+        composite = self.is_composite.reshape(fixed.shape)
+        output_yield = self.output_yield.reshape(fixed.shape)
+        total = np.where(composite, fixed, prices).astype(float)
+        unit_cost = np.where(composite, total / output_yield, total)
+
+        per_unit = (self.quantity / self.yield_rate).reshape((-1,) + (1,) * len(extra_dims))
+        edge_level = self.level[self.parent]
+
+        for level in range(1, int(self.level.max(initial=0)) + 1):
+            mask = edge_level == level
+            np.add.at(total, self.parent[mask], per_unit[mask] * unit_cost[self.child[mask]])
+            nodes = np.flatnonzero(self.level == level)
+            unit_cost[nodes] = total[nodes] / output_yield[nodes]
+
+        return total
+
+    def cost_series(self, prices=None):
+        """compute 的结果按 product_key 索引为Series"""
+        return pd.Series(self.compute(prices), index=self.keys)
+
+    def scenario_prices(self, adjustments):
+        """
+        按调价规则生成单价
+
+        Args:
+            adjustments: {品类名或产品名或product_key: 单价倍数}, 如 {'肉类': 1.08}
+                         同一原材料匹配多条规则时倍数相乘
+        """
+        factor = np.ones(len(self.keys))
+        categories = self.products['category_name'] if 'category_name' in self.products.columns else None
+        names = self.products['product_name']
+        for target, multiplier in adjustments.items():
+            matched = (names == target).to_numpy() | np.array([key == target for key in self.keys])
+            if categories is not None:
+                matched |= (categories == target).to_numpy()
+            if not matched.any():
+                raise KeyError(f"调价规则未匹配任何产品或品类: {target}")
+            factor[matched] *= multiplier
+        return self.unit_price * factor
+
+    def what_if_many(self, scenarios):
+        """
+        多个调价场景一次计算
+
+        Args:
+            scenarios: {场景名: 调价规则}, 调价规则同 scenario_prices
+
+        Returns:
+            DataFrame, 每个非原材料产品一行: 基准成本及各场景成本
+        """
+        names = list(scenarios)
+        price_matrix = np.column_stack(
+            [self.unit_price] + [self.scenario_prices(scenarios[name]) for name in names]
+        )
+        costs = self.compute(price_matrix)
+
+        result = pd.DataFrame(costs, index=self.keys, columns=['基准成本'] + names)
+        result.insert(0, 'product_name', self.products['product_name'].to_numpy())
+        return result[self.is_composite]
+
+    def what_if(self, adjustments):
+        """单个调价场景: 返回每个非原材料产品的基准成本、模拟成本、变化额和变化率"""
+        result = self.what_if_many({'模拟成本': adjustments})
+        result['变化额'] = result['模拟成本'] - result['基准成本']
+        result['变化率%'] = (result['变化额'] / result['基准成本'].replace(0, np.nan) * 100).round(2)
+        return result
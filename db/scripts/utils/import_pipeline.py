@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+野百灵餐饮集团 - 导入流水线
+功能：解析 → 转换 → 写库 三段流水线, 多文件导入时CPU解析与数据库写入重叠执行
+
+- 解析: 进程池并行执行 parse(task), 按任务原顺序交给下一段
+- 转换: 独立线程执行 transform(task, parsed)
+- 写库: 独立线程执行 write(task, transformed), 返回写入行数;
+        所有写库操作都在这一个线程中顺序执行, 调用方的数据库连接只被该线程使用
+- 各段之间为有界队列, 下游变慢时上游阻塞等待 (背压), 进程池同时在途的任务数也有上限
+- 任一段出错时停止整个流水线, 并在 run_pipeline 中重新抛出该异常
+
+parse 在子进程中执行, 必须是模块级函数 (可配合 functools.partial 传参)
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+_STOP = object()
+
+
+class StageStats:
+    """单个阶段的统计"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0          # 处理的任务数
+        self.rows = 0           # 处理的行数
+        self.busy_seconds = 0.0  # 实际处理耗时 (解析阶段为各子进程耗时之和)
+        self.wait_seconds = 0.0  # 等待上游/被下游阻塞的耗时
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.busy_seconds if self.busy_seconds > 0 else 0
+
+
+def _row_count(value):
+    """估算阶段输出行数: DataFrame/列表取长度, (数据, ...) 元组取第一个元素的长度"""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+
+def _timed_call(func, task):
+    """子进程中执行解析并计时"""
+    started = time.perf_counter()
+    result = func(task)
+    return result, time.perf_counter() - started
+
+
+def run_pipeline(tasks, parse, write, transform=None, workers=2, queue_size=2):
+    """
+    运行导入流水线
+
+    Args:
+        tasks: 任务列表 (如文件路径), 按此顺序写库
+        parse: 解析函数 parse(task) → parsed, 在子进程中执行
+        write: 写库函数 write(task, transformed) → 写入行数
+        transform: 转换函数 transform(task, parsed) → transformed, 为None时原样传递
+        workers: 解析进程数, <=1 时在当前进程中顺序解析 (仍与写库线程重叠)
+        queue_size: 阶段间队列容量
+
+    Returns:
+        (各阶段统计列表, 总墙钟耗时秒)
+    """
+    stats = {name: StageStats(name) for name in ('解析', '转换', '写库')}
+    parsed_queue = queue.Queue(maxsize=queue_size)
+    ready_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    errors = []
+
+    def put(target, item, stage):
+        started = time.perf_counter()
+        while not stop_event.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stage.wait_seconds += time.perf_counter() - started
+
+    def get(source, stage):
+        started = time.perf_counter()
+        while not stop_event.is_set():
+            try:
+                item = source.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        else:
+            item = _STOP
+        stage.wait_seconds += time.perf_counter() - started
+        return item
+
+    def fail(error):
+        errors.append(error)
+        stop_event.set()
+
+    def transform_worker():
+        stage = stats['转换']
+        try:
+            while True:
+                item = get(parsed_queue, stage)
+                if item is _STOP:
+                    break
+                task, parsed = item
+                started = time.perf_counter()
+                result = transform(task, parsed) if transform else parsed
+                stage.busy_seconds += time.perf_counter() - started
+                stage.items += 1
+                stage.rows += _row_count(result)
+                put(ready_queue, (task, result), stage)
+            put(ready_queue, _STOP, stage)
+        except BaseException as e:
+            fail(e)
+
+    def write_worker():
+        stage = stats['写库']
+        try:
+            while True:
+                item = get(ready_queue, stage)
+                if item is _STOP:
+                    break
+                task, result = item
+                started = time.perf_counter()
+                rows = write(task, result)
+                stage.busy_seconds += time.perf_counter() - started
+                stage.items += 1
+                stage.rows += rows or 0
+        except BaseException as e:
+            fail(e)
+
+    threads = [
+        threading.Thread(target=transform_worker, name='pipeline-transform', daemon=True),
+        threading.Thread(target=write_worker, name='pipeline-write', daemon=True),
+    ]
+    wall_started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    parse_stage = stats['解析']
+    try:
+        if workers <= 1:
+            for task in tasks:
+                if stop_event.is_set():
+                    break
+                parsed, seconds = _timed_call(parse, task)
+                parse_stage.busy_seconds += seconds
+                parse_stage.items += 1
+                parse_stage.rows += _row_count(parsed)
+                put(parsed_queue, (task, parsed), parse_stage)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                task_iter = iter(tasks)
+                in_flight = deque()
+
+                def submit_more():
+                    # 在途任务数上限: 进程数 + 队列容量
+                    while len(in_flight) < workers + queue_size:
+                        task = next(task_iter, _STOP)
+                        if task is _STOP:
+                            return
+                        in_flight.append((task, executor.submit(_timed_call, parse, task)))
+
+                submit_more()
+                while in_flight and not stop_event.is_set():
+                    task, future = in_flight.popleft()
+                    parsed, seconds = future.result()
+                    parse_stage.busy_seconds += seconds
+                    parse_stage.items += 1
+                    parse_stage.rows += _row_count(parsed)
+                    put(parsed_queue, (task, parsed), parse_stage)
+                    submit_more()
+
+                for _, future in in_flight:
+                    future.cancel()
+        put(parsed_queue, _STOP, parse_stage)
+    except BaseException as e:
+        fail(e)
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return list(stats.values()), time.perf_counter() - wall_started
+
+
+def print_pipeline_stats(stage_stats, wall_seconds):
+    """打印各阶段吞吐统计"""
+    print(f"{'阶段':<8}{'任务数':>8}{'行数':>10}{'处理(s)':>10}{'等待(s)':>10}{'行/秒':>10}")
+    for stage in stage_stats:
+        print(f"{stage.name:<8}{stage.items:>8}{stage.rows:>10}{stage.busy_seconds:>10.2f}"
+              f"{stage.wait_seconds:>10.2f}{stage.rows_per_second:>10.0f}")
+    print(f"流水线总墙钟耗时: {wall_seconds:.2f}s")
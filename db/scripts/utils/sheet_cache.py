@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+野百灵餐饮集团 - Excel工作表解析缓存
+功能：把解析后的工作表以Parquet列式格式缓存到本地磁盘，重复运行时直接加载
+
+缓存键: 文件路径 + 工作表名 + mtime + 文件内容SHA-256
+- 路径索引 paths/<路径摘要>.json 记录 mtime/大小/内容哈希, mtime和大小未变时不再重算哈希
+- 工作表数据 <内容哈希>.<工作表摘要>.parquet, 内容相同的文件(复制/改名)共用缓存
+- 工作表数据按长表存储 (行, 列, 类型, 各类型取值), 保留原始单元格类型
+
+淘汰策略: 缓存文件超过 IMS_SHEET_CACHE_MAX_DAYS 天未使用即删除,
+总大小超过 IMS_SHEET_CACHE_MAX_MB 时按最近使用时间从旧到新删除
+
+环境变量:
+- IMS_SHEET_CACHE=0             关闭缓存
+- IMS_SHEET_CACHE_DIR           缓存目录 (默认 ~/.cache/ims_sheet_cache)
+- IMS_SHEET_CACHE_MAX_MB        缓存总大小上限 (默认 2048)
+- IMS_SHEET_CACHE_MAX_DAYS      未使用天数上限 (默认 30)
+
+依赖 pyarrow; 未安装时自动退回直接解析Excel
+"""
+
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from pandas.io.parsers import TextParser
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# 单元格类型编码
+KIND_STR = 1
+KIND_INT = 2
+KIND_FLOAT = 3
+KIND_BOOL = 4
+KIND_DATETIME = 5
+KIND_DATE = 6
+KIND_TIME = 7
+KIND_TIMEDELTA = 8
+KIND_ERROR = 9
+
+_warned_no_pyarrow = False
+
+
+def cache_enabled():
+    """缓存是否可用 (未被环境变量关闭且已安装pyarrow)"""
+    global _warned_no_pyarrow
+    if os.environ.get('IMS_SHEET_CACHE', '1') == '0':
+        return False
+    if pa is None:
+        if not _warned_no_pyarrow:
+            print("⚠️ 未安装pyarrow, Excel解析缓存已关闭")
+            _warned_no_pyarrow = True
+        return False
+    return True
+
+
+def cache_dir():
+    """缓存目录"""
+    default = Path.home() / '.cache' / 'ims_sheet_cache'
+    return Path(os.environ.get('IMS_SHEET_CACHE_DIR', default))
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path, write):
+    """先写临时文件再rename, 多进程并发写同一缓存文件时不会读到半个文件"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _touch(path):
+    """刷新最近使用时间 (淘汰按mtime排序)"""
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def file_content_hash(file_path):
+    """
+    获取文件内容SHA-256, mtime和大小未变时直接使用路径索引中记录的哈希
+
+    Returns:
+        内容哈希 (十六进制字符串)
+    """
+    file_path = Path(file_path).resolve()
+    stat = file_path.stat()
+    index_path = cache_dir() / 'paths' / f"{_digest(str(file_path))}.json"
+
+    if index_path.exists():
+        try:
+            entry = json.loads(index_path.read_text(encoding='utf-8'))
+            if entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                _touch(index_path)
+                return entry['content_hash']
+        except (ValueError, KeyError):
+            pass
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    entry = {
+        'path': str(file_path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'content_hash': content_hash,
+    }
+    _write_atomic(index_path, lambda p: p.write_text(json.dumps(entry, ensure_ascii=False), encoding='utf-8'))
+    return content_hash
+
+
+def _classify(value, data_type):
+    """单元格值 → (类型编码, 整数, 浮点, 文本, 时间戳)"""
+    if data_type == 'e':
+        return KIND_ERROR, None, None, str(value), None
+    if isinstance(value, bool):
+        return KIND_BOOL, int(value), None, None, None
+    if isinstance(value, int):
+        return KIND_INT, value, None, None, None
+    if isinstance(value, float):
+        return KIND_FLOAT, None, value, None, None
+    if isinstance(value, datetime):
+        return KIND_DATETIME, None, None, None, value
+    if isinstance(value, date):
+        return KIND_DATE, None, None, value.isoformat(), None
+    if isinstance(value, dt_time):
+        return KIND_TIME, None, None, value.isoformat(), None
+    if isinstance(value, timedelta):
+        return KIND_TIMEDELTA, None, value.total_seconds(), None, None
+    return KIND_STR, None, None, str(value), None
+
+
+def parse_sheet_table(ws):
+    """
+    逐单元格读取openpyxl只读工作表, 生成长表 (只保存非空单元格)
+
+    行列号从0开始, (0, 0) 对应 A1
+    """
+    ws.reset_dimensions()
+    rows, cols, kinds, ints, floats, texts, stamps = [], [], [], [], [], [], []
+
+    for row_idx, row in enumerate(ws.rows):
+        for col_idx, cell in enumerate(row):
+            value = cell.value
+            if value is None:
+                continue
+            kind, i, f, s, t = _classify(value, getattr(cell, 'data_type', None))
+            rows.append(row_idx)
+            cols.append(col_idx)
+            kinds.append(kind)
+            ints.append(i)
+            floats.append(f)
+            texts.append(s)
+            stamps.append(t)
+
+    return pa.table({
+        'row': pa.array(rows, type=pa.int32()),
+        'col': pa.array(cols, type=pa.int32()),
+        'kind': pa.array(kinds, type=pa.int8()),
+        'i': pa.array(ints, type=pa.int64()),
+        'f': pa.array(floats, type=pa.float64()),
+        's': pa.array(texts, type=pa.string()),
+        't': pa.array(stamps, type=pa.timestamp('us')),
+    })
+
+
+def assemble_grid(table, for_pandas=False):
+    """
+    长表还原为二维单元格列表
+
+    for_pandas=False: 与openpyxl data_only取值一致, 空单元格为None
+    for_pandas=True:  与pandas读取openpyxl的转换一致 (空为'', 整数值浮点转int,
+                      错误值为NaN, 去掉行尾空单元格和末尾空行后补齐列宽)
+    """
+    if table.num_rows == 0:
+        return []
+
+    row = table.column('row').to_numpy()
+    col = table.column('col').to_numpy()
+    kind = table.column('kind').to_numpy()
+    values = np.empty(len(kind), dtype=object)
+
+    def fill(mask, column, convert=None):
+        if not mask.any():
+            return
+        picked = table.column(column).filter(pa.array(mask)).to_pylist()
+        if convert is not None:
+            picked = [convert(v) for v in picked]
+        values[np.flatnonzero(mask)] = picked
+
+    fill(kind == KIND_STR, 's')
+    fill(kind == KIND_INT, 'i')
+    fill(kind == KIND_BOOL, 'i', bool)
+    fill(kind == KIND_DATETIME, 't')
+    fill(kind == KIND_DATE, 's', date.fromisoformat)
+    fill(kind == KIND_TIME, 's', dt_time.fromisoformat)
+    fill(kind == KIND_TIMEDELTA, 'f', lambda v: timedelta(seconds=v))
+    if for_pandas:
+        fill(kind == KIND_FLOAT, 'f', lambda v: int(v) if np.isfinite(v) and v == int(v) else v)
+        fill(kind == KIND_ERROR, 's', lambda v: np.nan)
+        empty = ''
+    else:
+        fill(kind == KIND_FLOAT, 'f')
+        fill(kind == KIND_ERROR, 's')
+        empty = None
+
+    grid = np.full((int(row.max()) + 1, int(col.max()) + 1), empty, dtype=object)
+    grid[row, col] = values
+    return grid.tolist()
+
+
+class SheetCache:
+    """Excel工作表解析缓存"""
+
+    def __init__(self, directory=None, max_bytes=None, max_age_days=None):
+        self.directory = Path(directory) if directory else cache_dir()
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(os.environ.get('IMS_SHEET_CACHE_MAX_MB', 2048)) * 1024 * 1024
+        self.max_age_days = max_age_days if max_age_days is not None else \
+            float(os.environ.get('IMS_SHEET_CACHE_MAX_DAYS', 30))
+
+    def _manifest_path(self, content_hash):
+        return self.directory / f"{content_hash}.manifest.json"
+
+    def _sheet_path(self, content_hash, sheet_name):
+        return self.directory / f"{content_hash}.{_digest(sheet_name)}.parquet"
+
+    def sheetnames(self, content_hash):
+        """缓存中记录的工作表名列表, 未缓存时返回None"""
+        manifest_path = self._manifest_path(content_hash)
+        if not manifest_path.exists():
+            return None
+        _touch(manifest_path)
+        return json.loads(manifest_path.read_text(encoding='utf-8'))['sheetnames']
+
+    def save_sheetnames(self, content_hash, file_path, sheetnames):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        manifest = {'source': str(file_path), 'sheetnames': list(sheetnames)}
+        _write_atomic(
+            self._manifest_path(content_hash),
+            lambda p: p.write_text(json.dumps(manifest, ensure_ascii=False), encoding='utf-8')
+        )
+
+    def load(self, content_hash, sheet_name):
+        """读取缓存的工作表长表, 未命中返回None"""
+        sheet_path = self._sheet_path(content_hash, sheet_name)
+        if not sheet_path.exists():
+            return None
+        try:
+            table = pq.read_table(sheet_path)
+        except (OSError, pa.ArrowInvalid):
+            return None
+        _touch(sheet_path)
+        return table
+
+    def save(self, content_hash, sheet_name, table):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self._sheet_path(content_hash, sheet_name), lambda p: pq.write_table(table, p))
+        self.evict()
+
+    def evict(self):
+        """按未使用天数和总大小淘汰缓存文件"""
+        if not self.directory.exists():
+            return
+
+        now = time.time()
+        max_age_seconds = self.max_age_days * 86400
+        entries = []
+        for path in list(self.directory.glob('*.parquet')) + list(self.directory.glob('*.json')) + \
+                list(self.directory.glob('paths/*.json')):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > max_age_seconds:
+                path.unlink(missing_ok=True)
+            elif path.suffix == '.parquet':
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def get_table(self, file_path, sheet_name, book=None):
+        """
+        获取工作表长表: 命中缓存直接返回, 否则解析Excel并写入缓存
+
+        Args:
+            file_path: Excel文件路径
+            sheet_name: 工作表名
+            book: 已打开的openpyxl只读工作簿 (可选, 同一文件多个工作表未命中时复用)
+        """
+        content_hash = file_content_hash(file_path)
+        table = self.load(content_hash, sheet_name)
+        if table is not None:
+            return table
+
+        own_book = book is None
+        if own_book:
+            book = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            if self.sheetnames(content_hash) is None:
+                self.save_sheetnames(content_hash, file_path, book.sheetnames)
+            table = parse_sheet_table(book[sheet_name])
+        finally:
+            if own_book:
+                book.close()
+
+        self.save(content_hash, sheet_name, table)
+        return table
+
+
+def read_excel_cached(file_path, sheet_name, header=0, skiprows=None, nrows=None, usecols=None, dtype=None):
+    """
+    带缓存的 pd.read_excel (openpyxl引擎), 支持常用参数
+
+    缓存不可用时直接调用 pd.read_excel
+    """
+    if not cache_enabled():
+        return pd.read_excel(file_path, sheet_name=sheet_name, header=header, skiprows=skiprows,
+                             nrows=nrows, usecols=usecols, dtype=dtype)
+
+    cache = SheetCache()
+    if isinstance(sheet_name, int):
+        sheetnames = cache.sheetnames(file_content_hash(file_path))
+        if sheetnames is None:
+            book = load_workbook(file_path, read_only=True, data_only=True)
+            sheetnames = book.sheetnames
+            book.close()
+        sheet_name = sheetnames[sheet_name]
+
+    data = assemble_grid(cache.get_table(file_path, sheet_name), for_pandas=True)
+    if not data:
+        return pd.DataFrame()
+
+    parser = TextParser(data, header=header, skiprows=skiprows, nrows=nrows, usecols=usecols,
+                        dtype=dtype, skip_blank_lines=False)
+    return parser.read(nrows=nrows)
+
+
+class _Cell:
+    """只读单元格 (兼容 ws.cell(row, column).value 写法)"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class SheetGrid:
+    """只读工作表 (兼容openpyxl的 max_row / max_column / cell / iter_rows)"""
+
+    def __init__(self, title, rows):
+        self.title = title
+        self._rows = rows
+        self.max_row = len(rows)
+        self.max_column = len(rows[0]) if rows else 0
+
+    def cell(self, row, column):
+        """按1起始的行列号取单元格"""
+        if 1 <= row <= self.max_row and 1 <= column <= self.max_column:
+            return _Cell(self._rows[row - 1][column - 1])
+        return _Cell(None)
+
+    def iter_rows(self, min_row=1, max_row=None, values_only=False):
+        max_row = self.max_row if max_row is None else min(max_row, self.max_row)
+        for row in self._rows[min_row - 1:max_row]:
+            yield tuple(row) if values_only else tuple(_Cell(v) for v in row)
+
+
+class CachedWorkbook:
+    """
+    带缓存的只读工作簿 (兼容openpyxl的 sheetnames / wb[name] / close)
+
+    未命中的工作表在首次访问时解析, 同一工作簿只打开一次
+    """
+
+    def __init__(self, file_path, cache=None):
+        self.file_path = file_path
+        self.cache = cache or SheetCache()
+        self.content_hash = file_content_hash(file_path)
+        self._book = None
+        self._sheets = {}
+
+        self.sheetnames = self.cache.sheetnames(self.content_hash)
+        if self.sheetnames is None:
+            self.sheetnames = self._open().sheetnames
+            self.cache.save_sheetnames(self.content_hash, file_path, self.sheetnames)
+
+    def _open(self):
+        if self._book is None:
+            self._book = load_workbook(self.file_path, read_only=True, data_only=True)
+        return self._book
+
+    def __getitem__(self, sheet_name):
+        if sheet_name not in self.sheetnames:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        if sheet_name not in self._sheets:
+            table = self.cache.load(self.content_hash, sheet_name)
+            if table is None:
+                table = self.cache.get_table(self.file_path, sheet_name, book=self._open())
+            self._sheets[sheet_name] = SheetGrid(sheet_name, assemble_grid(table))
+        return self._sheets[sheet_name]
+
+    def close(self):
+        if self._book is not None:
+            self._book.close()
+            self._book = None
+
+
+def load_workbook_cached(file_path):
+    """带缓存的 load_workbook(data_only=True), 缓存不可用时返回openpyxl工作簿"""
+    if not cache_enabled():
+        return load_workbook(file_path, data_only=True)
+    return CachedWorkbook(file_path)
+
+
+if __name__ == '__main__':
+    import sys
+
+    # 校验: 缓存读取结果与 pd.read_excel / openpyxl 一致
+    for path in sys.argv[1:]:
+        for name in load_workbook(path, read_only=True).sheetnames:
+            expected = pd.read_excel(path, sheet_name=name)
+            for _ in range(2):  # 第一次写缓存, 第二次读缓存
+                actual = read_excel_cached(path, sheet_name=name)
+            pd.testing.assert_frame_equal(actual, expected)
+
+            ws_expected = load_workbook(path, data_only=True)[name]
+            ws_actual = load_workbook_cached(path)[name]
+            mismatched = [
+                (r, c) for r in range(1, ws_expected.max_row + 1)
+                for c in range(1, ws_expected.max_column + 1)
+                if ws_expected.cell(row=r, column=c).value != ws_actual.cell(row=r, column=c).value
+            ]
+            status = '一致' if not mismatched else f'不一致单元格 {mismatched[:5]}'
+            print(f"{path} [{name}]: {len(expected)} 行, {status}")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+野百灵餐饮集团 - Excel流式分块读取
+功能：基于openpyxl只读模式逐行读取大型Excel, 按固定行数产出DataFrame分块
+
+与 pd.read_excel 一次性载入整个工作簿不同, 任意时刻内存中只保留一个分块,
+峰值内存与文件大小无关 (共享字符串表除外, 由openpyxl整体加载)
+
+取值规则与 pd.read_excel 一致: 空单元格为NaN, 整数值的浮点数转int, 错误值为NaN,
+每个分块的列类型由pandas按该分块数据推断, 需要跨分块类型一致时传入dtype
+"""
+
+import numpy as np
+from openpyxl import load_workbook
+from pandas.io.parsers import TextParser
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def _pandas_cell_value(cell):
+    """单元格 → pandas读取openpyxl时的取值"""
+    value = cell.value
+    if value is None:
+        return ''
+    data_type = getattr(cell, 'data_type', None)
+    if data_type == 'e':
+        return np.nan
+    if data_type == 'n' and isinstance(value, float) and np.isfinite(value) and value == int(value):
+        return int(value)
+    return value
+
+
+def _trim(row):
+    """去掉行尾空单元格"""
+    values = [_pandas_cell_value(cell) for cell in row]
+    while values and values[-1] == '':
+        values.pop()
+    return values
+
+
+def iter_excel_chunks(file_path, sheet_name, chunk_size=DEFAULT_CHUNK_SIZE, skiprows=0, dtype=None):
+    """
+    逐块读取Excel工作表
+
+    Args:
+        file_path: Excel文件路径
+        sheet_name: 工作表名
+        chunk_size: 每块行数
+        skiprows: 表头之前跳过的行数 (同 pd.read_excel 的整数skiprows)
+        dtype: 列类型 (同 pd.read_excel), 保证各分块类型一致
+
+    Yields:
+        DataFrame分块, 行索引与 pd.read_excel 读取整张表时一致 (从0连续编号)
+        表头之后超出表头列数的单元格会被忽略
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name]
+        ws.reset_dimensions()
+        rows = ws.rows
+
+        for _ in range(skiprows):
+            next(rows, None)
+
+        header = _trim(next(rows, ()))
+        if not header:
+            return
+        width = len(header)
+
+        columns = None
+        buffer = []
+        pending_empty = 0  # 暂存连续空行, 后面还有数据时才计入 (与pandas去掉末尾空行一致)
+        offset = 0
+
+        def build(chunk_rows, start):
+            nonlocal columns
+            if columns is None:
+                parser = TextParser([header] + chunk_rows, header=0, dtype=dtype, skip_blank_lines=False)
+                frame = parser.read()
+                columns = list(frame.columns)
+            else:
+                parser = TextParser(chunk_rows, header=None, names=columns, dtype=dtype, skip_blank_lines=False)
+                frame = parser.read()
+            frame.index = range(start, start + len(frame))
+            return frame
+
+        for row in rows:
+            values = _trim(row)
+            if not values:
+                pending_empty += 1
+                continue
+
+            for _ in range(pending_empty):
+                buffer.append([''] * width)
+                if len(buffer) == chunk_size:
+                    yield build(buffer, offset)
+                    offset += len(buffer)
+                    buffer = []
+            pending_empty = 0
+
+            buffer.append((values + [''] * width)[:width])
+            if len(buffer) == chunk_size:
+                yield build(buffer, offset)
+                offset += len(buffer)
+                buffer = []
+
+        if buffer or columns is None:
+            yield build(buffer, offset)
+    finally:
+        wb.close()